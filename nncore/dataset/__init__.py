@@ -2,6 +2,12 @@
 
 from .base import Dataset
 from .builder import DATASETS, build_dataset
-from .wrapper import RepeatDataset
+from .sampler import BucketBatchSampler
+from .shard import ShardDataset, ShardWriter, StreamingShardDataset
+from .wrapper import CacheDataset, RepeatDataset
 
-__all__ = ['Dataset', 'DATASETS', 'build_dataset', 'RepeatDataset']
+__all__ = [
+    'Dataset', 'DATASETS', 'build_dataset', 'BucketBatchSampler',
+    'ShardDataset', 'ShardWriter', 'StreamingShardDataset', 'CacheDataset',
+    'RepeatDataset'
+]
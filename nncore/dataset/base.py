@@ -8,6 +8,22 @@ class Dataset(_Dataset):
     A :obj:`torch.utils.data.Dataset` class that supports state configurations.
     The `set_state` method is expected to be called by :obj:`Engine` to trigger
     state transformations.
+
+    Besides ``evaluate(blob, **kwargs)``, datasets may optionally implement
+    an incremental evaluation protocol, which allows :obj:`Engine` to stream
+    the predictions to the main process in chunks instead of gathering them
+    all at once:
+
+        - ``evaluate_incremental(chunk)``: Consume a chunk (list) of outputs.
+          Chunks from different ranks are interleaved, so the results should
+          not depend on the order of outputs.
+        - ``finalize(**kwargs)``: Compute and return the metrics from all the
+          consumed chunks, and reset the internal states. The keyword
+          arguments are the same as ``evaluate``.
+
+    Datasets with variable-length samples may also implement
+    ``get_length(idx)``, which returns the length of a sample without loading
+    it, so that they can be sampled by :obj:`BucketBatchSampler`.
     """
 
     def set_state(self, state):
@@ -0,0 +1,159 @@
+# Copyright (c) Ye Liu. Licensed under the MIT License.
+
+import torch
+from torch.utils.data import Sampler
+
+import nncore
+
+
+@nncore.bind_getter('batch_size', 'max_tokens', 'pool_size', 'shuffle',
+                    'drop_last', 'num_replicas', 'rank', 'seed', 'epoch')
+class BucketBatchSampler(Sampler):
+    """
+    A batch sampler that groups samples with similar lengths into the same
+    batches, so that less padding is needed when collating variable-shaped
+    :obj:`DataContainer` samples. The dataset is expected to implement
+    ``get_length(idx)``, which returns the length (e.g. the number of tokens
+    or frames) of a sample without loading it.
+
+    In each epoch, the shuffled indices are split into pools of
+    ``pool_size`` samples. The samples in each pool are sorted by lengths and
+    greedily packed into batches, which are shuffled again afterwards. Like
+    :obj:`DistributedSampler`, all the replicas generate the same batches
+    from ``seed`` and the epoch set by ``set_epoch``, and each replica takes
+    a disjoint subset of them.
+
+    Args:
+        dataset (:obj:`Dataset`): The dataset to sample from.
+        batch_size (int | None, optional): Maximum number of samples in each
+            batch. Default: ``None``.
+        max_tokens (int | None, optional): Maximum number of tokens in each
+            batch after padding, i.e. the batch size times the maximum length
+            in the batch. Samples longer than this value are put into
+            separate batches. At least one of ``batch_size`` and
+            ``max_tokens`` should be specified. Default: ``None``.
+        pool_size (int, optional): Number of samples to be sorted together.
+            Larger pools lead to less padding but less randomness. ``-1``
+            means sorting the whole dataset. Default: ``-1``.
+        shuffle (bool, optional): Whether to shuffle the samples and batches.
+            Default: ``True``.
+        drop_last (bool, optional): Whether to drop the tail batches that can
+            not be evenly distributed among the replicas. If ``False``, the
+            batches will be padded by repeating the first ones. Default:
+            ``False``.
+        num_replicas (int, optional): Number of replicas. Default: ``1``.
+        rank (int, optional): Rank of the current replica. Default: ``0``.
+        seed (int, optional): The random seed used to shuffle the samples.
+            Default: ``0``.
+    """
+
+    def __init__(self,
+                 dataset,
+                 batch_size=None,
+                 max_tokens=None,
+                 pool_size=-1,
+                 shuffle=True,
+                 drop_last=False,
+                 num_replicas=1,
+                 rank=0,
+                 seed=0):
+        assert batch_size is not None or max_tokens is not None
+        assert pool_size != 0 and 0 <= rank < num_replicas
+
+        self._dataset = dataset
+        self._batch_size = batch_size
+        self._max_tokens = max_tokens
+        self._pool_size = pool_size
+        self._shuffle = shuffle
+        self._drop_last = drop_last
+        self._num_replicas = num_replicas
+        self._rank = rank
+        self._seed = seed
+        self._epoch = 0
+
+        self._lengths = None
+        self._batches = None
+
+    def __iter__(self):
+        return iter(self._get_batches())
+
+    def __len__(self):
+        return len(self._get_batches())
+
+    def _get_lengths(self):
+        if self._lengths is None or len(self._lengths) != len(self._dataset):
+            self._lengths = [
+                self._dataset.get_length(i) for i in range(len(self._dataset))
+            ]
+            self._batches = None
+        return self._lengths
+
+    def _is_full(self, batch, max_len):
+        if self._batch_size is not None and len(batch) >= self._batch_size:
+            return True
+        if self._max_tokens is not None:
+            return (len(batch) + 1) * max_len > self._max_tokens
+        return False
+
+    def _build_batches(self, lengths, generator):
+        num_samples = len(lengths)
+
+        if self._shuffle:
+            indices = torch.randperm(num_samples, generator=generator).tolist()
+        else:
+            indices = list(range(num_samples))
+
+        pool_size = self._pool_size
+        if pool_size < 0:
+            pool_size = max(num_samples, 1)
+
+        batches = []
+        for i in range(0, num_samples, pool_size):
+            pool = sorted(indices[i:i + pool_size], key=lengths.__getitem__)
+            batch, max_len = [], 0
+            for idx in pool:
+                if batch and self._is_full(batch, max(max_len, lengths[idx])):
+                    batches.append(batch)
+                    batch, max_len = [], 0
+                batch.append(idx)
+                max_len = max(max_len, lengths[idx])
+            if batch:
+                batches.append(batch)
+
+        if self._shuffle:
+            order = torch.randperm(len(batches), generator=generator).tolist()
+            batches = [batches[i] for i in order]
+
+        return batches
+
+    def _get_batches(self):
+        lengths = self._get_lengths()
+        if self._batches is not None and self._batches[0] == self._epoch:
+            return self._batches[1]
+
+        generator = torch.Generator()
+        generator.manual_seed(self._seed + self._epoch)
+        batches = self._build_batches(lengths, generator)
+
+        if self._drop_last:
+            num_batches = len(batches) // self._num_replicas
+        else:
+            num_batches = -(-len(batches) // self._num_replicas)
+            total_size = num_batches * self._num_replicas
+            while len(batches) < total_size:
+                batches += batches[:total_size - len(batches)]
+
+        batches = batches[self._rank::self._num_replicas][:num_batches]
+        self._batches = (self._epoch, batches)
+
+        return batches
+
+    def set_epoch(self, epoch):
+        """
+        Set the epoch for this sampler. This ensures all replicas use a
+        different random ordering for each epoch.
+
+        Args:
+            epoch (int): The epoch number.
+        """
+        self._epoch = epoch
@@ -0,0 +1,293 @@
+# Copyright (c) Ye Liu. Licensed under the MIT License.
+
+import mmap
+import multiprocessing as mp
+import random
+from glob import glob
+
+import numpy as np
+import torch
+import torch.distributed as dist
+from torch.utils.data import IterableDataset
+
+import nncore
+from nncore.parallel import (align_size, deserialize_from_tensor,
+                             serialize_to_tensor)
+from .base import Dataset
+from .builder import DATASETS
+
+_SHARD_EXT = '.bin'
+_INDEX_EXT = '.idx'
+
+
+def _list_shards(path, prefix):
+    pattern = nncore.join(path, '{}-*{}'.format(prefix, _INDEX_EXT))
+    return [p[:-len(_INDEX_EXT)] for p in sorted(glob(pattern))]
+
+
+@nncore.bind_getter('path', 'prefix', 'max_bytes', 'num_shards', 'num_samples')
+class ShardWriter(object):
+    """
+    A writer that packs samples into large append-only shard files. Each
+    sample is serialized into a record, where tensors and numeric NumPy arrays
+    are stored as raw bytes and the other objects are pickled. A new shard is
+    started when the current one exceeds ``max_bytes``. The offsets of the
+    records are saved to an index file when the shard is finished, so that
+    unfinished shards will not be loaded. Shards existing in the directory
+    are kept, and the new ones are numbered after them.
+
+    Example:
+        >>> with ShardWriter('data/shards') as writer:
+        ...     for sample in samples:
+        ...         writer.write(sample)
+
+    Args:
+        path (str): Path to the directory of shards.
+        prefix (str, optional): The prefix of shard names. Default:
+            ``'shard'``.
+        max_bytes (int, optional): Maximum number of bytes in each shard.
+            Default: ``1024 ** 3``.
+    """
+
+    def __init__(self, path, prefix='shard', max_bytes=1024**3):
+        nncore.mkdir(path)
+
+        self._path = path
+        self._prefix = prefix
+        self._max_bytes = max_bytes
+        self._num_shards = len(_list_shards(path, prefix))
+        self._num_samples = 0
+
+        self._file = None
+        self._name = None
+        self._offsets = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _open(self):
+        name = '{}-{:05d}'.format(self._prefix, self._num_shards)
+        self._name = nncore.join(self._path, name)
+        self._file = open(self._name + _SHARD_EXT, 'wb')
+        self._offsets = [0]
+
+    def _flush(self):
+        self._file.close()
+        with open(self._name + _INDEX_EXT, 'wb') as f:
+            np.save(f, np.array(self._offsets, dtype=np.int64))
+
+        self._file = None
+        self._num_shards += 1
+
+    def write(self, sample):
+        """
+        Write a sample to the current shard.
+
+        Args:
+            sample (any): The sample to be written.
+        """
+        data_tensor, _ = serialize_to_tensor(sample, 'cpu')
+        size = data_tensor.numel()
+
+        if self._file is not None and self._offsets[-1] > 0 and (
+                self._offsets[-1] + size > self._max_bytes):
+            self._flush()
+
+        if self._file is None:
+            self._open()
+
+        self._file.write(data_tensor.numpy())
+        self._file.write(bytes(align_size(size) - size))
+        self._offsets.append(self._offsets[-1] + align_size(size))
+        self._num_samples += 1
+
+    def close(self):
+        """
+        Finish the current shard and write its index.
+        """
+        if self._file is not None:
+            self._flush()
+
+
+@nncore.bind_getter('path', 'prefix', 'num_shards')
+class _ShardReader(object):
+
+    def __init__(self, path, prefix='shard'):
+        self._path = path
+        self._prefix = prefix
+
+        self._shards = _list_shards(path, prefix)
+        self._num_shards = len(self._shards)
+
+        self._offsets = [np.load(s + _INDEX_EXT) for s in self._shards]
+        self._bounds = np.cumsum([0] + [len(o) - 1 for o in self._offsets])
+
+        self._buffers = dict()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_buffers'] = dict()
+        return state
+
+    def _read(self, shard, idx):
+        if shard not in self._buffers:
+            with open(self._shards[shard] + _SHARD_EXT, 'rb') as f:
+                self._buffers[shard] = mmap.mmap(
+                    f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        start, end = self._offsets[shard][idx:idx + 2].tolist()
+        data_tensor = torch.frombuffer(
+            self._buffers[shard],
+            dtype=torch.uint8,
+            count=end - start,
+            offset=start)
+
+        # Copy the data out so that the returned tensors can be modified
+        return deserialize_from_tensor(data_tensor.clone(), end - start)
+
+    def shard_size(self, shard):
+        """
+        Get the number of samples in a shard.
+
+        Args:
+            shard (int): Index of the shard.
+
+        Returns:
+            int: The number of samples.
+        """
+        return len(self._offsets[shard]) - 1
+
+
+@DATASETS.register()
+class ShardDataset(_ShardReader, Dataset):
+    """
+    A dataset reading samples from the shards written by
+    :obj:`ShardWriter`. The shards are memory-mapped lazily in each process,
+    and a sample is located from the offset index in constant time, so that
+    no metadata operations on the file system are needed in ``__getitem__``.
+
+    Args:
+        path (str): Path to the directory of shards.
+        prefix (str, optional): The prefix of shard names. Default:
+            ``'shard'``.
+    """
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('index {} out of range'.format(idx))
+
+        shard = int(np.searchsorted(self._bounds, idx, side='right')) - 1
+        return self._read(shard, idx - int(self._bounds[shard]))
+
+    def __len__(self):
+        return int(self._bounds[-1])
+
+
+@DATASETS.register()
+@nncore.bind_getter('shuffle', 'seed', 'num_replicas', 'rank')
+class StreamingShardDataset(_ShardReader, Dataset, IterableDataset):
+    """
+    An iterable version of :obj:`ShardDataset` that streams the samples
+    shard by shard. In each epoch, the shards (and the samples in each shard)
+    are put in a global order shared by all the replicas, which is split
+    into contiguous and equally sized parts for the ranks, and further for
+    the data loader workers of each rank. Each process thus mostly reads its
+    own shards, and all the ranks get the same number of samples, where the
+    last parts are padded by repeating the first samples.
+
+    The number of batches yielded by a data loader depends on how the
+    samples are split among its workers, so that this dataset has no length.
+    The stages of :obj:`Engine` should be iteration-based when using it.
+    ``set_epoch`` should be called every epoch (e.g. by
+    :obj:`SamplerSeedHook`) to reshuffle the samples. The epoch is kept in
+    shared memory, so that it also takes effect in persistent workers.
+
+    Args:
+        path (str): Path to the directory of shards.
+        prefix (str, optional): The prefix of shard names. Default:
+            ``'shard'``.
+        shuffle (bool, optional): Whether to shuffle the shards and the
+            samples in each shard every epoch. Default: ``False``.
+        seed (int, optional): The random seed used to shuffle the shards.
+            Default: ``0``.
+        num_replicas (int | None, optional): Number of replicas. If not
+            specified, the world size of the default process group will be
+            used. Default: ``None``.
+        rank (int | None, optional): Rank of the current replica. If not
+            specified, the rank in the default process group will be used.
+            Default: ``None``.
+    """
+
+    def __init__(self,
+                 path,
+                 prefix='shard',
+                 shuffle=False,
+                 seed=0,
+                 num_replicas=None,
+                 rank=None):
+        super(StreamingShardDataset, self).__init__(path, prefix=prefix)
+
+        if dist.is_available() and dist.is_initialized():
+            num_replicas = num_replicas or dist.get_world_size()
+            rank = dist.get_rank() if rank is None else rank
+
+        self._shuffle = shuffle
+        self._seed = seed
+        self._num_replicas = num_replicas or 1
+        self._rank = rank or 0
+        # Shared with the data loader workers, so that persistent workers also
+        # see the epochs set in the main process
+        self._epoch = mp.Value('i', 0, lock=False)
+
+    @property
+    def epoch(self):
+        return self._epoch.value
+
+    def __iter__(self):
+        epoch = self._epoch.value
+
+        shards = list(range(self._num_shards))
+        if self._shuffle:
+            random.Random(self._seed + epoch).shuffle(shards)
+
+        bounds = np.cumsum([0] + [self.shard_size(s) for s in shards])
+        total = int(bounds[-1])
+        if total == 0:
+            return
+
+        num_samples = -(-total // self._num_replicas)
+        start = self._rank * num_samples
+        end = start + num_samples
+
+        worker_info = torch.utils.data.get_worker_info()
+        if worker_info is not None:
+            wid, num_workers = worker_info.id, worker_info.num_workers
+            start, end = (start + num_samples * wid // num_workers,
+                          start + num_samples * (wid + 1) // num_workers)
+
+        cur = order = None
+        for pos in range(start, end):
+            pos %= total
+            i = int(np.searchsorted(bounds, pos, side='right')) - 1
+            if i != cur:
+                cur, shard = i, shards[i]
+                order = list(range(self.shard_size(shard)))
+                if self._shuffle:
+                    random.Random(self._seed + epoch * self._num_shards +
+                                  shard).shuffle(order)
+            yield self._read(shard, order[pos - int(bounds[i])])
+
+    def set_epoch(self, epoch):
+        """
+        Set the epoch for this dataset. This ensures all replicas use a
+        different random ordering for each epoch.
+
+        Args:
+            epoch (int): The epoch number.
+        """
+        self._epoch.value = epoch
@@ -1,8 +1,18 @@
 # Copyright (c) Ye Liu. Licensed under the MIT License.
 
+import mmap
+import os
+import tempfile
+import weakref
+from multiprocessing import Lock
+
+import numpy as np
+import torch
 from torch.utils.data import Dataset
 
 import nncore
+from nncore.parallel import (align_size, deserialize_from_tensor,
+                             serialize_to_tensor)
 from .builder import DATASETS, build_dataset
 
 
@@ -33,6 +43,11 @@ class RepeatDataset(Dataset):
         self._dataset = dataset
         self._times = times
 
+    def __getattr__(self, name):
+        if name in ('evaluate_incremental', 'finalize'):
+            return getattr(self._dataset, name)
+        raise AttributeError(name)
+
     def __getitem__(self, idx):
         return self.dataset[idx % len(self._dataset)]
 
@@ -44,3 +59,142 @@ class RepeatDataset(Dataset):
     @property
     def dataset(self):
         return self._dataset
+
+
+def _remove_file(path, pid):
+    if os.getpid() == pid and os.path.exists(path):
+        os.remove(path)
+
+
+@DATASETS.register()
+@nncore.bind_getter('max_bytes')
+@nncore.bind_method('_dataset', ['set_state', 'evaluate'])
+class CacheDataset(Dataset):
+    """
+    A dataset wrapper that caches samples in memory shared among the data
+    loader workers and epochs.
+
+    The samples are serialized into an arena backed by a memory-mapped file,
+    where tensors and numeric NumPy arrays are stored as raw bytes. All the
+    processes (e.g. data loader workers) holding copies of this dataset map
+    the same file, so that each sample is only loaded once and stored once.
+    Samples are cached until the arena is full. As samples are normally
+    visited in a cyclic order across epochs, keeping the cached ones rather
+    than evicting them in an LRU manner leads to a higher hit rate.
+
+    The samples are cached as is, so that random transformations should be
+    applied after this wrapper.
+
+    Args:
+        dataset (:obj:`Dataset` | cfg | str): The dataset or config of dataset
+            to be cached.
+        max_bytes (int, optional): Maximum number of bytes to be cached.
+            Default: ``4 * 1024 ** 3``.
+        cache_dir (str | None, optional): Directory of the file backing the
+            cache. The file will be removed when this dataset is released by
+            the process creating it. Using a memory-backed file system
+            (e.g. ``/dev/shm``) avoids writing the samples back to disks. If
+            not specified, the default temporary directory will be used.
+            Default: ``None``.
+    """
+
+    def __init__(self, dataset, max_bytes=4 * 1024**3, cache_dir=None):
+        if not isinstance(dataset, Dataset):
+            dataset = build_dataset(dataset)
+
+        if hasattr(dataset, 'CLASSES'):
+            self.CLASSES = dataset.CLASSES
+
+        self._dataset = dataset
+        self._max_bytes = max_bytes
+        self._num_samples = len(dataset)
+
+        # The 16-byte header stores the number of used bytes, followed by the
+        # offsets and sizes of all the samples
+        self._data_offset = (self._num_samples + 1) * 16
+
+        if cache_dir is not None:
+            nncore.mkdir(cache_dir)
+
+        fd, self._path = tempfile.mkstemp(prefix='nncore_', dir=cache_dir)
+        try:
+            os.ftruncate(fd, self._data_offset + max_bytes)
+        finally:
+            os.close(fd)
+
+        self._lock = Lock()
+        self._finalizer = weakref.finalize(self, _remove_file, self._path,
+                                           os.getpid())
+        self._buffer = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_buffer=None, _finalizer=None)
+        state.pop('_used', None)
+        state.pop('_table', None)
+        return state
+
+    def __getattr__(self, name):
+        if name in ('evaluate_incremental', 'finalize', 'get_length'):
+            return getattr(self._dataset, name)
+        raise AttributeError(name)
+
+    def __getitem__(self, idx):
+        self._open()
+
+        size = int(self._table[idx, 1])
+        if size > 0:
+            return self._load(int(self._table[idx, 0]), size)
+
+        sample = self._dataset[idx]
+        self._save(idx, sample)
+        return sample
+
+    def __len__(self):
+        return self._num_samples
+
+    @property
+    def dataset(self):
+        return self._dataset
+
+    def _open(self):
+        if self._buffer is not None:
+            return
+
+        with open(self._path, 'r+b') as f:
+            self._buffer = mmap.mmap(f.fileno(), 0)
+
+        header = np.frombuffer(
+            self._buffer, dtype=np.int64, count=(self._num_samples + 1) * 2)
+        self._used = header[:1]
+        self._table = header[2:].reshape(self._num_samples, 2)
+
+    def _load(self, offset, size):
+        data_tensor = torch.frombuffer(
+            self._buffer,
+            dtype=torch.uint8,
+            count=size,
+            offset=self._data_offset + offset)
+
+        # Copy the data out so that the returned tensors can be modified
+        return deserialize_from_tensor(data_tensor.clone(), size)
+
+    def _save(self, idx, sample):
+        data_tensor, _ = serialize_to_tensor(sample, 'cpu')
+        size = data_tensor.numel()
+
+        # The slot is reserved with a negative size inside the lock, so that
+        # other workers treat it as a miss without caching the sample again
+        with self._lock:
+            offset = int(self._used[0])
+            if self._table[idx, 1] != 0 or offset + size > self._max_bytes:
+                return
+            self._used[0] = align_size(offset + size)
+            self._table[idx, 0] = offset
+            self._table[idx, 1] = -1
+
+        start = self._data_offset + offset
+        self._buffer[start:start + size] = data_tensor.numpy()
+
+        # The size is written after the data as a flag of completion
+        self._table[idx, 1] = size
@@ -1,26 +1,32 @@
 # Copyright (c) Ye Liu. Licensed under the MIT License.
 
 from .buffer import Buffer
-from .builder import HOOKS, build_dataloader, build_hook
+from .builder import HOOKS, build_dataloader, build_hook, skip_batches
 from .comm import (all_gather, broadcast, gather, get_dist_info, get_launcher,
                    get_rank, get_world_size, init_dist, is_distributed,
                    is_elastic, is_main_process, is_slurm, main_only, sync)
 from .engine import Engine
 from .hooks import (CheckpointHook, ClosureHook, CommandLineWriter,
                     EmptyCacheHook, EvalHook, EventWriterHook, Hook,
-                    JSONWriter, LrUpdaterHook, OptimizerHook, PreciseBNHook,
+                    JSONWriter, LrUpdaterHook, MemoryMonitorHook,
+                    OptimizerHook, PreciseBNHook, ProfilerHook,
                     SamplerSeedHook, TensorboardWriter, TimerHook, WandbWriter)
+from .pipeline import LogPipeline
+from .saver import CheckpointSaver
+from .store import PredictionStore
 from .utils import (generate_random_seed, get_checkpoint, load_checkpoint,
                     move_to_device, save_checkpoint, set_random_seed)
 
 __all__ = [
-    'Buffer', 'HOOKS', 'build_dataloader', 'build_hook', 'all_gather',
-    'broadcast', 'gather', 'get_dist_info', 'get_launcher', 'get_rank',
-    'get_world_size', 'init_dist', 'is_distributed', 'is_elastic',
+    'Buffer', 'HOOKS', 'build_dataloader', 'build_hook', 'skip_batches',
+    'all_gather', 'broadcast', 'gather', 'get_dist_info', 'get_launcher',
+    'get_rank', 'get_world_size', 'init_dist', 'is_distributed', 'is_elastic',
     'is_main_process', 'is_slurm', 'main_only', 'sync', 'Engine',
     'CheckpointHook', 'ClosureHook', 'CommandLineWriter', 'EmptyCacheHook',
     'EvalHook', 'EventWriterHook', 'Hook', 'JSONWriter', 'LrUpdaterHook',
-    'OptimizerHook', 'PreciseBNHook', 'SamplerSeedHook', 'TensorboardWriter',
-    'TimerHook', 'WandbWriter', 'generate_random_seed', 'get_checkpoint',
-    'load_checkpoint', 'move_to_device', 'save_checkpoint', 'set_random_seed'
+    'MemoryMonitorHook', 'OptimizerHook', 'PreciseBNHook', 'ProfilerHook',
+    'SamplerSeedHook', 'TensorboardWriter', 'TimerHook', 'WandbWriter',
+    'LogPipeline', 'CheckpointSaver', 'PredictionStore',
+    'generate_random_seed', 'get_checkpoint', 'load_checkpoint',
+    'move_to_device', 'save_checkpoint', 'set_random_seed'
 ]
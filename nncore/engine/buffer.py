@@ -1,31 +1,264 @@
 # Copyright (c) Ye Liu. Licensed under the MIT License.
 
 from collections import OrderedDict
+from functools import wraps
+from numbers import Number
 
+import numpy as np
 import torch
 
 import nncore
+from .pipeline import to_host
 
+_MAX_PENDING = 1024
 
-@nncore.bind_getter('max_size')
-@nncore.bind_method('_data', ['get', 'pop', 'keys', 'values', 'items'])
+
+def _is_scalar(value):
+    if isinstance(value, (Number, np.number)):
+        return not isinstance(value, complex)
+    elif isinstance(value, np.ndarray):
+        return value.size == 1
+    elif torch.is_tensor(value):
+        return value.numel() == 1
+    return False
+
+
+def _is_scalars(value):
+    if isinstance(value, dict):
+        return len(value) > 0 and all(_is_scalar(v) for v in value.values())
+    return _is_scalar(value)
+
+
+def _is_integral(value):
+    if isinstance(value, (bool, np.bool_)):
+        return False
+    elif isinstance(value, (int, np.integer)):
+        return True
+    elif torch.is_tensor(value):
+        return not value.is_floating_point() and value.dtype != torch.bool
+    elif isinstance(value, np.ndarray):
+        return np.issubdtype(value.dtype, np.integer)
+    return False
+
+
+def _is_metric(key):
+    # Internal (e.g. _out) and payload (e.g. images_) keys keep the original
+    # objects, as they are consumed as they are rather than smoothed
+    return not key.startswith('_') and not key.endswith('_')
+
+
+def _is_on_device(value):
+    if isinstance(value, dict):
+        return len(value) > 0 and all(_is_on_device(v) for v in value.values())
+    return torch.is_tensor(value) and value.device.type != 'cpu' and (
+        value.numel() == 1)
+
+
+def _to_float(value):
+    return float(value.item() if hasattr(value, 'item') else value)
+
+
+def _lower_median(values):
+    return np.sort(values, axis=0)[(len(values) - 1) // 2]
+
+
+def _materialized(func):
+
+    @wraps(func)
+    def _wrapper(self, *args, **kwargs):
+        self._materialize()
+        return func(self, *args, **kwargs)
+
+    return _wrapper
+
+
+class _Series(object):
+    """
+    A series of scalars or dicts of scalars stored in a preallocated ring
+    array. Running sums are maintained along with the values so that sums and
+    means over windows can be computed in O(1). Each column is formatted as
+    integers only if all the values appended to it are integral.
+    """
+
+    def __init__(self, value, max_size):
+        if isinstance(value, dict):
+            self.columns = list(value.keys())
+            shape = (len(self.columns), )
+        else:
+            self.columns = None
+            shape = ()
+
+        self.integral = np.ones(shape, dtype=bool)
+        self.max_size = max_size
+
+        capacity = min(max_size, 1024)
+        self.values = np.empty((capacity, ) + shape, dtype=np.float64)
+        self.cumsum = np.empty((capacity, ) + shape, dtype=np.float64)
+        self.total = np.zeros(shape, dtype=np.float64)
+        self.start = self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return self.values.shape[0]
+
+    def accepts(self, value):
+        if self.columns is None:
+            return _is_scalar(value)
+        return isinstance(value, dict) and list(
+            value.keys()) == self.columns and all(
+                _is_scalar(v) for v in value.values())
+
+    def _resize(self, capacity):
+        inds = self._indices(self.size)
+        for name in ('values', 'cumsum'):
+            data = getattr(self, name)
+            resized = np.empty((capacity, ) + data.shape[1:], dtype=data.dtype)
+            resized[:self.size] = data[inds]
+            setattr(self, name, resized)
+        self.start = 0
+
+    def _indices(self, window_size):
+        end = self.start + self.size
+        return np.arange(end - window_size, end) % self.capacity
+
+    def is_full(self):
+        return self.size == self.capacity >= self.max_size
+
+    def append(self, value):
+        if self.columns is None:
+            self.integral &= _is_integral(value)
+            value = _to_float(value)
+        else:
+            self.integral &= [_is_integral(value[k]) for k in self.columns]
+            value = [_to_float(value[k]) for k in self.columns]
+
+        if self.size == self.capacity:
+            if self.capacity < self.max_size:
+                self._resize(min(self.capacity * 2, self.max_size))
+            else:
+                self.start = (self.start + 1) % self.capacity
+                self.size -= 1
+
+        self.total = self.total + value
+        ind = (self.start + self.size) % self.capacity
+        self.values[ind] = value
+        self.cumsum[ind] = self.total
+        self.size += 1
+
+    def _format(self, value):
+        if self.columns is None:
+            return int(value) if self.integral else float(value)
+        return {
+            k: int(v) if i else float(v)
+            for k, v, i in zip(self.columns, value.tolist(), self.integral)
+        }
+
+    def latest(self):
+        return self._format(self.values[(self.start + self.size - 1) %
+                                        self.capacity])
+
+    def tolist(self):
+        return [self._format(v) for v in self.values[self._indices(self.size)]]
+
+    def window(self, window_size):
+        return self.values[self._indices(window_size)]
+
+    def sum(self, window_size):
+        last = self.cumsum[(self.start + self.size - 1) % self.capacity]
+        if window_size == self.size:
+            first = self.start
+            base = self.cumsum[first] - self.values[first]
+        else:
+            base = self.cumsum[(self.start + self.size - window_size - 1) %
+                               self.capacity]
+        return last - base
+
+
+@nncore.bind_getter('max_size', 'on_device')
 class Buffer(object):
     """
     A buffer that tracks a series of values and provide access to smoothed
     scalar values over a window.
 
+    Scalars and dicts of scalars of metrics are stored in preallocated ring
+    arrays (one column per sub-key for dicts) with running sums, so that
+    appending, evicting, and computing windowed sums and means take O(1)
+    time. Other values, including those with keys starting or ending with
+    ``_``, are stored in lists as they are.
+
     Args:
         max_size (int, optional): Maximal number of internal values that can
             be stored in the buffer. When the capacity of the buffer is
             exhausted, old values will be removed. Default: ``100000``.
+        on_device (bool, optional): Whether to keep scalar tensors (or dicts
+            of scalar tensors) of metrics on their devices when updating.
+            These values will be copied to host in one batched transfer when
+            the buffer is accessed, so that updating the buffer does not
+            synchronize the devices. Default: ``False``.
         logger (:obj:`logging.Logger` | str | None, optional): The logger or
             name of the logger to use. Default: ``None``.
     """
 
-    def __init__(self, max_size=100000, logger=None):
+    def __init__(self, max_size=100000, on_device=False, logger=None):
         self._max_size = max_size
+        self._on_device = on_device
         self._logger = logger
         self._data = OrderedDict()
+        self._pending = OrderedDict()
+
+    def _materialize(self):
+        if len(self._pending) == 0:
+            return
+
+        pending, self._pending = self._pending, OrderedDict()
+        values = to_host([[v for v, _ in p] for p in pending.values()])
+
+        for (key, items), vals in zip(pending.items(), values):
+            for (_, warning), value in zip(items, vals):
+                self._append(key, value, warning)
+
+    def _to_list(self, values):
+        return values.tolist() if isinstance(values, _Series) else values
+
+    def _window_size(self, key, window_size):
+        if window_size is None or window_size > len(self._data[key]):
+            window_size = len(self._data[key])
+        return window_size
+
+    def _window(self, key, window_size):
+        values = self._data[key]
+        if isinstance(values, _Series):
+            return values.window(window_size)
+
+        values = values[-window_size:]
+        if isinstance(values[0], dict):
+            return {
+                k: np.array([_to_float(x) for x in v])
+                for k, v in nncore.to_dict_of_list(values).items()
+            }
+        return np.array([_to_float(v) for v in values])
+
+    def _reduce(self, key, window_size, func):
+        window_size = self._window_size(key, window_size)
+        values = self._data[key]
+
+        if isinstance(values, _Series):
+            out = func(values.window(window_size))
+            if values.columns is not None:
+                out = dict(zip(values.columns, out.tolist()))
+            else:
+                out = float(out)
+        else:
+            window = self._window(key, window_size)
+            if isinstance(window, dict):
+                out = {k: float(func(v)) for k, v in window.items()}
+            else:
+                out = float(func(window))
+
+        return out
 
     def update(self, key, value, warning=True):
         """
@@ -39,21 +272,100 @@ class Buffer(object):
             warning (bool, optional): Whether to display warning when removing
                 values. Default: ``True``.
         """
+        if self._on_device and _is_metric(key) and _is_on_device(value):
+            items = self._pending.setdefault(key, [])
+            items.append((value, warning))
+            if len(items) >= _MAX_PENDING:
+                self._materialize()
+            return
+
+        if key in self._pending:
+            self._materialize()
+
+        self._append(key, value, warning)
+
+    def _append(self, key, value, warning):
+        growable = key.startswith('_')
+
         if key not in self._data:
-            self._data[key] = []
-        elif not key.startswith('_') and len(
-                self._data[key]) == self._max_size:
+            if _is_metric(key) and _is_scalars(value):
+                self._data[key] = _Series(value, self._max_size)
+            else:
+                self._data[key] = []
+        elif isinstance(self._data[key],
+                        _Series) and not self._data[key].accepts(value):
+            self._data[key] = self._data[key].tolist()
+
+        values = self._data[key]
+
+        if isinstance(values, _Series):
+            if warning and values.is_full():
+                self._warn(key)
+            values.append(value)
+            return
+
+        if not growable and len(values) == self._max_size:
             if warning:
-                nncore.log_or_print(
-                    "Number of '{}' values in the buffer exceeds max size "
-                    "({}), removing the oldest element".format(
-                        key, self._max_size),
-                    self._logger,
-                    log_level='WARNING')
-            self._data[key].pop(0)
+                self._warn(key)
+            values.pop(0)
+
+        values.append(value)
+
+    def _warn(self, key):
+        nncore.log_or_print(
+            "Number of '{}' values in the buffer exceeds max size ({}), "
+            'removing the oldest element'.format(key, self._max_size),
+            self._logger,
+            log_level='WARNING')
+
+    @_materialized
+    def get(self, key, default=None):
+        """
+        Return the list of values according to the key.
+
+        Args:
+            key (str): The key of the values.
+            default (any, optional): The value to be returned if the key does
+                not exist. Default: ``None``.
+        """
+        if key not in self._data:
+            return default
+        return self._to_list(self._data[key])
 
-        self._data[key].append(value)
+    @_materialized
+    def pop(self, key, *args):
+        """
+        Remove the values according to the key and return them as a list.
+
+        Args:
+            key (str): The key of the values.
+            default (any, optional): The value to be returned if the key does
+                not exist. If not specified, a :obj:`KeyError` will be raised.
+        """
+        return self._to_list(self._data.pop(key, *args))
 
+    @_materialized
+    def keys(self):
+        """
+        Return the keys in the buffer.
+        """
+        return self._data.keys()
+
+    @_materialized
+    def values(self):
+        """
+        Return the lists of values in the buffer.
+        """
+        return [self._to_list(v) for v in self._data.values()]
+
+    @_materialized
+    def items(self):
+        """
+        Return the pairs of keys and lists of values in the buffer.
+        """
+        return [(k, self._to_list(v)) for k, v in self._data.items()]
+
+    @_materialized
     def count(self, key):
         """
         Return the number of values according to the key.
@@ -68,7 +380,30 @@ class Buffer(object):
         Remove all values from the buffer.
         """
         self._data = OrderedDict()
+        self._pending = OrderedDict()
+
+    @_materialized
+    def state_dict(self):
+        """
+        Return the values in the buffer as a dict of lists.
+        """
+        return OrderedDict(
+            (k, self._to_list(v)) for k, v in self._data.items())
 
+    def load_state_dict(self, state_dict):
+        """
+        Restore the buffer from a dict of lists. The existing values will be
+        removed.
+
+        Args:
+            state_dict (dict): The values to be loaded.
+        """
+        self.clear()
+        for key, values in state_dict.items():
+            for value in values:
+                self._append(key, value, False)
+
+    @_materialized
     def latest(self, key):
         """
         Return the latest value in the buffer.
@@ -76,8 +411,12 @@ class Buffer(object):
         Args:
             key (str): The key of the values.
         """
-        return self._data[key][-1]
+        values = self._data[key]
+        if isinstance(values, _Series):
+            return values.latest()
+        return values[-1]
 
+    @_materialized
     def median(self, key, window_size=None):
         """
         Return the median of the latest ``window_size`` values in the buffer.
@@ -91,21 +430,9 @@ class Buffer(object):
         Returns:
             float: The median of the latest ``window_size`` values.
         """
-        if window_size is None or window_size > len(self._data[key]):
-            window_size = len(self._data[key])
-
-        if isinstance(self._data[key][0], dict):
-            data = nncore.to_dict_of_list(self._data[key][-window_size:])
-            median = {
-                k: torch.Tensor(v).median().item()
-                for k, v in data.items()
-            }
-        else:
-            median = torch.Tensor(
-                self._data[key][-window_size:]).median().item()
-
-        return median
+        return self._reduce(key, window_size, _lower_median)
 
+    @_materialized
     def mean(self, key, window_size=None):
         """
         Return the mean of the latest ``window_size`` values in the buffer.
@@ -119,17 +446,18 @@ class Buffer(object):
         Returns:
             float: The mean of the latest ``window_size`` values.
         """
-        if window_size is None or window_size > len(self._data[key]):
-            window_size = len(self._data[key])
+        window_size = self._window_size(key, window_size)
+        values = self._data[key]
 
-        if isinstance(self._data[key][0], dict):
-            data = nncore.to_dict_of_list(self._data[key][-window_size:])
-            mean = {k: torch.Tensor(v).mean().item() for k, v in data.items()}
-        else:
-            mean = torch.Tensor(self._data[key][-window_size:]).mean().item()
+        if isinstance(values, _Series):
+            mean = values.sum(window_size) / window_size
+            if values.columns is not None:
+                return dict(zip(values.columns, mean.tolist()))
+            return float(mean)
 
-        return mean
+        return self._reduce(key, window_size, lambda v: v.mean(axis=0))
 
+    @_materialized
     def sum(self, key, window_size=None):
         """
         Return the sum of the latest ``window_size`` values in the buffer.
@@ -143,17 +471,18 @@ class Buffer(object):
         Returns:
             float: The sum of the latest ``window_size`` values.
         """
-        if window_size is None or window_size > len(self._data[key]):
-            window_size = len(self._data[key])
+        window_size = self._window_size(key, window_size)
+        values = self._data[key]
 
-        if isinstance(self._data[key][0], dict):
-            data = nncore.to_dict_of_list(self._data[key][-window_size:])
-            sum = {k: torch.Tensor(v).sum().item() for k, v in data.items()}
-        else:
-            sum = torch.Tensor(self._data[key][-window_size:]).sum().item()
+        if isinstance(values, _Series):
+            sum = values.sum(window_size)
+            if values.columns is not None:
+                return dict(zip(values.columns, sum.tolist()))
+            return float(sum)
 
-        return sum
+        return self._reduce(key, window_size, lambda v: v.sum(axis=0))
 
+    @_materialized
     def avg(self, key, factor='_avg_factor', window_size=None):
         """
         Return the average of the latest ``window_size`` values in the buffer.
@@ -172,20 +501,12 @@ class Buffer(object):
         Returns:
             float: The average of the latest ``window_size`` values.
         """
-        if window_size is None or window_size > len(self._data[key]):
-            window_size = len(self._data[key])
-
-        num_samples = torch.Tensor(self._data[factor][-window_size:])
+        window_size = self._window_size(key, window_size)
+        num_samples = self._window(factor,
+                                   min(window_size, len(self._data[factor])))
+        total = self.sum(factor, window_size=window_size)
 
-        if isinstance(self._data[key][0], dict):
-            data = nncore.to_dict_of_list(self._data[key][-window_size:])
-            avg = {
-                k: ((torch.Tensor(v) * num_samples).sum() /
-                    num_samples.sum()).item()
-                for k, v in data.items()
-            }
-        else:
-            scalar = torch.Tensor(self._data[key][-window_size:])
-            avg = ((scalar * num_samples).sum() / num_samples.sum()).item()
+        def _avg(v):
+            return np.dot(num_samples, v) / total
 
-        return avg
+        return self._reduce(key, window_size, _avg)
@@ -1,14 +1,19 @@
 # Copyright (c) Ye Liu. Licensed under the MIT License.
 
+import os
 import random
+from copy import copy
 from functools import partial
+from itertools import islice
 
 import numpy as np
-from torch.utils.data import DataLoader, DistributedSampler
+import torch
+from torch.utils.data import (DataLoader, DistributedSampler, IterableDataset,
+                              Sampler)
 
 from nncore import Registry
-from nncore.dataset import build_dataset
-from nncore.parallel import collate
+from nncore.dataset import BucketBatchSampler, build_dataset
+from nncore.parallel import DataPrefetcher, collate
 from .comm import get_dist_info, is_distributed
 
 HOOKS = Registry('hook')
@@ -20,11 +25,135 @@ def _init_fn(worker_id, num_workers, rank, seed):
     random.seed(worker_seed)
 
 
+def _apply_profile(loader_cfg, world_size, max_workers=8):
+    if hasattr(os, 'sched_getaffinity'):
+        num_cpus = len(os.sched_getaffinity(0))
+    else:
+        num_cpus = os.cpu_count() or 1
+
+    local_size = int(os.environ.get('LOCAL_WORLD_SIZE', world_size))
+    num_workers = loader_cfg.setdefault(
+        'num_workers',
+        min(max(num_cpus // max(local_size, 1) - 1, 0), max_workers))
+
+    if num_workers > 0:
+        loader_cfg.setdefault('persistent_workers', True)
+        loader_cfg.setdefault('prefetch_factor',
+                              max(2, max_workers // num_workers))
+
+    loader_cfg.setdefault('pin_memory', torch.cuda.is_available())
+
+
+class _SkipSampler(Sampler):
+
+    def __init__(self, sampler, num_skip):
+        self._sampler = sampler
+        self._num_skip = num_skip
+
+    def __iter__(self):
+        return islice(self._sampler, self._num_skip, None)
+
+    def __len__(self):
+        return max(len(self._sampler) - self._num_skip, 0)
+
+
+class _SkipLoader(object):
+
+    def __init__(self, data_loader, num_skip):
+        self._data_loader = data_loader
+        self._num_skip = num_skip
+
+    def __getattr__(self, key):
+        return getattr(self._data_loader, key)
+
+    def __iter__(self):
+        return islice(self._data_loader, self._num_skip, None)
+
+    def __len__(self):
+        return max(len(self._data_loader) - self._num_skip, 0)
+
+
+def skip_batches(data_loader, num_batches):
+    """
+    Create a view of a data loader that skips the first few batches of the
+    next epoch. Only the indices of the skipped batches are drawn from the
+    sampler, so that no samples are loaded. The returned data loader shares
+    the dataset, sampler, and other configs with the original one. For
+    :obj:`IterableDataset`, the skipped batches have to be loaded and
+    dropped, since the samples are not indexed.
+
+    Args:
+        data_loader (:obj:`DataLoader` | :obj:`DataPrefetcher`): The data
+            loader to be wrapped.
+        num_batches (int): The number of batches to skip.
+
+    Returns:
+        :obj:`DataLoader` | :obj:`DataPrefetcher`: The wrapped data loader.
+    """
+    if isinstance(data_loader, DataPrefetcher):
+        prefetcher = copy(data_loader)
+        prefetcher._data_loader = skip_batches(data_loader.data_loader,
+                                               num_batches)
+        return prefetcher
+
+    if isinstance(data_loader.dataset, IterableDataset):
+        return _SkipLoader(data_loader, num_batches)
+
+    if data_loader.batch_sampler is not None:
+        cfg = dict(
+            batch_sampler=_SkipSampler(data_loader.batch_sampler, num_batches))
+    else:
+        cfg = dict(
+            sampler=_SkipSampler(data_loader.sampler, num_batches),
+            batch_size=None)
+
+    generator = data_loader.generator
+    if data_loader.num_workers > 0:
+        cfg['prefetch_factor'] = data_loader.prefetch_factor
+        # Persistent workers do not draw base seeds from the global random
+        # state in every epoch, so the temporary data loader should not either
+        if generator is None and data_loader.persistent_workers:
+            generator = torch.Generator()
+
+    return DataLoader(
+        data_loader.dataset,
+        num_workers=data_loader.num_workers,
+        collate_fn=data_loader.collate_fn,
+        pin_memory=data_loader.pin_memory,
+        timeout=data_loader.timeout,
+        worker_init_fn=data_loader.worker_init_fn,
+        multiprocessing_context=data_loader.multiprocessing_context,
+        generator=generator,
+        **cfg)
+
+
 def build_dataloader(cfg, seed=None, dist=None, group=None, **kwargs):
     """
     Build a data loader from a dict. The dataset should be registered in
     :obj:`DATASETS`.
 
+    Besides the arguments of :obj:`DataLoader`, the ``loader`` field of the
+    config may contain a ``prefetch`` field (bool | dict). If specified, the
+    data loader will be wrapped by :obj:`DataPrefetcher`, where the dict
+    stands for its arguments. A ``bucket`` field (bool | dict) can also be
+    specified to sample batches with :obj:`BucketBatchSampler`, where the dict
+    stands for its arguments. In this case, ``batch_size``, ``shuffle``, and
+    ``drop_last`` of the loader are passed to the batch sampler, and it will
+    be distributed automatically.
+
+    A ``profile`` field (bool | dict) is also supported to configure the data
+    loader for performance. If specified, ``num_workers`` will be chosen from
+    the number of CPUs available to each local rank (at most ``max_workers``
+    in the dict, Default: ``8``), and the workers will be kept alive across
+    epochs with ``persistent_workers=True`` and a ``prefetch_factor`` that
+    keeps about ``max_workers`` batches in flight. ``pin_memory`` will be
+    enabled when CUDA is available. The fields explicitly specified in the
+    ``loader`` config are not overridden.
+
+    A ``size_divisor`` field (int) can be specified to round the padded sizes
+    of :obj:`DataContainer` up to its multiples in :obj:`collate`, which is
+    useful for models compiled by :obj:`torch.compile`.
+
     Args:
         cfg (dict): The config of the dataset.
         seed (int | None, optional): The random seed to use. Default: ``None``.
@@ -36,25 +165,48 @@ def build_dataloader(cfg, seed=None, dist=None, group=None, **kwargs):
             Default: ``None``.
 
     Returns:
-        :obj:`DataLoader`: The constructed data loader.
+        :obj:`DataLoader` | :obj:`DataPrefetcher`: The constructed data \
+            loader.
     """
-    if isinstance(cfg, DataLoader):
+    if isinstance(cfg, (DataLoader, DataPrefetcher)):
         return cfg
 
     _cfg = cfg.copy()
 
     if isinstance(_cfg, dict):
-        loader_cfg = _cfg.pop('loader', dict())
+        loader_cfg = _cfg.pop('loader', dict()).copy()
     else:
         loader_cfg = dict()
 
     dataset = build_dataset(_cfg, **kwargs)
 
     rank, world_size = get_dist_info(group=group)
-    num_workers = loader_cfg.get('num_workers', 0)
 
-    if 'sampler' not in loader_cfg and is_distributed(
-    ) if dist is None else dist:
+    profile = loader_cfg.pop('profile', False)
+    if profile:
+        _apply_profile(loader_cfg, world_size,
+                       **profile if isinstance(profile, dict) else dict())
+
+    num_workers = loader_cfg.get('num_workers', 0)
+    prefetch = loader_cfg.pop('prefetch', False)
+    bucket = loader_cfg.pop('bucket', False)
+    size_divisor = loader_cfg.pop('size_divisor', None)
+
+    if dist is None:
+        dist = is_distributed()
+
+    if bucket:
+        bucket = bucket.copy() if isinstance(bucket, dict) else dict()
+        for key in ('batch_size', 'shuffle', 'drop_last'):
+            if key in loader_cfg:
+                bucket.setdefault(key, loader_cfg.pop(key))
+        if dist:
+            bucket.setdefault('num_replicas', world_size)
+            bucket.setdefault('rank', rank)
+        if seed is not None:
+            bucket.setdefault('seed', seed)
+        loader_cfg['batch_sampler'] = BucketBatchSampler(dataset, **bucket)
+    elif 'sampler' not in loader_cfg and dist:
         loader_cfg['sampler'] = DistributedSampler(
             dataset,
             num_replicas=world_size,
@@ -65,11 +217,15 @@ def build_dataloader(cfg, seed=None, dist=None, group=None, **kwargs):
 
     data_loader = DataLoader(
         dataset,
-        collate_fn=collate,
+        collate_fn=partial(collate, size_divisor=size_divisor),
         worker_init_fn=None if seed is None else partial(
             _init_fn, num_workers=num_workers, rank=rank, seed=seed),
         **loader_cfg)
 
+    if prefetch:
+        data_loader = DataPrefetcher(
+            data_loader, **prefetch if isinstance(prefetch, dict) else dict())
+
     return data_loader
 
 
@@ -8,7 +8,7 @@ import torch
 import torch.distributed as dist
 import torch.multiprocessing as mp
 
-import nncore
+from nncore.parallel import deserialize_from_tensor, serialize_to_tensor
 
 
 def _get_default_device(group=None):
@@ -18,14 +18,6 @@ def _get_default_device(group=None):
     return device
 
 
-def _serialize_to_tensor(data, device):
-    buffer = nncore.dumps(data)
-    storage = torch.ByteStorage.from_buffer(buffer)
-    data_tensor = torch.ByteTensor(storage).to(device)
-    size_tensor = torch.LongTensor([data_tensor.numel()]).to(device)
-    return data_tensor, size_tensor
-
-
 def _pad_tensor(data_tensor, pad_size):
     data_size = data_tensor.numel()
     if data_size < pad_size:
@@ -208,7 +200,10 @@ def sync(group=None):
 
 def broadcast(data=None, src=0, group=None):
     """
-    Perform :obj:`dist.broadcast` on arbitrary serializable data.
+    Perform :obj:`dist.broadcast` on arbitrary serializable data. Tensors and
+    numeric NumPy arrays in the data (including those in nested dicts, lists,
+    and tuples) are transferred as raw bytes with their original data types
+    and shapes, and only the remaining objects are pickled.
 
     Args:
         data (any, optional): Any serializable object.
@@ -227,7 +222,7 @@ def broadcast(data=None, src=0, group=None):
     device = _get_default_device(group=group)
 
     if rank == src:
-        data_tensor, size_tensor = _serialize_to_tensor(data, device)
+        data_tensor, size_tensor = serialize_to_tensor(data, device)
     else:
         size_tensor = torch.empty(1, dtype=torch.long, device=device)
 
@@ -240,15 +235,16 @@ def broadcast(data=None, src=0, group=None):
         data_tensor = torch.empty(pad_size, dtype=torch.uint8, device=device)
 
     dist.broadcast(data_tensor, src=src, group=group)
-    buffer = data_tensor.cpu().numpy().tobytes()[:pad_size]
-    broadcasted = nncore.loads(buffer)
+    broadcasted = deserialize_from_tensor(data_tensor, pad_size)
 
     return broadcasted
 
 
 def all_gather(data, group=None):
     """
-    Perform :obj:`dist.all_gather` on arbitrary serializable data.
+    Perform :obj:`dist.all_gather` on arbitrary serializable data. Tensors in
+    the data are transferred as raw bytes without pickling. See
+    :obj:`broadcast` for details.
 
     Args:
         data (any): Any serializable object.
@@ -264,7 +260,7 @@ def all_gather(data, group=None):
         return [data]
 
     device = _get_default_device(group=group)
-    data_tensor, size_tensor = _serialize_to_tensor(data, device)
+    data_tensor, size_tensor = serialize_to_tensor(data, device)
     size_list = [torch.empty_like(size_tensor) for _ in range(world_size)]
     dist.all_gather(size_list, size_tensor, group=group)
 
@@ -274,17 +270,19 @@ def all_gather(data, group=None):
     tensor_list = [data_tensor.new_empty(pad_size) for _ in range(world_size)]
     dist.all_gather(tensor_list, data_tensor, group=group)
 
-    gathered = []
-    for data_tensor, size_tensor in zip(tensor_list, size_list):
-        buffer = data_tensor.cpu().numpy().tobytes()[:size_tensor.item()]
-        gathered.append(nncore.loads(buffer))
+    gathered = [
+        deserialize_from_tensor(data_tensor, size_tensor.item())
+        for data_tensor, size_tensor in zip(tensor_list, size_list)
+    ]
 
     return gathered
 
 
 def gather(data, dst=0, group=None):
     """
-    Perform :obj:`dist.gather` on arbitrary serializable data.
+    Perform :obj:`dist.gather` on arbitrary serializable data. Tensors in
+    the data are transferred as raw bytes without pickling. See
+    :obj:`broadcast` for details.
 
     Args:
         data (any): Any serializable object.
@@ -307,7 +305,7 @@ def gather(data, dst=0, group=None):
         return gathered if rank == dst else None
 
     device = _get_default_device(group=group)
-    data_tensor, size_tensor = _serialize_to_tensor(data, device)
+    data_tensor, size_tensor = serialize_to_tensor(data, device)
     size_list = [torch.empty_like(size_tensor) for _ in range(world_size)]
     dist.all_gather(size_list, size_tensor, group=group)
 
@@ -320,10 +318,10 @@ def gather(data, dst=0, group=None):
         ]
         dist.gather(data_tensor, gather_list=tensor_list, dst=dst, group=group)
 
-        gathered = []
-        for data_tensor, size_tensor in zip(tensor_list, size_list):
-            buffer = data_tensor.cpu().numpy().tobytes()[:size_tensor.item()]
-            gathered.append(nncore.loads(buffer))
+        gathered = [
+            deserialize_from_tensor(data_tensor, size_tensor.item())
+            for data_tensor, size_tensor in zip(tensor_list, size_list)
+        ]
     else:
         dist.gather(data_tensor, dst=dst, group=group)
         gathered = None
@@ -1,19 +1,26 @@
 # Copyright (c) Ye Liu. Licensed under the MIT License.
 
 from collections import OrderedDict
+from contextlib import nullcontext
+from itertools import islice
+from time import perf_counter
 
 import torch
-import wandb
 
 import nncore
 from nncore.nn import build_model
+from nncore.nn.utils import _has_length
 from nncore.optim import build_optimizer
 from nncore.utils import CfgNode
 from .buffer import Buffer
-from .builder import build_dataloader, build_hook
-from .comm import gather, is_distributed, is_main_process, sync
+from .builder import build_dataloader, build_hook, skip_batches
+from .comm import all_gather, gather, get_rank, is_main_process, sync
 from .hooks import Hook
-from .utils import get_checkpoint, load_checkpoint
+from .hooks.base import HOOK_NAMES
+from .pipeline import LogPipeline
+from .store import PredictionStore
+from .utils import (_get_rng_state, _profiling, _record_function, _record_iter,
+                    _set_rng_state, get_checkpoint, load_checkpoint)
 
 _DEFAULT_STAGES = [
     dict(
@@ -24,14 +31,17 @@ _DEFAULT_STAGES = [
         validation=dict(interval=1))
 ]
 
+_AMP_DTYPES = dict(fp16=torch.float16, bf16=torch.bfloat16)
+
 _DEFAULT_HOOKS = [
-    'TimerHook', 'LrUpdaterHook', 'OptimizerHook', 'CheckpointHook',
-    'EvalHook', 'EventWriterHook'
+    'TimerHook', 'LrUpdaterHook', 'SamplerSeedHook', 'OptimizerHook',
+    'CheckpointHook', 'EvalHook', 'EventWriterHook'
 ]
 
 
 @nncore.bind_getter('mode', 'max_stages', 'max_epochs', 'max_iters',
-                    'start_iter', 'stage', 'epoch', 'iter', 'kwargs')
+                    'start_iter', 'stage', 'epoch', 'iter', 'epoch_rng_state',
+                    'kwargs')
 class Engine(object):
     """
     An engine that can take over the whole training, validation, and testing
@@ -53,6 +63,14 @@ class Engine(object):
             dict containing the following fields:
 
             - `epochs` (int): Number of epochs in the stage.
+            - `iters` (int, optional): Number of iterations in the stage. If \
+                specified, the stage is iteration-based and ``epochs`` is \
+                ignored. The training data loader will be iterated \
+                repeatedly until the budget is reached, where each pass \
+                counts as an epoch, and the last one may be cut. This is \
+                required for data loaders with unknown lengths, e.g. those \
+                of :obj:`IterableDataset`. Learning rate schedules and \
+                warm-up policies in these stages should be iteration-based.
             - `optimizer` (:obj:`optim.Optimizer` | dict): The optimizer or \
                 an optimizer config containing the following fields:
 
@@ -90,10 +108,28 @@ class Engine(object):
                 the following fields:
 
                 - `interval` (int, optional): The interval of performing \
-                    validation. ``0`` means not performing validation. \
+                    validation. ``0`` means not performing validation. The \
+                    interval is counted in iterations for iteration-based \
+                    stages, and in epochs otherwise. Default: ``0``.
+                - `offset` (int, optional): The number of epochs (or \
+                    iterations) to skip before counting the interval. \
                     Default: ``0``.
-                - `offset` (int, optional): The number of epochs to skip \
-                    before counting the interval. Default: ``0``.
+                - `chunk_size` (int, optional): The number of outputs per \
+                    rank to be gathered at a time during evaluation. \
+                    Default: ``1000``.
+
+            - `amp` (dict, optional): The automatic mixed precision config \
+                containing the following fields:
+
+                - `dtype` (str, optional): The data type to use in \
+                    :obj:`torch.autocast`. Expected values include \
+                    ``'fp16'`` and ``'bf16'``. Default: ``'fp16'``.
+                - `grad_scaler` (bool, optional): Whether to use dynamic \
+                    loss scaling. Default: ``True`` for ``'fp16'`` and \
+                    ``False`` for ``'bf16'``.
+                - `configs for the grad scaler, e.g.` ``init_scale=65536``. \
+                    Please refer to :obj:`torch.amp.GradScaler` for full \
+                    configs.
 
             Default: ``None``.
         hooks (list[:obj:`Hook` | dict | str] | None, optional): The list of
@@ -101,6 +137,19 @@ class Engine(object):
             :obj:`Hook`, a dict or a str. Default: ``None``.
         buffer_size (int, optional): Maximum size of the buffer. Default:
             ``100000``.
+        buffer_on_device (bool, optional): Whether to accumulate scalar
+            outputs on their devices and copy them to host only when the
+            buffer is accessed (e.g. when writing logs). This avoids
+            synchronizing the devices every iteration. Default: ``False``.
+        spill_outputs (bool, optional): Whether to spill the ``_out`` values
+            in validation and testing to per-rank shard files in the working
+            directory instead of keeping them in memory. The shards are
+            memory-mapped during evaluation, so that the working directory is
+            expected to be shared among all the ranks. Default: ``False``.
+        pipeline (dict | None, optional): The config of the
+            :obj:`LogPipeline` for asynchronous metric logging, containing
+            fields ``max_size``, ``interval``, and ``timeout``. Default:
+            ``None``.
         logger (:obj:`logging.Logger` | str | None, optional): The logger or
             name of the logger to use. Default: ``None``.
         work_dir (str | None, optional): Path to the working directory. If not
@@ -110,6 +159,15 @@ class Engine(object):
             Default: ``None``.
         meta (any | None, optional): A dictionary-like object containing meta
             data of this engine. Default: ``None``.
+        compile (bool | dict | None, optional): Whether to compile the model
+            using :obj:`torch.compile`. It can also be a dict containing the
+            arguments of :obj:`torch.compile`, e.g. ``mode`` and ``backend``.
+            If specified, the model will be warmed up on the first training
+            and validation batches before launching, so that the compilation
+            time is excluded from the timings and is reported separately.
+            Recompilation caused by variable padded shapes can be avoided by
+            specifying ``size_divisor`` in the configs of data loaders.
+            Default: ``None``.
 
     Example:
         >>> # Build model
@@ -149,13 +207,17 @@ class Engine(object):
                  stages=None,
                  hooks=None,
                  buffer_size=100000,
+                 buffer_on_device=False,
+                 spill_outputs=False,
+                 pipeline=None,
                  logger=None,
                  work_dir=None,
                  seed=None,
                  meta=None,
+                 compile=None,
                  **kwargs):
-        self.model = build_model(model, **kwargs)
-        wandb.watch(self.model)
+        self.model = build_model(model, compile=compile, **kwargs)
+        self._compiled = bool(compile)
         if 'train' not in data_loaders:
             data_loaders = dict(train=data_loaders)
 
@@ -178,8 +240,6 @@ class Engine(object):
             self.stages = stages or _DEFAULT_STAGES
 
         self.register_hook(_DEFAULT_HOOKS)
-        if is_distributed():
-            self.register_hook('SamplerSeedHook', before='OptimizerHook')
         if hooks is not None:
             self.register_hook(hooks)
 
@@ -189,7 +249,18 @@ class Engine(object):
         log_file = nncore.join(self.work_dir, time_str + '.log')
         self.logger = nncore.get_logger(logger, log_file=log_file)
 
-        self.buffer = Buffer(max_size=buffer_size, logger=self.logger)
+        self.buffer = Buffer(
+            max_size=buffer_size,
+            on_device=buffer_on_device,
+            logger=self.logger)
+        self.pipeline = LogPipeline(**pipeline or dict())
+
+        if spill_outputs:
+            self._store = PredictionStore(
+                nncore.join(self.work_dir, 'outputs',
+                            'rank_{}.bin'.format(get_rank())))
+        else:
+            self._store = None
         self.reset_states()
 
         self.meta = meta
@@ -200,41 +271,277 @@ class Engine(object):
 
     @property
     def epoch_in_stage(self):
-        cumsum = 0
-        for stage in self.stages:
-            if self._epoch + 1 <= cumsum + stage['epochs']:
-                return self._epoch - cumsum
-            cumsum += stage['epochs']
-        return self.stages[-1]['epochs']
+        return self._epoch - self._stage_start_epoch
 
     @property
     def iter_in_stage(self):
-        cumsum = 0
-        for i in range(self._stage):
-            cumsum += len(
-                self.data_loaders['train']) * self.stages[i]['epochs']
-        return self._iter - cumsum
+        return self._iter - sum(
+            self._stage_iters(stage) for stage in self.stages[:self._stage])
 
     @property
     def iter_in_epoch(self):
-        return self._iter - len(self.data_loaders['train']) * self._epoch
+        return self._iter - self._epoch_start_iter
+
+    @property
+    def max_epochs_in_stage(self):
+        return self._stage_epochs(self.cur_stage)
+
+    @property
+    def max_iters_in_stage(self):
+        return self._stage_iters(self.cur_stage)
+
+    @property
+    def max_iters_in_epoch(self):
+        num_iters = self.max_iters_in_stage - (
+            self.iter_in_stage - self.iter_in_epoch)
+        num_batches = self._num_batches('train')
+        return num_iters if num_batches is None else min(
+            num_batches, num_iters)
+
+    def _num_batches(self, mode):
+        data_loader = self.data_loaders[mode]
+        return len(data_loader) if _has_length(data_loader) else None
+
+    def _stage_epochs(self, stage):
+        if 'iters' not in stage:
+            return stage['epochs']
+
+        num_batches = self._num_batches('train')
+        if num_batches is None:
+            return None
+
+        return -(-stage['iters'] // num_batches)
+
+    def _stage_iters(self, stage):
+        if 'iters' in stage:
+            return stage['iters']
+
+        num_batches = self._num_batches('train')
+        if num_batches is None:
+            raise TypeError('the length of training data loader is unknown, '
+                            'please specify iters in stages instead')
+
+        return num_batches * stage['epochs']
+
+    def _locate_epoch(self, epoch):
+        # Epochs never span across stages, so the first epoch of the stage and
+        # the first iteration of the epoch follow from the stage schedule
+        stage_start_epoch = stage_start_iter = 0
+        for stage in self.stages:
+            num_epochs = self._stage_epochs(stage)
+            if epoch < stage_start_epoch + num_epochs:
+                break
+            stage_start_epoch += num_epochs
+            stage_start_iter += self._stage_iters(stage)
+
+        epoch_start_iter = stage_start_iter + self._num_batches('train') * (
+            epoch - stage_start_epoch)
+        return stage_start_epoch, epoch_start_iter
+
+    def _update_buffer(self, output):
+        for key, value in output.items():
+            if (key == '_out' and self._store is not None
+                    and self._mode != 'train'):
+                self._store.append(value)
+                continue
+            if torch.is_tensor(value):
+                value = value.detach()
+                if not self.buffer.on_device or value.numel() != 1:
+                    value = value.cpu()
+            self.buffer.update(key, value)
+
+    def _autocast(self):
+        cfg = self.cur_stage.get('amp')
+        if cfg is None:
+            return nullcontext()
+
+        device = next(self.model.parameters()).device
+        dtype = _AMP_DTYPES[cfg.get('dtype', 'fp16')]
+        return torch.autocast(device.type, dtype=dtype)
+
+    def _forward(self, data):
+        # Warming up a compiled model also relies on this method, so that the
+        # compiled graphs match those of training and validation
+        if self._mode == 'train':
+            with _record_function('forward'), self._autocast():
+                return self.model(data, mode=self._mode, **self._kwargs)
+
+        with _record_function('forward'), torch.no_grad():
+            return self.model(data, mode=self._mode, **self._kwargs)
+
+    def _restore_rng_state(self):
+        if self._resume_rng_state is not None:
+            _set_rng_state(self._resume_rng_state)
+            self._resume_rng_state = None
+
+    def _scheduled_modes(self):
+        # The modes whose data loaders are iterated by the remaining stages,
+        # where the test split is only run by hooks (e.g. EvalHook) along
+        # with validation
+        modes = ['train']
+        if 'val' in self.data_loaders and any(
+                stage.get('validation', dict()).get('interval', 0) > 0
+                for stage in self.stages[self._stage:]):
+            modes.append('val')
+            if any(
+                    getattr(hook, 'run_test', False)
+                    for hook in self.hooks.values()):
+                modes.append('test')
+        return modes
+
+    def _warmup_workers(self):
+        # Spawn the persistent workers in advance so that they start loading
+        # data while the hooks are being prepared. Loaders shared by several
+        # modes are only warmed up once.
+        rng_state = _get_rng_state()
+        data_loaders = dict()
+        for mode in self._scheduled_modes():
+            data_loader = self.data_loaders[mode]
+            data_loaders[id(data_loader)] = data_loader
+
+        for data_loader in data_loaders.values():
+            data_loader = getattr(data_loader, 'data_loader', data_loader)
+            if data_loader.num_workers > 0 and data_loader.persistent_workers:
+                iter(data_loader)
+        _set_rng_state(rng_state)
+
+    def _warmup_model(self):
+        # Compile the model on the first batches in advance. The gradients,
+        # buffers and random states are restored afterwards, so that the
+        # training is not affected.
+        rng_state = _get_rng_state()
+        buffers = [b.clone() for b in self.model.buffers()]
+
+        times = dict()
+        for mode in self._scheduled_modes():
+            if mode == 'test':
+                continue
+
+            data_loader = self.data_loaders[mode]
+            if callable(getattr(data_loader.dataset, 'set_state', None)):
+                data_loader.dataset.set_state(mode)
+
+            iterator = iter(data_loader)
+            data = next(iterator, None)
+            if callable(getattr(iterator, 'close', None)):
+                iterator.close()
+            del iterator
+
+            if data is None:
+                continue
+
+            self._mode = mode
+            self.model.train(mode == 'train')
+
+            start = perf_counter()
+            output = self._forward(data)
+
+            if mode == 'train':
+                loss = output.get('loss')
+                if loss is None:
+                    loss = sum(v for k, v in output.items() if 'loss' in k)
+                if torch.is_tensor(loss) and loss.requires_grad:
+                    loss.backward()
+
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+
+            times[mode] = perf_counter() - start
+
+        self.model.zero_grad(set_to_none=True)
+        with torch.no_grad():
+            for buffer, saved in zip(self.model.buffers(), buffers):
+                buffer.copy_(saved)
+
+        _set_rng_state(rng_state)
+
+        self.buffer.update('_compile_time', times)
+
+    def _train_mode(self):
+        self._mode = 'train'
+        self.model.train()
+        self.data_loader = self.data_loaders[self._mode]
+
+        if callable(getattr(self.data_loader.dataset, 'set_state', None)):
+            self.data_loader.dataset.set_state(self._mode)
+
+    def _should_val(self, progress):
+        cfg = self.cur_stage.get('validation')
+        return (cfg is not None and 'val' in self.data_loaders
+                and cfg.get('interval', 0) > 0
+                and progress > cfg.get('offset', 0)
+                and progress % cfg.get('interval', 0) == 0)
+
+    def _val_by_iter(self):
+        return 'iters' in self.cur_stage and self._should_val(
+            self.iter_in_stage)
+
+    def _reset_outputs(self):
+        self.buffer.pop('_out', None)
+        if self._store is not None:
+            self._store.clear()
+
+    def _gather_outputs(self, chunk_size):
+        if self._store is not None:
+            self._store.close()
+            paths = all_gather(self._store.path)
+            if is_main_process():
+                yield [PredictionStore.load(path) for path in paths]
+            return
+
+        blob = self.buffer.pop('_out')
+
+        num_chunks = max(all_gather(len(blob)))
+        num_chunks = (num_chunks + chunk_size - 1) // chunk_size
+
+        for i in range(num_chunks):
+            chunk = blob[i * chunk_size:(i + 1) * chunk_size]
+            blob[i * chunk_size:(i + 1) * chunk_size] = [None] * len(chunk)
+
+            chunk = gather(chunk)
+            if is_main_process():
+                yield chunk
 
     def _call_hook(self, name):
+        # The name of the range is only built when a profiler is running, as
+        # this method is called several times in every iteration
+        if _profiling():
+            with _record_function('hooks/{}'.format(name)):
+                for _, method in self._hook_table[name]:
+                    method(self)
+            return
+
+        for _, method in self._hook_table[name]:
+            method(self)
+
+    def _build_hook_table(self):
+        self._hook_table = {name: [] for name in HOOK_NAMES}
         for hook in self.hooks.values():
-            getattr(hook, name)(self)
+            for name in HOOK_NAMES:
+                method = hook.resolve(name)
+                if method is not None:
+                    self._hook_table[name].append((hook, method))
 
     def reset_states(self):
         self.buffer.clear()
         self._max_stages = 0 if self.stages is None else len(self.stages)
-        self._max_epochs = 0 if self.stages is None else sum(
-            stage['epochs'] for stage in self.stages)
-        self._max_iters = (len(self.data_loaders['train']) if 'train'
-                           in self.data_loaders else 0) * self._max_epochs
+        self._max_epochs = self._max_iters = 0
+
+        if self.stages is not None and 'train' in self.data_loaders:
+            epochs = [self._stage_epochs(stage) for stage in self.stages]
+            self._max_epochs = None if None in epochs else sum(epochs)
+            self._max_iters = sum(
+                self._stage_iters(stage) for stage in self.stages)
+
         self._start_iter = self._stage = self._epoch = self._iter = 0
+        self._stage_start_epoch = self._epoch_start_iter = 0
+        self._epoch_rng_state = self._resume_rng_state = None
 
     def register_hook(self, hook, before=None, overwrite=True, **kwargs):
         """
-        Register a hook or a list of hooks into the engine.
+        Register a hook or a list of hooks into the engine. The methods to be
+        called for each hook name are collected when registering, so that
+        hooks should not be modified after that.
 
         Args:
             hook (list | :obj:`Hook` | dict | str): The hook or list of hooks
@@ -280,6 +587,8 @@ class Engine(object):
             for key in keys[keys.index(before):-1]:
                 self.hooks.move_to_end(key)
 
+        self._build_hook_table()
+
     def unregister_hook(self, hook):
         """
         Unregister a hook or a list of hooks from the engine.
@@ -298,6 +607,8 @@ class Engine(object):
             hook = hook.name
         self.hooks.pop(hook)
 
+        self._build_hook_table()
+
     def load_checkpoint(self, checkpoint, **kwargs):
         """
         Load checkpoint from a file or an URL.
@@ -320,7 +631,11 @@ class Engine(object):
 
     def resume(self, checkpoint, **kwargs):
         """
-        Resume from a checkpoint file.
+        Resume from a checkpoint file. If the checkpoint was saved in the
+        middle of an epoch, the remaining batches of the epoch will be
+        restored by skipping the sampled indices without loading the data.
+        The random states and buffer contents will also be restored if they
+        exist in the checkpoint.
 
         Args:
             checkpoint (dict | str): A dict, a filename or an URL indicatin
@@ -340,16 +655,49 @@ class Engine(object):
 
         load_checkpoint(self.model, checkpoint, logger=self.logger, **kwargs)
 
-        self._epoch = checkpoint['meta']['epoch']
-        self._iter = self._start_iter = checkpoint['meta']['iter']
+        meta = checkpoint['meta']
+
+        self._epoch = meta['epoch']
+        self._iter = self._start_iter = meta['iter']
+
+        if 'epoch_start_iter' in meta and 'stage_start_epoch' in meta:
+            stage_start_epoch = meta['stage_start_epoch']
+            self._epoch_start_iter = meta['epoch_start_iter']
+        elif self._num_batches('train') is not None:
+            stage_start_epoch, self._epoch_start_iter = self._locate_epoch(
+                self._epoch)
+        else:
+            raise KeyError('epoch_start_iter and stage_start_epoch are '
+                           'required to resume from the checkpoint when the '
+                           'length of training data loader is unknown')
+
+        # The stage of an unfinished epoch is determined by its last iteration
+        stage_iter = self._iter - (self.iter_in_epoch > 0)
 
         cumsum, count = 0, 0
         for stage in self.stages:
-            if self._epoch + 1 <= cumsum + stage['epochs']:
+            cumsum += self._stage_iters(stage)
+            if stage_iter < cumsum:
                 break
             count += 1
         self._stage = count
 
+        if self.iter_in_stage == 0:
+            self._stage_start_epoch = self._epoch
+        else:
+            self._stage_start_epoch = stage_start_epoch
+
+        if 'buffer' in checkpoint['meta']:
+            self.buffer.load_state_dict(checkpoint['meta']['buffer'])
+
+        if 'rng_state' in checkpoint['meta']:
+            rng_state = checkpoint['meta']['rng_state']
+            if self.iter_in_epoch > 0 and rng_state['epoch'] is not None:
+                _set_rng_state(rng_state['epoch'])
+                self._resume_rng_state = rng_state['iter']
+            else:
+                _set_rng_state(rng_state['iter'])
+
         if 'optimizer' in checkpoint:
             self.optimizer = build_optimizer(
                 self.cur_stage['optimizer'], params=self.model.parameters())
@@ -359,99 +707,98 @@ class Engine(object):
 
         self.logger.info('Resumed stage {}, epoch {}, iter {}'.format(
             self._stage + 1, self._epoch, self._iter))
-    
-    def log_output(self, output, output_type: str):
-        wandb.log({f"{output_type}_{k}": v for k, v in output.items()})
-        
+
     def train_iter(self, data):
         self._call_hook('before_train_iter')
 
-        output = self.model(data, mode=self._mode, **self._kwargs)
+        output = self._forward(data)
 
         self.losses = {k: v for k, v in output.items() if 'loss' in k}
         if 'loss' not in output:
             self.losses['loss'] = output['loss'] = sum(
                 v for v in self.losses.values())
 
-        for key, value in output.items():
-            self.buffer.update(
-                key,
-                value.detach().cpu() if torch.is_tensor(value) else value)
-        self.log_output(output, "train")
+        self._update_buffer(output)
         self._call_hook('after_train_iter')
         self._iter += 1
 
     def val_iter(self, data):
         self._call_hook('before_val_iter')
 
-        with torch.no_grad():
-            output = self.model(data, mode=self._mode, **self._kwargs)
+        output = self._forward(data)
 
         if any('loss' in key for key in output) and 'loss' not in output:
             output['loss'] = sum(v for k, v in output.items() if 'loss' in k)
 
-        for key, value in output.items():
-            self.buffer.update(
-                key,
-                value.detach().cpu() if torch.is_tensor(value) else value)
-        self.log_output(output, "valid")
+        self._update_buffer(output)
         self._call_hook('after_val_iter')
 
     def test_iter(self, data):
         with torch.no_grad():
             output = self.model(data, mode=self._mode, **self._kwargs)
 
-        for key, value in output.items():
-            self.buffer.update(
-                key,
-                value.detach().cpu() if torch.is_tensor(value) else value)
+        self._update_buffer(output)
 
     def train_epoch(self):
-        self._mode = 'train'
-        self.model.train()
-        self.data_loader = self.data_loaders[self._mode]
-
-        if callable(getattr(self.data_loader.dataset, 'set_state', None)):
-            self.data_loader.dataset.set_state(self._mode)
+        self._train_mode()
 
+        self._epoch_rng_state = _get_rng_state()
         self._call_hook('before_train_epoch')
 
-        for data in self.data_loader:
+        data_loader = self.data_loader
+        if self.iter_in_epoch > 0:
+            data_loader = skip_batches(data_loader, self.iter_in_epoch)
+
+        num_iters = max(self.max_iters_in_epoch - self.iter_in_epoch, 0)
+        for data in _record_iter(islice(data_loader, num_iters), 'data'):
+            self._restore_rng_state()
             self.train_iter(data)
 
+            if self._val_by_iter():
+                self.val_epoch()
+                self._train_mode()
+
+        self._restore_rng_state()
+
         self._call_hook('after_train_epoch')
         self._epoch += 1
+        self._epoch_start_iter = self._iter
 
     def val_epoch(self):
         self.logger.info('Validating...')
         self._mode = 'val'
         self.model.eval()
-        self.buffer.pop('_out', None)
+        self._reset_outputs()
         self.data_loader = self.data_loaders[self._mode]
 
         if callable(getattr(self.data_loader.dataset, 'set_state', None)):
             self.data_loader.dataset.set_state(self._mode)
 
+        # Keep the random states of training unaffected by validation
+        rng_state = _get_rng_state()
+
         self._call_hook('before_val_epoch')
 
-        prog_bar = nncore.ProgressBar(len(self.data_loader))
+        prog_bar = nncore.ProgressBar(self._num_batches(self._mode))
         for data in self.data_loader:
             self.val_iter(data)
             prog_bar.update()
 
         self._call_hook('after_val_epoch')
 
+        _set_rng_state(rng_state)
+
     def test_epoch(self):
         self.logger.info('Evaluating...')
         self._mode = 'test'
         self.model.eval()
-        self.buffer.pop('_out', None)
+        self._reset_outputs()
         self.data_loader = self.data_loaders[self._mode]
 
         if callable(getattr(self.data_loader.dataset, 'set_state', None)):
             self.data_loader.dataset.set_state(self._mode)
 
-        prog_bar = nncore.ProgressBar(len(self.data_loader))
+        prog_bar = nncore.ProgressBar(self._num_batches(self._mode))
         for data in self.data_loader:
             self.test_iter(data)
             prog_bar.update()
@@ -466,54 +813,89 @@ class Engine(object):
             optim = '{}()'.format(
                 self.cur_stage['optimizer'].__class__.__name__)
 
-        self.logger.info('Stage: {}, epochs: {}, optimizer: {}'.format(
-            self._stage + 1, self.cur_stage['epochs'], optim))
+        if 'iters' in self.cur_stage:
+            budget = 'iters: {}'.format(self.cur_stage['iters'])
+        else:
+            budget = 'epochs: {}'.format(self.cur_stage['epochs'])
+
+        self.logger.info('Stage: {}, {}, optimizer: {}'.format(
+            self._stage + 1, budget, optim))
 
-        if self.epoch_in_stage == 0:
+        if self.iter_in_stage == 0:
             self.optimizer = build_optimizer(
                 self.cur_stage['optimizer'], params=self.model.parameters())
-            
-        wandb.config.update({"optimizer": optim_type})
+
         self._call_hook('before_stage')
 
-        for _ in range(self.cur_stage['epochs'] - self.epoch_in_stage):
-            self.train_epoch()
-            cfg = self.cur_stage.get('validation')
-            if (cfg is not None and 'val' in self.data_loaders
-                    and cfg.get('interval', 0) > 0
-                    and self.epoch_in_stage > cfg.get('offset', 0)
-                    and self.epoch_in_stage % cfg.get('interval', 0) == 0):
-                self.val_epoch()
+        if 'iters' in self.cur_stage:
+            while (self.iter_in_stage < self.max_iters_in_stage
+                   or self.iter_in_epoch > 0):
+                start_iter, resumed = self._iter, self.iter_in_epoch > 0
+                self.train_epoch()
+                if self._iter == start_iter and not resumed:
+                    raise RuntimeError('no data in the training data loader')
+        else:
+            for _ in range(self.cur_stage['epochs'] - self.epoch_in_stage):
+                self.train_epoch()
+                if self._should_val(self.epoch_in_stage):
+                    self.val_epoch()
 
         self._call_hook('after_stage')
         self._stage += 1
+        self._stage_start_epoch = self._epoch
 
     def evaluate(self):
         """
         Perform evaluation. This methods is expected to be called after
         validation or testing.
-        """
-        blob = self.buffer.pop('_out')
-        blob = gather(blob)
 
-        if is_main_process():
-            blob = nncore.concat(blob)
+        The outputs are gathered to the main process in chunks of
+        ``chunk_size`` (specified in the ``validation`` field of the stage
+        config, Default: ``1000``) outputs per rank, or loaded from the
+        memory-mapped shards if ``spill_outputs=True``. If the dataset
+        implements ``evaluate_incremental`` and ``finalize``, each chunk will
+        be evaluated and released right after gathering, so that the memory
+        usage is bounded by the chunk size.
+        """
+        dataset = self.data_loader.dataset
 
-            cfg = self.cur_stage.get('validation')
-            if cfg is not None:
-                cfg = cfg.copy()
-                cfg.pop('interval', None)
-                cfg.pop('offset', None)
+        cfg = self.cur_stage.get('validation')
+        if cfg is not None:
+            cfg = cfg.copy()
+            cfg.pop('interval', None)
+            cfg.pop('offset', None)
+        else:
+            cfg = dict()
+
+        chunk_size = cfg.pop('chunk_size', 1000)
+        incremental = callable(getattr(dataset, 'evaluate_incremental', None))
+
+        collected = None
+        for chunk in self._gather_outputs(chunk_size):
+            if incremental:
+                chunk = nncore.concat(chunk)
+                for i in range(0, len(chunk), chunk_size):
+                    dataset.evaluate_incremental(chunk[i:i + chunk_size])
+            elif collected is None:
+                collected = chunk
             else:
-                cfg = dict()
+                for items, part in zip(collected, chunk):
+                    items += part
 
-            output = self.data_loader.dataset.evaluate(
-                blob, logger=self.logger, **cfg)
-            self.log_output(output, "eval")
+        if is_main_process():
+            if incremental:
+                output = dataset.finalize(logger=self.logger, **cfg)
+            else:
+                output = dataset.evaluate(
+                    nncore.concat(collected or []), logger=self.logger, **cfg)
         else:
             output = dict()
 
         sync()
+
+        if self._store is not None:
+            self._store.clear()
+
         return output
 
     def launch(self, eval=False, **kwargs):
@@ -529,6 +911,10 @@ class Engine(object):
         if eval:
             self.test_epoch()
             output = self.evaluate()
+            for hook in self.hooks.values():
+                if callable(getattr(hook, 'write_output', None)):
+                    hook.write_output(self, output)
+            self.pipeline.close()
             self.logger.info(
                 'Evaluation results: ' +
                 ', '.join(['{}: {}'.format(k, v) for k, v in output.items()]))
@@ -536,33 +922,15 @@ class Engine(object):
 
         self.logger.info('Launch engine, host: {}, work_dir: {}'.format(
             nncore.get_host_info(), self.work_dir))
+
+        if self._compiled and self._stage < self._max_stages:
+            self._warmup_model()
+
+        self._warmup_workers()
         self._call_hook('before_launch')
 
         while self._stage < self._max_stages:
             self.run_stage()
 
         self._call_hook('after_launch')
-
-        self.log_model_as_artifact()
-        
-    def log_model_as_artifact(self, model_name="umt-model", artifact_name="umt-model"):
-        """
-        Log the model as a wandb artifact.
-        
-        Args:
-            model_name (str): Name for the saved model file.
-            artifact_name (str): Name for the wandb artifact.
-        """
-        # Save the model to a file
-        model_path = f"{self.work_dir}/{model_name}.pth"
-        torch.save(self.model.state_dict(), model_path)
-        
-        # Create a wandb artifact and log it
-        artifact = wandb.Artifact(
-            name=artifact_name,
-            type="model",
-            description="Trained model weights",
-            metadata=dict(epoch=self._epoch)
-        )
-        artifact.add_file(model_path)
-        wandb.log_artifact(artifact)
+        self.pipeline.close()
@@ -7,15 +7,16 @@ from .eval import EvalHook
 from .events import (CommandLineWriter, EventWriterHook, JSONWriter,
                      TensorboardWriter, WandbWriter)
 from .lr_updater import LrUpdaterHook
-from .memory import EmptyCacheHook
+from .memory import EmptyCacheHook, MemoryMonitorHook
 from .optimizer import OptimizerHook
 from .precise_bn import PreciseBNHook
+from .profiler import ProfilerHook
 from .sampler_seed import SamplerSeedHook
 from .timer import TimerHook
 
 __all__ = [
     'Hook', 'CheckpointHook', 'ClosureHook', 'EvalHook', 'CommandLineWriter',
     'EventWriterHook', 'JSONWriter', 'TensorboardWriter', 'WandbWriter',
-    'LrUpdaterHook', 'EmptyCacheHook', 'OptimizerHook', 'PreciseBNHook',
-    'SamplerSeedHook', 'TimerHook'
+    'LrUpdaterHook', 'EmptyCacheHook', 'MemoryMonitorHook', 'OptimizerHook',
+    'PreciseBNHook', 'ProfilerHook', 'SamplerSeedHook', 'TimerHook'
 ]
@@ -22,11 +22,13 @@ class Hook(metaclass=ABCMeta):
     Each hook can implement several methods. In hook methods, users should
     provide an argument ``engine`` to access more properties about the context.
     All hooks will be called one by one according to the order in
-    :obj:`engine.hooks`.
+    :obj:`engine.hooks`. Methods that are not implemented by a hook will be
+    skipped by the engine.
     """
 
     def __init__(self, name=None):
         self._name = name or self.__class__.__name__
+        self._defaults = dict()
 
         for hook_name in HOOK_NAMES:
             if hasattr(self, hook_name):
@@ -35,15 +37,18 @@ class Hook(metaclass=ABCMeta):
             token = hook_name.split('_')
 
             if len(token) == 3:
+                generic = '{}_{}'.format(token[0], token[2])
 
-                def _default_hook(self, engine):
-                    getattr(self, '{}_{}'.format(token[0], token[2]))(engine)
+                def _default_hook(self, engine, generic=generic):
+                    getattr(self, generic)(engine)
             else:
 
                 def _default_hook(self, engine):
                     pass
 
-            setattr(self, hook_name, MethodType(_default_hook, self))
+            method = MethodType(_default_hook, self)
+            setattr(self, hook_name, method)
+            self._defaults[hook_name] = method
 
     def __eq__(self, hook):
         return self._name == hook.name
@@ -51,6 +56,27 @@ class Hook(metaclass=ABCMeta):
     def __repr__(self):
         return '{}()'.format(self._name)
 
+    def resolve(self, name):
+        """
+        Resolve the method to be called for a hook name. The default methods
+        for specific stages (e.g. ``before_train_iter``) are resolved to the
+        generic ones (e.g. ``before_iter``).
+
+        Args:
+            name (str): Name of the hook.
+
+        Returns:
+            function | None: The method to be called, or ``None`` if it is
+                not implemented.
+        """
+        method = getattr(self, name)
+        if method is not self._defaults.get(name):
+            return method
+
+        token = name.split('_')
+        if len(token) == 3:
+            return self.resolve('{}_{}'.format(token[0], token[2]))
+
     def every_n_stages(self, engine, n):
         return (engine.stage + 1) % n == 0 if n > 0 else False
 
@@ -79,19 +105,22 @@ class Hook(metaclass=ABCMeta):
         return engine.iter_in_epoch == 0
 
     def last_epoch_in_stage(self, engine):
-        return engine.epoch_in_stage + 1 == engine.cur_stage['epochs']
+        if engine.max_epochs_in_stage is None:
+            return engine.iter_in_stage >= engine.max_iters_in_stage
+        return engine.epoch_in_stage + 1 == engine.max_epochs_in_stage
 
     def last_iter_in_stage(self, engine):
-        return engine.iter_in_stage + 1 == len(
-            engine.data_loaders['train']) * engine.cur_stage['epochs']
+        return engine.iter_in_stage + 1 == engine.max_iters_in_stage
 
     def last_iter_in_epoch(self, engine):
-        return engine.iter_in_epoch + 1 == len(engine.data_loaders['train'])
+        return engine.iter_in_epoch + 1 == engine.max_iters_in_epoch
 
     def last_stage(self, engine):
         return engine.stage + 1 == engine.max_stages
 
     def last_epoch(self, engine):
+        if engine.max_epochs is None:
+            return engine.iter >= engine.max_iters
         return engine.epoch + 1 == engine.max_epochs
 
     def last_iter(self, engine):
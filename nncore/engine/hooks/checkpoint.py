@@ -1,9 +1,13 @@
 # Copyright (c) Ye Liu. Licensed under the MIT License.
 
+import os
+import re
+
 import nncore
 from ..builder import HOOKS
 from ..comm import main_only
-from ..utils import save_checkpoint
+from ..saver import CheckpointSaver
+from ..utils import _get_rng_state, save_checkpoint
 from .base import Hook
 
 
@@ -13,9 +17,21 @@ class CheckpointHook(Hook):
     Save checkpoints periodically during training. Checkpoint of the last
     epoch will always be saved regardless of ``interval``.
 
+    Checkpoints contain the random states and the buffer contents, so that
+    :obj:`Engine.resume` can restart from the exact iteration where they
+    were saved, including the middle of an epoch.
+
     Args:
         interval (int, optional): The interval of epochs to save checkpoints.
             Default: ``1``.
+        iter_interval (int, optional): The interval of iterations to save
+            checkpoints. ``-1`` means not saving checkpoints during epochs.
+            It is expected to be a multiple of the interval of
+            :obj:`OptimizerHook`. Default: ``-1``.
+        max_keep (int, optional): Maximum number of checkpoints to be kept in
+            the output directory. Older checkpoints will be removed once
+            they are completely written. ``-1`` means keeping all the
+            checkpoints. Default: ``-1``.
         save_optimizer (bool, optional): Whether to incorperate optimizer
             statuses into checkpoints. Default: ``True``.
         create_symlink (bool, optional): Whether to create a symlink to the
@@ -24,18 +40,98 @@ class CheckpointHook(Hook):
         out (str | None, optional): Path to the output directory. If not
             specified, :obj:`enging.work_dir` will be used as the default path.
             Default: ``None``.
+        async_save (bool, optional): Whether to save checkpoints
+            asynchronously using :obj:`CheckpointSaver`, so that training is
+            only blocked by copying the states to host memory. Default:
+            ``False``.
+        max_inflight (int, optional): Maximum number of checkpoints being
+            saved at the same time. This argument is valid only when
+            ``async_save=True``. Default: ``1``.
+        format (str, optional): Format of the checkpoints. Expected values
+            include ``'pth'`` and ``'safetensors'``, where the latter stands
+            for the flat format that can be memory-mapped when loading. See
+            :obj:`save_checkpoint` for details. Default: ``'pth'``.
     """
 
     def __init__(self,
                  interval=1,
+                 iter_interval=-1,
+                 max_keep=-1,
                  save_optimizer=True,
                  create_symlink=False,
-                 out=None):
+                 out=None,
+                 async_save=False,
+                 max_inflight=1,
+                 format='pth'):
         super(CheckpointHook, self).__init__()
         self._interval = interval
+        self._iter_interval = iter_interval
+        self._max_keep = max_keep
         self._save_optimizer = save_optimizer
         self._create_symlink = create_symlink
         self._out = out
+        self._saver = CheckpointSaver(
+            max_inflight=max_inflight) if async_save else None
+        self._format = format
+        self._saved = []
+        self._writing = set()
+
+    def _epoch_to_save(self, engine):
+        return self.last_epoch(engine) or self.every_n_epochs(
+            engine, self._interval)
+
+    def _prune(self):
+        if self._max_keep <= 0:
+            return
+
+        # Checkpoints still being written by the saver are skipped, as the
+        # pending renames would bring them back after removal
+        num_outdated = len(self._saved) - self._max_keep
+        for filepath in self._saved[:max(num_outdated, 0)]:
+            if filepath not in self._writing:
+                nncore.remove(filepath)
+                self._saved.remove(filepath)
+
+    def _save(self, engine, filename, meta):
+        filepath = nncore.join(self._out, filename)
+        optimizer = engine.optimizer if self._save_optimizer else None
+
+        meta.update(
+            stages=[
+                stage.to_dict() if isinstance(stage, nncore.CfgNode) else stage
+                for stage in engine.stages
+            ],
+            rng_state=dict(
+                epoch=engine.epoch_rng_state, iter=_get_rng_state()),
+            buffer={
+                k: v
+                for k, v in engine.buffer.state_dict().items() if k != '_out'
+            })
+
+        engine.logger.info('Saving checkpoint to {}...'.format(filepath))
+
+        symlink = nncore.join(self._out, 'latest.' + self._format)
+
+        if self._saver is not None:
+            self._writing.add(filepath)
+            self._saver.save(
+                engine.model,
+                filepath,
+                optimizer=optimizer,
+                meta=meta,
+                symlink=symlink if self._create_symlink else None,
+                callback=self._writing.discard)
+        else:
+            save_checkpoint(
+                engine.model, filepath, optimizer=optimizer, meta=meta)
+            if self._create_symlink:
+                nncore.symlink(filename, symlink)
+
+        if filepath in self._saved:
+            self._saved.remove(filepath)
+        self._saved.append(filepath)
+
+        self._prune()
 
     @main_only
     def before_launch(self, engine):
@@ -43,26 +139,43 @@ class CheckpointHook(Hook):
             self._out = engine.work_dir
         nncore.mkdir(self._out)
 
+        self._saved = sorted([
+            f for f in nncore.ls(self._out, ext=self._format, join_path=True)
+            if re.match(r'(epoch|iter)_\d+\.', nncore.base_name(f))
+        ],
+                             key=os.path.getmtime)
+
     @main_only
-    def after_train_epoch(self, engine):
-        if (not self.last_epoch(engine)
-                and not self.every_n_epochs(engine, self._interval)):
+    def after_launch(self, engine):
+        if self._saver is not None:
+            self._saver.close()
+            self._prune()
+
+    @main_only
+    def after_train_iter(self, engine):
+        if not self.every_n_iters(engine, self._iter_interval):
             return
 
-        filename = 'epoch_{}.pth'.format(engine.epoch + 1)
-        filepath = nncore.join(self._out, filename)
-        optimizer = engine.optimizer if self._save_optimizer else None
+        if self.last_iter_in_epoch(engine) and self._epoch_to_save(engine):
+            return
 
+        filename = 'iter_{}.{}'.format(engine.iter + 1, self._format)
         meta = dict(
-            epoch=engine.epoch + 1,
-            iter=engine.iter,
-            stages=[
-                stage.to_dict() if isinstance(stage, nncore.CfgNode) else stage
-                for stage in engine.stages
-            ])
+            epoch=engine.epoch,
+            iter=engine.iter + 1,
+            epoch_start_iter=engine.iter - engine.iter_in_epoch,
+            stage_start_epoch=engine.epoch - engine.epoch_in_stage)
+        self._save(engine, filename, meta)
 
-        engine.logger.info('Saving checkpoint to {}...'.format(filepath))
-        save_checkpoint(engine.model, filepath, optimizer=optimizer, meta=meta)
+    @main_only
+    def after_train_epoch(self, engine):
+        if not self._epoch_to_save(engine):
+            return
 
-        if self._create_symlink:
-            nncore.symlink(filename, nncore.join(self._out, 'latest.pth'))
+        filename = 'epoch_{}.{}'.format(engine.epoch + 1, self._format)
+        meta = dict(
+            epoch=engine.epoch + 1,
+            iter=engine.iter,
+            epoch_start_iter=engine.iter,
+            stage_start_epoch=engine.epoch - engine.epoch_in_stage)
+        self._save(engine, filename, meta)
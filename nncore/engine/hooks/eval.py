@@ -1,10 +1,12 @@
 # Copyright (c) Ye Liu. Licensed under the MIT License.
 
+import nncore
 from ..builder import HOOKS
 from .base import Hook
 
 
 @HOOKS.register()
+@nncore.bind_getter('run_test')
 class EvalHook(Hook):
     """
     Perform evaluation periodically during training.
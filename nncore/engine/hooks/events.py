@@ -3,14 +3,15 @@
 from abc import ABCMeta, abstractmethod
 from collections import OrderedDict
 from datetime import timedelta
+from functools import partial
 
 import torch
-import torch.distributed as dist
 from torch.utils.data import DataLoader
 
 import nncore
 from ..builder import HOOKS
-from ..comm import get_world_size, is_main_process, main_only
+from ..comm import is_main_process, main_only
+from ..utils import _unwrap_model
 from .base import Hook
 
 WRITERS = nncore.Registry('writer')
@@ -23,6 +24,8 @@ class Writer(metaclass=ABCMeta):
 
     The inherited classes must provide a :obj:`write` method to write logs, and
     optionally override :obj:`open` or :obj:`close` method to handle files.
+    Heavy I/O operations are expected to be submitted to
+    :obj:`engine.pipeline` so that they run in a background thread.
     """
 
     def _collect_metrics(self, engine, window_size):
@@ -48,6 +51,18 @@ class Writer(metaclass=ABCMeta):
             if '_data_time' in engine.buffer.keys():
                 metrics['data_time'] = engine.buffer.mean(
                     '_data_time', window_size=window_size)
+            if '_hidden_data_time' in engine.buffer.keys():
+                metrics['hidden_data_time'] = engine.buffer.mean(
+                    '_hidden_data_time', window_size=window_size)
+
+            if '_train_memory' in engine.buffer.keys():
+                metrics['memory'] = engine.buffer.latest('_train_memory')
+
+            for key in ('forward', 'backward', 'step', 'hook'):
+                key = '_{}_time'.format(key)
+                if key in engine.buffer.keys():
+                    metrics[key[1:]] = engine.buffer.mean(
+                        key, window_size=window_size)
 
         return metrics
 
@@ -73,7 +88,7 @@ class CommandLineWriter(Writer):
 
         if engine.mode == 'train':
             log = 'Epoch [{}][{}/{}] lr: {:.5f}'.format(
-                metrics['epoch'], metrics['iter'], len(engine.data_loader),
+                metrics['epoch'], metrics['iter'], engine.max_iters_in_epoch,
                 metrics['lr'])
 
             if '_total_time' in engine.buffer.keys():
@@ -85,19 +100,19 @@ class CommandLineWriter(Writer):
                                 num_iters_passed))
                 log += ', eta: {}'.format(eta)
 
-            for key in ('time', 'data_time'):
+            for key in ('time', 'data_time', 'hidden_data_time',
+                        'forward_time', 'backward_time', 'step_time'):
                 if key in metrics:
                     log += ', {}: {:.3f}'.format(key, metrics[key])
 
-            if next(engine.model.parameters()).device != torch.device('cpu'):
+            if 'peak' in metrics.get('memory', dict()):
+                log += ', memory: {}'.format(int(metrics['memory']['peak']))
+            elif next(engine.model.parameters()).device.type == 'cuda':
                 mem = torch.cuda.max_memory_allocated()
-                mem_mb = torch.IntTensor([int(mem / (1024 * 1024))]).cuda()
-                if get_world_size() > 1:
-                    dist.reduce(mem_mb, 0, op=dist.ReduceOp.MAX)
-                log += ', memory: {}'.format(mem_mb.item())
+                log += ', memory: {}'.format(int(mem / (1024 * 1024)))
         else:
             log = 'Epoch ({}) [{}][{}]'.format(engine.mode, metrics['epoch'],
-                                               len(engine.data_loader))
+                                               window_size)
 
         if not is_main_process():
             return
@@ -157,6 +172,9 @@ class JSONWriter(Writer):
                 metrics[key] = engine.buffer.avg(key, window_size=window_size)
 
         filename = nncore.join(engine.work_dir, self._filename)
+        engine.pipeline.submit(partial(self._dump, filename), metrics)
+
+    def _dump(self, filename, metrics):
         with open(filename, 'a+') as f:
             nncore.dump(metrics, f, format='json')
             f.write('\n')
@@ -203,8 +221,14 @@ class TensorboardWriter(Writer):
     def close(self, engine):
         self._writer.close()
 
+    def _add(self, global_step, records):
+        for log_type, tag, record in records:
+            add_func = getattr(self._writer, 'add_{}'.format(log_type))
+            add_func(tag, record, global_step=global_step)
+
     @main_only
     def write(self, engine, window_size):
+        records = []
         for key in engine.buffer.keys():
             if key.startswith('_'):
                 continue
@@ -220,27 +244,42 @@ class TensorboardWriter(Writer):
 
                 tag = '{}/{}'.format(''.join(tokens[:-2]), engine.mode)
                 record = engine.buffer.latest(key)
-                add_func = getattr(self._writer, 'add_{}'.format(log_type))
-                add_func(tag, record, global_step=engine.iter + 1)
             else:
                 tag = '{}/{}'.format(key, engine.mode)
                 record = engine.buffer.avg(key, window_size=window_size)
+                log_type = 'scalars' if isinstance(record, dict) else 'scalar'
 
-                if isinstance(record, dict):
-                    self._writer.add_scalars(
-                        tag, record, global_step=engine.iter + 1)
-                else:
-                    self._writer.add_scalar(
-                        tag, record, global_step=engine.iter + 1)
+            records.append((log_type, tag, record))
+
+        engine.pipeline.submit(partial(self._add, engine.iter + 1), records)
 
 
 @WRITERS.register()
 class WandbWriter(Writer):
     """
-    Write logs to Weight & Bias.
+    Write logs to Weight & Bias. :obj:`wandb` is imported only when the writer
+    is opened, so that it is not required unless this writer is used.
+
+    Args:
+        watch (str | None, optional): The type of histograms to be logged by
+            :obj:`wandb.watch`. Expected values include ``'gradients'``,
+            ``'parameters'``, ``'all'``, and ``None``. Note that watching the
+            model adds hooks to all the parameters, which slows down the
+            back propagation. ``None`` means not watching the model. Default:
+            ``None``.
+        watch_freq (int, optional): The interval of iterations to log the
+            histograms. Default: ``1000``.
+        log_model (bool, optional): Whether to save the final model and
+            upload it as an artifact when closing. Default: ``False``.
+        **kwargs: The arguments of :obj:`wandb.init`, e.g. ``project``. The
+            ``mode`` can be ``'offline'`` for syncing later, or
+            ``'disabled'`` for making all the calls no-ops.
     """
 
-    def __init__(self, **kwargs):
+    def __init__(self, watch=None, watch_freq=1000, log_model=False, **kwargs):
+        self._watch = watch
+        self._watch_freq = watch_freq
+        self._log_model = log_model
         self._kwargs = kwargs
 
     def open(self, engine):
@@ -251,16 +290,44 @@ class WandbWriter(Writer):
             config=engine.meta,
             **self._kwargs)
 
+        optimizers = [
+            stage['optimizer']['type'] if isinstance(stage['optimizer'], dict)
+            else stage['optimizer'].__class__.__name__
+            for stage in engine.stages
+        ]
+        self._writer.config.update(
+            dict(optimizer=optimizers), allow_val_change=True)
+
+        if self._watch is not None:
+            self._writer.watch(
+                engine.model, log=self._watch, log_freq=self._watch_freq)
+
+    def close(self, engine):
+        if self._log_model:
+            filename = nncore.join(engine.work_dir, 'model.pth')
+            torch.save(_unwrap_model(engine.model).state_dict(), filename)
+
+            artifact = self._writer.Artifact(
+                name=nncore.base_name(engine.work_dir),
+                type='model',
+                metadata=dict(epoch=engine.epoch, iter=engine.iter))
+            artifact.add_file(filename)
+            self._writer.log_artifact(artifact)
+
+        self._writer.finish()
+
     @main_only
     def write(self, engine, window_size):
+        records = dict()
         for key in engine.buffer.keys():
             if key.startswith('_') or key.endswith('_'):
                 continue
 
             tag = '{}/{}'.format(key, engine.mode)
-            record = engine.buffer.avg(key, window_size=window_size)
+            records[tag] = engine.buffer.avg(key, window_size=window_size)
 
-            self._writer.log({tag: record})
+        engine.pipeline.submit(
+            partial(self._writer.log, step=engine.iter + 1), records)
 
 
 @HOOKS.register()
@@ -276,8 +343,9 @@ class EventWriterHook(Hook):
             Default: ``50``.
         writers (list[:obj:`Writer`] or list[str], optional): The list of
             writers or name of writers to use. Currently supported writers
-            include :obj:`CommandLineWriter`, :obj:`JSONWriter` and
-            :obj:`TensorboardWriter`. Default: ``['CommandLineWriter']``.
+            include :obj:`CommandLineWriter`, :obj:`JSONWriter`,
+            :obj:`TensorboardWriter`, and :obj:`WandbWriter`. Default:
+            ``['CommandLineWriter', 'JSONWriter']``.
     """
 
     def __init__(self,
@@ -285,6 +353,7 @@ class EventWriterHook(Hook):
                  writers=['CommandLineWriter', 'JSONWriter']):
         super(EventWriterHook, self).__init__()
         self._interval = interval
+        self._val_iters = 0
         self._writers = [
             nncore.build_object(w, WRITERS)
             if isinstance(w, dict) else WRITERS.get(w)() for w in writers
@@ -299,6 +368,28 @@ class EventWriterHook(Hook):
             if not key.startswith('_'):
                 engine.buffer.pop(key)
 
+    @main_only
+    def write_output(self, engine, output):
+        """
+        Write the evaluation results when the engine is launched with
+        ``eval=True``, in which case the hook methods are not called. The
+        writers are opened and closed within this method.
+
+        Args:
+            engine (:obj:`Engine`): The engine to be logged.
+            output (dict): The evaluation results.
+        """
+        for key, value in output.items():
+            engine.buffer.update(key, value)
+        engine.buffer.update('_avg_factor', 1)
+
+        self.before_launch(engine)
+        self._write(engine, 1)
+        self._clear_buffer(engine)
+        self.after_launch(engine)
+
+        engine.buffer.pop('_avg_factor')
+
     @main_only
     def before_launch(self, engine):
         for w in self._writers:
@@ -306,6 +397,7 @@ class EventWriterHook(Hook):
 
     @main_only
     def after_launch(self, engine):
+        engine.pipeline.flush()
         for w in self._writers:
             w.close(engine)
 
@@ -316,11 +408,17 @@ class EventWriterHook(Hook):
 
         self._write(
             engine,
-            len(engine.data_loader) % self._interval or self._interval
+            engine.max_iters_in_epoch % self._interval or self._interval
             if self.last_iter_in_epoch(engine) else self._interval)
         self._clear_buffer(engine)
 
+    def before_val_epoch(self, engine):
+        self._val_iters = 0
+
+    def after_val_iter(self, engine):
+        self._val_iters += 1
+
     @main_only
     def after_val_epoch(self, engine):
-        self._write(engine, len(engine.data_loader))
+        self._write(engine, self._val_iters)
         self._clear_buffer(engine)
@@ -91,6 +91,12 @@ class LrUpdaterHook(Hook):
     def before_stage(self, engine):
         self._schd_cfg = engine.cur_stage.get('lr_schedule')
         self._warm_cfg = engine.cur_stage.get('warmup')
+
+        if engine.max_epochs_in_stage is None:
+            for cfg in (self._schd_cfg, self._warm_cfg):
+                assert cfg is None or cfg['type'] == 'iter', (
+                    'epoch-based policies are not supported when the number '
+                    'of epochs is unknown')
         for group in engine.optimizer.param_groups:
             group.setdefault('base_lr', group['lr'])
 
@@ -98,7 +104,7 @@ class LrUpdaterHook(Hook):
         if self._schd_cfg is not None and self._schd_cfg['type'] == 'epoch':
             cfg = self._schd_cfg.copy()
             cfg['progress'] = engine.epoch_in_stage
-            cfg['max_progress'] = engine.cur_stage['epochs']
+            cfg['max_progress'] = engine.max_epochs_in_stage
             lr_groups = self._update_lr(engine, cfg)
         else:
             lr_groups = self._base_lr(engine)
@@ -115,8 +121,7 @@ class LrUpdaterHook(Hook):
         if self._schd_cfg is not None and self._schd_cfg['type'] == 'iter':
             cfg = self._schd_cfg.copy()
             cfg['progress'] = engine.iter_in_stage
-            cfg['max_progress'] = engine.cur_stage['epochs'] * len(
-                engine.data_loader)
+            cfg['max_progress'] = engine.max_iters_in_stage
             lr_groups = self._update_lr(engine, cfg)
         else:
             lr_groups = self._base_lr(engine)
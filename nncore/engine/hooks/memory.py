@@ -1,5 +1,7 @@
 # Copyright (c) Ye Liu. Licensed under the MIT License.
 
+import gc
+import os
 from types import MethodType
 
 import torch
@@ -7,11 +9,39 @@ import torch
 from ..builder import HOOKS
 from .base import HOOK_NAMES, Hook
 
+_MB = 1024 * 1024
+
+
+def _get_rss():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _count_tensors():
+    num_tensors = 0
+    for obj in gc.get_objects():
+        try:
+            num_tensors += torch.is_tensor(obj)
+        except ReferenceError:
+            continue
+    return num_tensors
+
 
 @HOOKS.register()
 class EmptyCacheHook(Hook):
     """
-    Empty cache periodically during training.
+    Empty cache periodically during training. Releasing the cached memory
+    unconditionally often slows down training, so :obj:`MemoryMonitorHook`
+    with ``empty_cache_thr`` is recommended instead.
 
     Args:
         names (list[str], optional): The list of hook names to empty cache.
@@ -34,3 +64,118 @@ class EmptyCacheHook(Hook):
         for name in names:
             assert name in HOOK_NAMES
             setattr(self, name, MethodType(_empty_cache, self))
+
+
+@HOOKS.register()
+class MemoryMonitorHook(Hook):
+    """
+    Monitor the memory usage during training. The statistics are saved into
+    :obj:`engine.buffer` as dicts, including ``_train_memory`` (sampled every
+    ``interval`` iterations), ``_val_memory`` (sampled after validation) and
+    ``_epoch_memory`` (sampled after each training epoch). Memory sizes are
+    measured in MB.
+
+    The statistics contain the resident set size of the process (``rss``).
+    When the model is on GPU, they also contain the memory allocated by
+    tensors (``allocated``), reserved by the caching allocator
+    (``reserved``), the peak allocated memory since the last sample
+    (``peak``), and the fragmentation ratio of the cache (``frag``), i.e.
+    the ratio of inactive split blocks to the reserved memory. The number of
+    live tensors (``tensors``) is also counted after each epoch.
+
+    If the memory grows after each of the last ``leak_epochs`` epochs, and
+    the total growth exceeds ``leak_thr``, a warning will be logged. The
+    allocated memory is checked on GPU, and the resident set size on CPU.
+
+    Args:
+        interval (int, optional): The interval of iterations to sample the
+            statistics during training. Default: ``50``.
+        empty_cache_thr (float | None, optional): The fragmentation ratio
+            above which the cached memory will be released when sampling.
+            ``None`` means never releasing the cache. Default: ``None``.
+        leak_epochs (int, optional): Number of consecutive epochs with memory
+            growth to report a possible leak. ``0`` means not detecting
+            leaks. Default: ``3``.
+        leak_thr (float, optional): Minimum memory growth in MB to report a
+            possible leak. Default: ``64``.
+    """
+
+    def __init__(self,
+                 interval=50,
+                 empty_cache_thr=None,
+                 leak_epochs=3,
+                 leak_thr=64):
+        super(MemoryMonitorHook, self).__init__()
+        self._interval = interval
+        self._empty_cache_thr = empty_cache_thr
+        self._leak_epochs = leak_epochs
+        self._leak_thr = leak_thr
+        self._cuda = False
+        self._history = []
+
+    def _sample(self, engine):
+        stats = dict(rss=_get_rss() / _MB)
+
+        if self._cuda:
+            cuda_stats = torch.cuda.memory_stats()
+            allocated = cuda_stats.get('allocated_bytes.all.current', 0)
+            reserved = cuda_stats.get('reserved_bytes.all.current', 0)
+            inactive = cuda_stats.get('inactive_split_bytes.all.current', 0)
+
+            stats['allocated'] = allocated / _MB
+            stats['reserved'] = reserved / _MB
+            stats['peak'] = torch.cuda.max_memory_allocated() / _MB
+            stats['frag'] = inactive / reserved if reserved > 0 else 0
+
+            if (self._empty_cache_thr is not None
+                    and stats['frag'] > self._empty_cache_thr):
+                torch.cuda.empty_cache()
+
+            torch.cuda.reset_peak_memory_stats()
+
+        return stats
+
+    def _check_leak(self, engine, stats):
+        key = 'allocated' if self._cuda else 'rss'
+        self._history.append((stats[key], stats['tensors']))
+        self._history = self._history[-self._leak_epochs - 1:]
+
+        if len(self._history) <= self._leak_epochs:
+            return
+
+        memory = [h[0] for h in self._history]
+        if (all(a < b for a, b in zip(memory[:-1], memory[1:]))
+                and memory[-1] - memory[0] > self._leak_thr):
+            engine.logger.warning(
+                'Possible memory leak: {} memory grew by {:.1f} MB and the '
+                'number of tensors changed by {} in the last {} epochs'.format(
+                    'GPU' if self._cuda else 'host', memory[-1] - memory[0],
+                    self._history[-1][1] - self._history[0][1],
+                    self._leak_epochs))
+
+    def before_launch(self, engine):
+        param = next(engine.model.parameters(), None)
+        self._cuda = param is not None and param.device.type == 'cuda'
+        if self._cuda:
+            torch.cuda.reset_peak_memory_stats()
+
+    def before_train_iter(self, engine):
+        # Sample before the iteration where the logs are written, so that the
+        # statistics are available regardless of the order of hooks
+        if self.every_n_iters_in_epoch(engine, self._interval):
+            engine.buffer.update('_train_memory', self._sample(engine))
+
+    def before_val_epoch(self, engine):
+        if self._cuda:
+            torch.cuda.reset_peak_memory_stats()
+
+    def after_val_epoch(self, engine):
+        engine.buffer.update('_val_memory', self._sample(engine))
+
+    def after_train_epoch(self, engine):
+        stats = self._sample(engine)
+        stats['tensors'] = _count_tensors()
+        engine.buffer.update('_epoch_memory', stats)
+
+        if self._leak_epochs > 0:
+            self._check_leak(engine, stats)
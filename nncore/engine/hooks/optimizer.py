@@ -2,13 +2,17 @@
 
 from collections import OrderedDict
 
+import torch
 import torch.distributed as dist
 from torch._utils import (_flatten_dense_tensors, _take_tensors,
                           _unflatten_dense_tensors)
+from torch.nn.parallel import DistributedDataParallel
 from torch.nn.utils import clip_grad
 
+from nncore.parallel import NNDistributedDataParallel
 from ..builder import HOOKS
 from ..comm import is_distributed
+from ..utils import _record_function
 from .base import Hook
 
 
@@ -16,7 +20,16 @@ from .base import Hook
 class OptimizerHook(Hook):
     """
     Perform back propagation and update parameters of the model periodically.
-    This hook supports CPU, single GPU and distributed training.
+    This hook supports CPU, single GPU and distributed training. If the
+    ``amp`` field is specified in the stage config, the losses will be scaled
+    by a :obj:`torch.amp.GradScaler`, and the gradients will be unscaled
+    before clipping. Steps with inf or nan gradients will be skipped.
+
+    When ``interval > 1``, gradients are accumulated over several iterations
+    and the losses are scaled by the number of accumulated iterations before
+    back propagation. If the model is wrapped by
+    :obj:`NNDistributedDataParallel`, gradient synchronization will be skipped
+    on the intermediate iterations.
 
     Args:
         interval (int, optional): The interval of iterations to update
@@ -25,13 +38,28 @@ class OptimizerHook(Hook):
             distributed training. Default: ``True``.
         bucket_size_mb (int, optional): Size of the bucket. ``-1`` means not
             restricting the bucket size. Default: ``-1``.
+        overlap (bool, optional): Whether to overlap gradient all-reduce with
+            back propagation in distributed training. If ``True``, gradients
+            will be grouped into buckets (bounded by ``bucket_size_mb``) in
+            the reverse order of parameters, and each bucket will be reduced
+            asynchronously as soon as all of its gradients are ready. The
+            optimizer step then only waits for the outstanding reductions.
+            Default: ``False``.
     """
 
-    def __init__(self, interval=1, coalesce=True, bucket_size_mb=-1):
+    def __init__(self,
+                 interval=1,
+                 coalesce=True,
+                 bucket_size_mb=-1,
+                 overlap=False):
         super(OptimizerHook, self).__init__()
         self._interval = interval
         self._coalesce = coalesce
         self._bucket_size_mb = bucket_size_mb
+        self._overlap = overlap
+        self._hook_handles = []
+        self._grad_accs = []
+        self._no_sync = None
 
     def _allreduce_coalesced(self, tensors, world_size):
         if self._bucket_size_mb > 0:
@@ -66,38 +94,186 @@ class OptimizerHook(Hook):
             for tensor in grads:
                 dist.all_reduce(tensor.div_(world_size))
 
+    def _build_buckets(self, params):
+        bucket_size_bytes = self._bucket_size_mb * 1024 * 1024
+
+        buckets, size, tp = [], 0, None
+        for param in reversed(params):
+            nbytes = param.numel() * param.element_size()
+            if len(buckets) == 0 or param.type() != tp or (
+                    self._bucket_size_mb > 0
+                    and size + nbytes > bucket_size_bytes):
+                buckets.append([])
+                size, tp = 0, param.type()
+            buckets[-1].append(param)
+            size += nbytes
+
+        return buckets
+
+    def _register_grad_hooks(self, engine):
+        params = [p for p in engine.model.parameters() if p.requires_grad]
+
+        self._buckets = self._build_buckets(params)
+        self._bucket_inds = {
+            id(p): i
+            for i, bucket in enumerate(self._buckets)
+            for p in bucket
+        }
+        self._reset_buckets()
+
+        for param in params:
+            if hasattr(param, 'register_post_accumulate_grad_hook'):
+                handle = param.register_post_accumulate_grad_hook(
+                    self._on_grad_ready)
+            else:
+                grad_acc = param.expand_as(param).grad_fn.next_functions[0][0]
+                handle = grad_acc.register_hook(
+                    lambda *args, p=param: self._on_grad_ready(p))
+                self._grad_accs.append(grad_acc)
+            self._hook_handles.append(handle)
+
+    def _remove_grad_hooks(self):
+        for handle in self._hook_handles:
+            handle.remove()
+        self._hook_handles = []
+        self._grad_accs = []
+
+    def _reset_buckets(self):
+        self._num_ready = [0] * len(self._buckets)
+        self._next_bucket = 0
+        self._works = []
+        self._sync = False
+
+    def _on_grad_ready(self, param):
+        if not self._sync:
+            return
+
+        ind = self._bucket_inds[id(param)]
+        self._num_ready[ind] += 1
+
+        while (self._next_bucket < len(self._buckets)
+               and self._num_ready[self._next_bucket] == len(
+                   self._buckets[self._next_bucket])):
+            self._launch_bucket(self._next_bucket)
+            self._next_bucket += 1
+
+    def _launch_bucket(self, ind):
+        bucket = self._buckets[ind]
+        for param in bucket:
+            if param.grad is None:
+                param.grad = torch.zeros_like(param)
+
+        grads = [param.grad.data for param in bucket]
+        flat_tensors = _flatten_dense_tensors(grads)
+        work = dist.all_reduce(flat_tensors, async_op=True)
+        self._works.append((work, grads, flat_tensors))
+
+    def _wait_buckets(self, divisor):
+        while self._next_bucket < len(self._buckets):
+            self._launch_bucket(self._next_bucket)
+            self._next_bucket += 1
+
+        for work, grads, flat_tensors in self._works:
+            work.wait()
+            flat_tensors.div_(divisor)
+            for tensor, synced in zip(
+                    grads, _unflatten_dense_tensors(flat_tensors, grads)):
+                tensor.copy_(synced)
+
+        self._reset_buckets()
+
+    def _ddp_sync(self, engine):
+        if isinstance(engine.model, NNDistributedDataParallel):
+            return bool(engine.model.device_ids)
+        return isinstance(engine.model, DistributedDataParallel)
+
+    def _build_scaler(self, engine):
+        cfg = engine.cur_stage.get('amp')
+        if cfg is None:
+            return
+
+        cfg = cfg.copy()
+        dtype = cfg.pop('dtype', 'fp16')
+        if not cfg.pop('grad_scaler', dtype == 'fp16'):
+            return
+
+        device = next(engine.model.parameters()).device.type
+        if hasattr(torch.amp, 'GradScaler'):
+            return torch.amp.GradScaler(device, **cfg)
+        else:
+            return torch.cuda.amp.GradScaler(**cfg)
+
+    def before_stage(self, engine):
+        self._scaler = self._build_scaler(engine)
+        if self._overlap and is_distributed() and not self._ddp_sync(engine):
+            self._register_grad_hooks(engine)
+
+    def after_stage(self, engine):
+        self._remove_grad_hooks()
+
     def before_train_epoch(self, engine):
-        self._last_updated_iter = 0
         engine.optimizer.zero_grad()
 
+    def before_train_iter(self, engine):
+        start = engine.iter_in_epoch // self._interval * self._interval
+        num_iters = engine.max_iters_in_epoch
+        self._step_size = min(self._interval, num_iters - start)
+        self._update = self.every_n_iters_in_epoch(
+            engine, self._interval) or self.last_iter_in_epoch(engine)
+
+        if not self._update and self._ddp_sync(engine):
+            self._no_sync = engine.model.no_sync()
+            self._no_sync.__enter__()
+
     def after_train_iter(self, engine):
+        overlap = len(self._hook_handles) > 0
+        self._sync = overlap and self._update
+
         key = engine.cur_stage.get('loss', 'loss')
-        engine.losses[key].backward()
+        loss = engine.losses[key]
+        if self._step_size > 1:
+            loss = loss / self._step_size
 
-        if (not self.every_n_iters_in_epoch(engine, self._interval)
-                and not self.last_iter_in_epoch(engine)):
+        try:
+            with _record_function('backward'):
+                if self._scaler is None:
+                    loss.backward()
+                else:
+                    self._scaler.scale(loss).backward()
+        finally:
+            if self._no_sync is not None:
+                self._no_sync.__exit__(None, None, None)
+                self._no_sync = None
+
+        if not self._update:
             return
 
-        step_size = engine.iter_in_epoch - self._last_updated_iter + 1
-        for param in engine.model.parameters():
-            if param.requires_grad and param.grad is not None:
-                param.grad.data.div_(step_size)
-        self._last_updated_iter = engine.iter_in_epoch + 1
-
-        if is_distributed():
-            self._allreduce_grads(engine.model.parameters())
-
-        cfg = engine.cur_stage.get('grad_clip')
-        if cfg is not None:
-            params_with_grad = [
-                p for p in engine.model.parameters()
-                if p.requires_grad and p.grad is not None
-            ]
-            if len(params_with_grad) > 0:
-                clip_grad.clip_grad_norm_(params_with_grad, **cfg)
-
-        engine.optimizer.step()
-        engine.optimizer.zero_grad()
+        with _record_function('allreduce'):
+            if overlap:
+                self._wait_buckets(dist.get_world_size())
+            elif is_distributed() and not self._ddp_sync(engine):
+                self._allreduce_grads(engine.model.parameters())
+
+        with _record_function('step'):
+            cfg = engine.cur_stage.get('grad_clip')
+            if cfg is not None:
+                if self._scaler is not None:
+                    self._scaler.unscale_(engine.optimizer)
+
+                params_with_grad = [
+                    p for p in engine.model.parameters()
+                    if p.requires_grad and p.grad is not None
+                ]
+                if len(params_with_grad) > 0:
+                    clip_grad.clip_grad_norm_(params_with_grad, **cfg)
+
+            if self._scaler is None:
+                engine.optimizer.step()
+            else:
+                self._scaler.step(engine.optimizer)
+                self._scaler.update()
+
+            engine.optimizer.zero_grad()
 
     def after_train_epoch(self, engine):
         engine.optimizer.zero_grad()
@@ -3,6 +3,7 @@
 from torch.nn.modules.batchnorm import _BatchNorm
 
 from nncore.nn import update_bn_stats_
+from nncore.nn.utils import _has_length
 from ..builder import HOOKS
 from .base import Hook
 
@@ -18,7 +19,7 @@ class PreciseBNHook(Hook):
             Default: ``1``.
         num_iters (int, optional): Number of iterations to compute the stats.
             This number will be overwritten by the length of training data
-            loader. Default: ``200``.
+            loader if it is shorter. Default: ``200``.
     """
 
     def __init__(self, interval=1, num_iters=200):
@@ -34,7 +35,9 @@ class PreciseBNHook(Hook):
         if any(m for m in engine.model.modules()
                if isinstance(m, _BatchNorm) and m.training):
             engine.logger.info('Computing Precise BN...')
-            num_iters = min(self._num_iters, len(engine.data_loader))
+            num_iters = self._num_iters
+            if _has_length(engine.data_loader):
+                num_iters = min(num_iters, len(engine.data_loader))
             update_bn_stats_(
                 engine.model,
                 engine.data_loader,
@@ -0,0 +1,124 @@
+# Copyright (c) Ye Liu. Licensed under the MIT License.
+
+from functools import partial
+
+import torch
+from torch.profiler import ProfilerActivity, profile, schedule
+
+import nncore
+from ..builder import HOOKS
+from ..comm import get_rank
+from .base import Hook
+
+
+@HOOKS.register()
+class ProfilerHook(Hook):
+    """
+    Profile training iterations using :obj:`torch.profiler`. The profiler
+    skips ``wait`` iterations, warms up for ``warmup`` iterations and records
+    the next ``active`` iterations, and the cycle is repeated ``repeat``
+    times. CPU activities are always recorded, and CUDA activities are also
+    recorded when available.
+
+    After each cycle, a Chrome trace (viewable in ``chrome://tracing`` or
+    Perfetto) and a table of the top operators are saved to the output
+    directory, suffixed by the rank and the last recorded iteration. The
+    phases of the engine are labelled as ``data``, ``forward``,
+    ``hooks/<name>``, ``backward``, ``allreduce`` and ``step`` in the traces.
+
+    This hook should be registered after :obj:`OptimizerHook`, so that the
+    back propagation is counted in the same iteration.
+
+    Args:
+        wait (int, optional): Number of iterations to skip in each cycle.
+            Default: ``1``.
+        warmup (int, optional): Number of iterations to warm up in each
+            cycle. Default: ``1``.
+        active (int, optional): Number of iterations to record in each
+            cycle. Default: ``3``.
+        repeat (int, optional): Number of cycles. ``0`` means repeating until
+            the end of training. Default: ``1``.
+        record_shapes (bool, optional): Whether to record the input shapes of
+            operators. If ``True``, operators in the table will also be
+            grouped by input shapes. Default: ``True``.
+        profile_memory (bool, optional): Whether to record the memory
+            allocated by operators. Default: ``True``.
+        with_stack (bool, optional): Whether to record the source locations
+            of operators. Default: ``False``.
+        sort_by (str | None, optional): The key used to sort the operators in
+            the table. If not specified, ``'self_cuda_time_total'`` will be
+            used when CUDA activities are recorded, and
+            ``'self_cpu_time_total'`` otherwise. Default: ``None``.
+        row_limit (int, optional): Number of operators in the table.
+            Default: ``20``.
+        out (str | None, optional): Path to the output directory. If not
+            specified, ``profiler`` under :obj:`engine.work_dir` will be used.
+            Default: ``None``.
+    """
+
+    def __init__(self,
+                 wait=1,
+                 warmup=1,
+                 active=3,
+                 repeat=1,
+                 record_shapes=True,
+                 profile_memory=True,
+                 with_stack=False,
+                 sort_by=None,
+                 row_limit=20,
+                 out=None):
+        super(ProfilerHook, self).__init__()
+        self._schedule = schedule(
+            wait=wait, warmup=warmup, active=active, repeat=repeat)
+        self._record_shapes = record_shapes
+        self._profile_memory = profile_memory
+        self._with_stack = with_stack
+        self._sort_by = sort_by
+        self._row_limit = row_limit
+        self._out = out
+        self._profiler = None
+
+    def _on_trace_ready(self, engine, profiler):
+        name = 'rank{}_iter{}'.format(get_rank(), engine.iter + 1)
+
+        trace_file = nncore.join(self._out, 'trace_{}.json'.format(name))
+        profiler.export_chrome_trace(trace_file)
+
+        table = profiler.key_averages(
+            group_by_input_shape=self._record_shapes).table(
+                sort_by=self._sort_by, row_limit=self._row_limit)
+
+        table_file = nncore.join(self._out, 'ops_{}.txt'.format(name))
+        with open(table_file, 'w') as f:
+            f.write(table)
+
+        engine.logger.info('Profiling results saved to {}'.format(trace_file))
+
+    def before_launch(self, engine):
+        if self._out is None:
+            self._out = nncore.join(engine.work_dir, 'profiler')
+        nncore.mkdir(self._out)
+
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+
+        if self._sort_by is None:
+            self._sort_by = 'self_{}_time_total'.format(
+                'cuda' if len(activities) > 1 else 'cpu')
+
+        self._profiler = profile(
+            activities=activities,
+            schedule=self._schedule,
+            on_trace_ready=partial(self._on_trace_ready, engine),
+            record_shapes=self._record_shapes,
+            profile_memory=self._profile_memory,
+            with_stack=self._with_stack)
+        self._profiler.start()
+
+    def after_launch(self, engine):
+        self._profiler.stop()
+        self._profiler = None
+
+    def after_train_iter(self, engine):
+        self._profiler.step()
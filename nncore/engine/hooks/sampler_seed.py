@@ -7,9 +7,16 @@ from .base import Hook
 @HOOKS.register()
 class SamplerSeedHook(Hook):
     """
-    Update sampler seeds every epoch. This hook is normally used in
-    distributed training.
+    Update sampler seeds every epoch. This hook is registered by default, as
+    both distributed samplers and shuffled samplers such as
+    :obj:`BucketBatchSampler` rely on it to reshuffle the data. Samplers,
+    batch samplers, and iterable datasets with ``set_epoch`` methods are
+    supported.
     """
 
     def before_epoch(self, engine):
-        engine.data_loader.sampler.set_epoch(engine.epoch)
+        data_loader = engine.data_loader
+        for sampler in (data_loader.sampler, data_loader.batch_sampler,
+                        data_loader.dataset):
+            if callable(getattr(sampler, 'set_epoch', None)):
+                sampler.set_epoch(engine.epoch)
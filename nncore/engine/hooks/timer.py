@@ -1,33 +1,158 @@
 # Copyright (c) Ye Liu. Licensed under the MIT License.
 
+from collections import OrderedDict
 from datetime import timedelta
+from functools import partial
+from time import perf_counter
+
+import torch
 
 import nncore
 from ..builder import HOOKS
 from ..comm import main_only
+from ..utils import _record_function
 from .base import Hook
 
+_STEPS = ('forward', 'backward', 'step')
+
+
+def _mark(cuda):
+    if not cuda:
+        return perf_counter()
+
+    event = torch.cuda.Event(enable_timing=True)
+    event.record()
+    return event
+
+
+def _elapsed(start, end):
+    if isinstance(start, float):
+        return end - start
+
+    # Return None for incomplete events rather than waiting for them
+    if not end.query():
+        return None
+
+    return start.elapsed_time(end) / 1000
+
 
 @HOOKS.register()
 class TimerHook(Hook):
     """
-    Compute and save timings into :obj:`enging.buffer` during training.
+    Compute and save timings into :obj:`enging.buffer` during training. If the
+    data loader is wrapped by :obj:`DataPrefetcher`, the data loading time
+    hidden by prefetching will also be saved as ``_hidden_data_time``.
+
+    Optionally, the time of forward, backward and optimizer step in each
+    training iteration can be saved as ``_forward_time``, ``_backward_time``
+    and ``_step_time``. They are measured by CUDA events when the model is on
+    GPU, and by :obj:`time.perf_counter` otherwise. To avoid synchronizing
+    the devices, the CUDA events are only polled at the beginning of each
+    iteration, and the timings are saved once the events have completed,
+    which may be a few iterations later. The time spent in the methods of
+    each hook can also be saved as a dict ``_hook_time``, and a summary of it
+    will be logged after launching. If the model is compiled, the time of
+    warming up in each mode (saved as ``_compile_time`` by the engine) will
+    be logged before launching, so that it is not counted in training or
+    validation.
+
+    Args:
+        step_time (bool, optional): Whether to time forward, backward and
+            optimizer step separately. Default: ``False``.
+        hook_time (bool, optional): Whether to time the methods of each hook
+            by instrumenting :obj:`Engine._call_hook`. Default: ``False``.
     """
 
-    def __init__(self):
+    def __init__(self, step_time=False, hook_time=False):
         super(TimerHook, self).__init__()
+        self._step_time = step_time
+        self._hook_time = hook_time
+
         self._total_timer = nncore.Timer()
         self._iter_timer = nncore.Timer()
         self._data_timer = nncore.Timer()
         self._train_timer = nncore.Timer()
         self._val_timer = nncore.Timer()
 
+        self._cuda = False
+        self._marks = dict()
+        self._pending = []
+        self._handles = []
+        self._step_handles = []
+        self._hook_times = OrderedDict()
+        self._hook_totals = OrderedDict()
+
     def _update_time(self, engine, keys):
         for key in keys:
             engine.buffer.update(
                 '_{}_time'.format(key),
                 getattr(self, '_{}_timer'.format(key)).seconds())
 
+    def _update_hidden_time(self, engine):
+        fetch_time = getattr(engine.data_loader, 'fetch_time', None)
+        if fetch_time is not None:
+            hidden_time = max(fetch_time - self._data_timer.seconds(), 0)
+            engine.buffer.update('_hidden_data_time', hidden_time)
+
+    def _update_step_time(self, engine):
+        for key in _STEPS:
+            if key in self._marks and len(self._marks[key]) == 2:
+                self._pending.append((key, *self._marks[key]))
+        self._marks.clear()
+
+        pending = []
+        for key, start, end in self._pending:
+            elapsed = _elapsed(start, end)
+            if elapsed is None:
+                pending.append((key, start, end))
+            else:
+                engine.buffer.update('_{}_time'.format(key), elapsed)
+        self._pending = pending
+
+    def _update_hook_time(self, engine):
+        if self._hook_time:
+            times = {k: self._hook_times.get(k, 0) for k in engine.hooks}
+            engine.buffer.update('_hook_time', times)
+            self._hook_times.clear()
+
+    def _start(self, key):
+        self._marks[key] = [_mark(self._cuda)]
+
+    def _end(self, key):
+        if key in self._marks:
+            self._marks[key].append(_mark(self._cuda))
+
+    def _before_forward(self, module, args):
+        if module.training and torch.is_grad_enabled():
+            self._start('forward')
+
+    def _after_forward(self, module, args, output):
+        if not module.training or not torch.is_grad_enabled():
+            return
+
+        self._end('forward')
+
+        values = output.values() if isinstance(output, dict) else [output]
+        for value in values:
+            if torch.is_tensor(value) and value.requires_grad:
+                value.register_hook(self._before_backward)
+
+    def _before_backward(self, grad):
+        if 'backward' not in self._marks:
+            self._start('backward')
+            torch.autograd.Variable._execution_engine.queue_callback(
+                partial(self._end, 'backward'))
+
+    def _call_hook(self, engine, name):
+        with _record_function('hooks/{}'.format(name)):
+            for hook, method in engine._hook_table[name]:
+                start = perf_counter()
+                method(engine)
+                elapsed = perf_counter() - start
+
+                for times in (self._hook_times, self._hook_totals):
+                    times[hook.name] = times.get(hook.name, 0) + elapsed
+
     @main_only
     def before_launch(self, engine):
         self._total_timer.reset()
@@ -37,6 +162,22 @@ class TimerHook(Hook):
         self._val_timer.reset()
         self._val_timer.pause()
 
+        if self._step_time:
+            param = next(engine.model.parameters(), None)
+            self._cuda = param is not None and param.device.type == 'cuda'
+            self._handles = [
+                engine.model.register_forward_pre_hook(self._before_forward),
+                engine.model.register_forward_hook(self._after_forward)
+            ]
+
+        if self._hook_time:
+            engine._call_hook = partial(self._call_hook, engine)
+
+        if '_compile_time' in engine.buffer.keys():
+            times = engine.buffer.latest('_compile_time')
+            engine.logger.info('Compilation warm-up: {}'.format(', '.join(
+                '{}: {:.3f}s'.format(k, v) for k, v in times.items())))
+
     @main_only
     def after_launch(self, engine):
         total_time = self._total_timer.seconds()
@@ -56,17 +197,54 @@ class TimerHook(Hook):
             timedelta(seconds=int(total_time)),
             timedelta(seconds=int(hook_time))))
 
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
+        self._pending = []
+
+        if self._hook_time:
+            del engine._call_hook
+
+            hooks = sorted(
+                self._hook_totals.items(), key=lambda x: x[1], reverse=True)
+            engine.logger.info('Time on hooks: {}'.format(', '.join(
+                '{}: {:.3f}s'.format(k, v) for k, v in hooks)))
+
+    @main_only
+    def before_stage(self, engine):
+        if self._step_time:
+            self._step_handles = [
+                engine.optimizer.register_step_pre_hook(
+                    lambda *args: self._start('step')),
+                engine.optimizer.register_step_post_hook(
+                    lambda *args: self._end('step'))
+            ]
+
+    @main_only
+    def after_stage(self, engine):
+        for handle in self._step_handles:
+            handle.remove()
+        self._step_handles = []
+
     @main_only
     def before_epoch(self, engine):
         for key in list(engine.buffer.keys()):
             if key in ('total', 'iter', 'data', 'train', 'val'):
                 engine.buffer.pop('_{}_time'.format(key))
 
+    @main_only
+    def after_train_epoch(self, engine):
+        self._update_step_time(engine)
+
     @main_only
     def before_train_iter(self, engine):
+        self._update_step_time(engine)
+        self._update_hook_time(engine)
+
         self._iter_timer.reset()
         self._train_timer.resume()
         self._update_time(engine, ['data'])
+        self._update_hidden_time(engine)
 
     @main_only
     def after_train_iter(self, engine):
@@ -79,6 +257,7 @@ class TimerHook(Hook):
         self._iter_timer.reset()
         self._val_timer.resume()
         self._update_time(engine, ['data'])
+        self._update_hidden_time(engine)
 
     @main_only
     def after_val_iter(self, engine):
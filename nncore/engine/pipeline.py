@@ -0,0 +1,193 @@
+# Copyright (c) Ye Liu. Licensed under the MIT License.
+
+from collections import OrderedDict
+from queue import Empty, Queue
+from threading import Event, Thread
+from time import perf_counter
+
+import torch
+
+import nncore
+from nncore.parallel.serialize import _map_items
+
+_FLUSH, _CLOSE = 'flush', 'close'
+
+
+def _collect_tensors(data, tensors):
+    if isinstance(data, dict):
+        for value in data.values():
+            _collect_tensors(value, tensors)
+    elif isinstance(data, (list, tuple)):
+        for value in data:
+            _collect_tensors(value, tensors)
+    elif torch.is_tensor(data):
+        tensors[id(data)] = data
+
+
+def _replace_tensors(data, mapping):
+    if torch.is_tensor(data):
+        return mapping[id(data)]
+    return _map_items(data, lambda d: _replace_tensors(d, mapping))
+
+
+def _detach(data):
+    if torch.is_tensor(data):
+        return data.detach()
+    return _map_items(data, _detach)
+
+
+def to_host(data):
+    """
+    Recursively move all the tensors in a collection to host memory using one
+    batched device-to-host transfer per device and data type. Scalar tensors
+    will be converted to Python numbers.
+
+    Args:
+        data (any): The tensor or collection of tensors to be converted.
+
+    Returns:
+        any: The converted data.
+    """
+    tensors = OrderedDict()
+    _collect_tensors(data, tensors)
+
+    groups = OrderedDict()
+    for key, tensor in tensors.items():
+        groups.setdefault((tensor.device, tensor.dtype), []).append(key)
+
+    mapping = dict()
+    for keys in groups.values():
+        flat = torch.cat([tensors[k].reshape(-1) for k in keys]).cpu()
+        sizes = [tensors[k].numel() for k in keys]
+        for key, chunk in zip(keys, flat.split(sizes)):
+            if tensors[key].dim() == 0 or tensors[key].numel() == 1:
+                mapping[key] = chunk.item()
+            else:
+                mapping[key] = chunk.reshape(tensors[key].shape)
+
+    return _replace_tensors(data, mapping)
+
+
+@nncore.bind_getter('max_size', 'interval', 'timeout')
+class LogPipeline(object):
+    """
+    A logging pipeline that dispatches records to their consumers in a
+    background thread. Submitting a record only enqueues references to the
+    (detached) tensors, so that the training loop is never blocked by
+    device synchronizations or serialization. Pending records are converted
+    to host values in one batched transfer when they are flushed.
+
+    Args:
+        max_size (int, optional): Maximum number of records in the queue.
+            Submitting more records will block until the queue has free slots.
+            Default: ``1000``.
+        interval (int, optional): The number of records to be accumulated
+            before flushing. Default: ``50``.
+        timeout (float, optional): The maximum number of seconds that a
+            record can be kept pending before flushing. Default: ``10``.
+    """
+
+    def __init__(self, max_size=1000, interval=50, timeout=10):
+        self._max_size = max_size
+        self._interval = interval
+        self._timeout = timeout
+        self._queue = Queue(maxsize=max_size)
+        self._thread = None
+        self._error = None
+
+    def _start(self):
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _dispatch(self, pending):
+        if len(pending) == 0:
+            return
+
+        try:
+            records = to_host([data for _, data in pending])
+            for (func, _), data in zip(pending, records):
+                func(data)
+        except Exception as e:
+            self._error = e
+        finally:
+            pending.clear()
+
+    def _run(self):
+        pending, deadline = [], None
+        while True:
+            timeout = None if deadline is None else max(
+                deadline - perf_counter(), 0)
+
+            try:
+                item = self._queue.get(timeout=timeout)
+            except Empty:
+                item = None
+
+            if item is not None and item[0] not in (_FLUSH, _CLOSE):
+                if len(pending) == 0:
+                    deadline = perf_counter() + self._timeout
+                pending.append(item)
+                if len(pending) < self._interval:
+                    continue
+            elif item is None and perf_counter() < deadline:
+                continue
+
+            self._dispatch(pending)
+            deadline = None
+
+            if item is not None and item[0] in (_FLUSH, _CLOSE):
+                item[1].set()
+                if item[0] == _CLOSE:
+                    return
+
+    def _check_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError(
+                'error in logging pipeline: {}'.format(error)) from error
+
+    def is_alive(self):
+        """
+        Check whether the background thread is running.
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, func, data):
+        """
+        Submit a record to the pipeline. The tensors in the record will be
+        detached immediately and converted to host values later in the
+        background thread.
+
+        Args:
+            func (callable): The consumer of the record. It should receive
+                the converted record as its only argument.
+            data (any): The record, normally a dict of tensors or numbers.
+        """
+        self._check_error()
+        if not self.is_alive():
+            self._start()
+        self._queue.put((func, _detach(data)))
+
+    def _wait(self, signal):
+        event = Event()
+        self._queue.put((signal, event))
+        event.wait()
+
+    def flush(self):
+        """
+        Dispatch all the pending records and wait until they are consumed.
+        """
+        if self.is_alive():
+            self._wait(_FLUSH)
+        self._check_error()
+
+    def close(self):
+        """
+        Dispatch all the pending records and stop the background thread. The
+        pipeline will be restarted automatically when new records come in.
+        """
+        if self.is_alive():
+            self._wait(_CLOSE)
+            self._thread.join()
+        self._thread = None
+        self._check_error()
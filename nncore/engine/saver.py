@@ -0,0 +1,175 @@
+# Copyright (c) Ye Liu. Licensed under the MIT License.
+
+import os
+from queue import Queue
+from threading import Thread
+
+import torch
+
+import nncore
+from nncore.parallel.serialize import _map_items
+from .utils import _build_checkpoint, _save_atomic
+
+_CLOSE = 'close'
+
+
+def _snapshot(data, buffers, prefix=()):
+    if not torch.is_tensor(data):
+        return _map_items(
+            data,
+            lambda k, v: _snapshot(v, buffers, prefix + (k, )),
+            with_keys=True)
+    elif data.layout != torch.strided:
+        return data.detach().to('cpu', copy=True)
+
+    buffer = buffers.get(prefix)
+    if buffer is None or buffer.size() != data.size(
+    ) or buffer.dtype != data.dtype:
+        buffer = torch.empty(
+            data.size(), dtype=data.dtype, pin_memory=data.is_cuda)
+        buffers[prefix] = buffer
+
+    return buffer.copy_(data.detach(), non_blocking=data.is_cuda)
+
+
+def _replace_symlink(src, dst):
+    tmp_link = '{}.tmp'.format(dst)
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(src, tmp_link)
+    os.replace(tmp_link, dst)
+
+
+@nncore.bind_getter('max_inflight')
+class CheckpointSaver(object):
+    """
+    An asynchronous checkpoint saver. Saving a checkpoint only snapshots the
+    state dicts into reusable host buffers (pinned when the tensors are on
+    CUDA devices) on the calling thread, while serialization and disk I/O are
+    performed by a background thread. Each checkpoint is written to a
+    temporary file and atomically renamed to the target path.
+
+    Args:
+        max_inflight (int, optional): Maximum number of checkpoints that can
+            be held in host memory at the same time. Saving more checkpoints
+            will block until the previous ones are written. Default: ``1``.
+    """
+
+    def __init__(self, max_inflight=1):
+        self._max_inflight = max_inflight
+        self._buffers = Queue()
+        for _ in range(max_inflight):
+            self._buffers.put(dict())
+        self._queue = Queue()
+        self._thread = None
+        self._error = None
+
+    def _start(self):
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _write(self, checkpoint, filename, symlink, callback, event):
+        if event is not None:
+            event.synchronize()
+
+        _save_atomic(checkpoint, filename)
+
+        if symlink is not None and os.name != 'nt':
+            _replace_symlink(
+                os.path.relpath(filename, nncore.dir_name(symlink)), symlink)
+
+        if callback is not None:
+            callback(filename)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _CLOSE:
+                return
+
+            *args, buffers = item
+            try:
+                self._write(*args)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._buffers.put(buffers)
+
+    def _check_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError(
+                'error in saving checkpoint: {}'.format(error)) from error
+
+    def is_alive(self):
+        """
+        Check whether the background thread is running.
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def save(self,
+             model,
+             filename,
+             optimizer=None,
+             meta=None,
+             symlink=None,
+             callback=None):
+        """
+        Save checkpoint to a file asynchronously. The arguments are the same
+        as :obj:`save_checkpoint`.
+
+        Args:
+            model (:obj:`nn.Module`): The model whose params are to be saved.
+            filename (str): Path to the checkpoint file.
+            optimizer (:obj:`optim.Optimizer` | None, optional): The
+                optimizer to be saved. Default: ``None``.
+            meta (dict | None, optional): The metadata to be saved. Default:
+                ``None``.
+            symlink (str | None, optional): Path to the symlink to be updated
+                after the checkpoint is written. Default: ``None``.
+            callback (callable | None, optional): The function to be called
+                with ``filename`` on the background thread after the
+                checkpoint is written. It will not be called if writing the
+                checkpoint fails. Default: ``None``.
+        """
+        self._check_error()
+
+        buffers = self._buffers.get()
+        try:
+            checkpoint = _build_checkpoint(
+                model, optimizer=optimizer, meta=meta)
+            checkpoint = _snapshot(checkpoint, buffers)
+        except Exception:
+            self._buffers.put(buffers)
+            raise
+
+        event = None
+        if any(b.is_pinned() for b in buffers.values()):
+            event = torch.cuda.Event()
+            event.record()
+
+        if not self.is_alive():
+            self._start()
+
+        self._queue.put(
+            (checkpoint, filename, symlink, callback, event, buffers))
+
+    def wait(self):
+        """
+        Wait until all the pending checkpoints are written.
+        """
+        buffers = [self._buffers.get() for _ in range(self._max_inflight)]
+        for item in buffers:
+            self._buffers.put(item)
+        self._check_error()
+
+    def close(self):
+        """
+        Write all the pending checkpoints and stop the background thread. The
+        saver will be restarted automatically when new checkpoints come in.
+        """
+        if self.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+        self._thread = None
+        self._check_error()
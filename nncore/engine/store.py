@@ -0,0 +1,96 @@
+# Copyright (c) Ye Liu. Licensed under the MIT License.
+
+import mmap
+import os
+import struct
+
+import torch
+
+import nncore
+from nncore.parallel import deserialize_from_tensor, serialize_to_tensor
+
+# Record sizes are padded to 16 bytes to keep the tensors aligned
+_SIZE = struct.Struct('<Q8x')
+
+
+@nncore.bind_getter('path')
+class PredictionStore(object):
+    """
+    An append-only store that spills outputs to a shard file on disk. Each
+    record is serialized by :obj:`serialize_to_tensor`, i.e. a small pickled
+    header followed by the raw data of its tensors. When loading, the shard is
+    memory-mapped and the tensors are restored as views of the mapped file,
+    so that the records are only read from disk when they are accessed.
+
+    Args:
+        path (str): Path to the shard file.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._file = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, value):
+        """
+        Append a record to the shard.
+
+        Args:
+            value (any): The record to be appended. Tensors in the record
+                will be moved to CPU.
+        """
+        if self._file is None:
+            nncore.mkdir(nncore.dir_name(self._path))
+            self._file = open(self._path, 'ab')
+
+        data_tensor, _ = serialize_to_tensor(value, 'cpu')
+        self._file.write(_SIZE.pack(data_tensor.numel()))
+        self._file.write(data_tensor.numpy())
+        self._size += 1
+
+    def close(self):
+        """
+        Flush and close the shard file.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def clear(self):
+        """
+        Remove all the records and the shard file.
+        """
+        self.close()
+        nncore.remove(self._path)
+        self._size = 0
+
+    @staticmethod
+    def load(path):
+        """
+        Load all the records from a shard file via memory-mapping.
+
+        Args:
+            path (str): Path to the shard file.
+
+        Returns:
+            list: The loaded records.
+        """
+        if not nncore.is_file(path) or os.path.getsize(path) == 0:
+            return []
+
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        records, offset = [], 0
+        while offset < len(buffer):
+            size = _SIZE.unpack_from(buffer, offset)[0]
+            offset += _SIZE.size
+            data_tensor = torch.frombuffer(
+                buffer, dtype=torch.uint8, count=size, offset=offset)
+            records.append(deserialize_from_tensor(data_tensor, size))
+            offset += size
+
+        return records
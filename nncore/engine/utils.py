@@ -1,22 +1,131 @@
 # Copyright (c) Ye Liu. Licensed under the MIT License.
 
+import json
+import mmap
 import os
 import random
+import struct
+from base64 import b64decode, b64encode
+from contextlib import nullcontext
 from datetime import datetime
 from importlib import import_module
+from io import BytesIO
 from pkgutil import walk_packages
 
 import numpy as np
 import torch
 import torchvision
 from torch.hub import load_state_dict_from_url
+from torch.profiler import record_function
 
 import nncore
 from nncore.nn import move_to_device
+from nncore.parallel.serialize import _map_items
 from .comm import broadcast, is_main_process, sync
 
 DATASETS = nncore.Registry('dataset')
 
+_FLAT_EXT = '.safetensors'
+_TENSOR_TAG = '__nncore_tensor__:'
+
+_FLAT_DTYPES = {
+    torch.float64: 'F64',
+    torch.float32: 'F32',
+    torch.float16: 'F16',
+    torch.bfloat16: 'BF16',
+    torch.int64: 'I64',
+    torch.int32: 'I32',
+    torch.int16: 'I16',
+    torch.int8: 'I8',
+    torch.uint8: 'U8',
+    torch.bool: 'BOOL'
+}
+
+
+def _flatten_tensors(data, tensors, prefix=()):
+    if not torch.is_tensor(data):
+        return _map_items(
+            data,
+            lambda k, v: _flatten_tensors(v, tensors, prefix + (k, )),
+            with_keys=True)
+    elif data.layout != torch.strided or data.dtype not in _FLAT_DTYPES:
+        return data
+
+    key = base = '.'.join(str(p) for p in prefix)
+    while key in tensors:
+        key = '{}#{}'.format(base, len(tensors))
+    tensors[key] = data.detach().cpu().contiguous()
+    return _TENSOR_TAG + key
+
+
+def _unflatten_tensors(data, tensors):
+    if isinstance(data, str) and data.startswith(_TENSOR_TAG):
+        return tensors[data[len(_TENSOR_TAG):]]
+    return _map_items(data, lambda d: _unflatten_tensors(d, tensors))
+
+
+def _dump_flat(checkpoint, filename):
+    tensors = dict()
+    remainder = _flatten_tensors(checkpoint, tensors)
+
+    # Place tensors with larger element sizes first to keep them aligned
+    keys = sorted(tensors, key=lambda k: -tensors[k].element_size())
+
+    buffer = BytesIO()
+    torch.save(remainder, buffer)
+
+    header, offset = dict(), 0
+    for key in keys:
+        nbytes = tensors[key].numel() * tensors[key].element_size()
+        header[key] = dict(
+            dtype=_FLAT_DTYPES[tensors[key].dtype],
+            shape=list(tensors[key].size()),
+            data_offsets=[offset, offset + nbytes])
+        offset += nbytes
+
+    header['__metadata__'] = dict(
+        format='pt', nncore=b64encode(buffer.getvalue()).decode())
+
+    header = json.dumps(header, separators=(',', ':')).encode()
+    header += b' ' * (-len(header) % 8)
+
+    with open(filename, 'wb') as f:
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for key in keys:
+            if tensors[key].numel() > 0:
+                f.write(tensors[key].reshape(-1).view(torch.uint8).numpy())
+
+
+def _load_flat(filename):
+    dtypes = {v: k for k, v in _FLAT_DTYPES.items()}
+
+    with open(filename, 'rb') as f:
+        size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(size))
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    metadata = header.pop('__metadata__', dict())
+
+    tensors = dict()
+    for key, info in header.items():
+        dtype = dtypes[info['dtype']]
+        start, end = info['data_offsets']
+        if start == end:
+            tensors[key] = torch.empty(info['shape'], dtype=dtype)
+            continue
+        tensors[key] = torch.frombuffer(
+            buffer,
+            dtype=dtype,
+            count=(end - start) // torch.empty(0, dtype=dtype).element_size(),
+            offset=8 + size + start).view(info['shape'])
+
+    if 'nncore' not in metadata:
+        return tensors
+
+    remainder = torch.load(BytesIO(b64decode(metadata['nncore'])))
+    return _unflatten_tensors(remainder, tensors)
+
 
 def _load_url_dist(url, **kwargs):
     if is_main_process():
@@ -39,6 +148,23 @@ def _match_keys(keys, cand):
     return False
 
 
+def _unwrap_model(model):
+    # Get the original module from data parallel and torch.compile wrappers
+    model = getattr(model, 'module', model)
+    return getattr(model, '_orig_mod', model)
+
+
+def _strip_prefix(state_dict):
+    key = next(iter(state_dict), '')
+    for prefix in ('module.', '_orig_mod.'):
+        if key.startswith(prefix):
+            return _strip_prefix({
+                k[len(prefix):]: v
+                for k, v in state_dict.items()
+            })
+    return state_dict
+
+
 def _load_state_dict(module, state_dict, strict=False, logger=None):
     unexpected_keys = []
     missing_keys = []
@@ -137,14 +263,60 @@ def set_random_seed(seed=None, benchmark=False, deterministic=False, **kwargs):
     return seed
 
 
+def _get_rng_state():
+    np_state = np.random.get_state()
+    state = dict(
+        random=random.getstate(),
+        numpy=(np_state[0], np_state[1].tolist(), *np_state[2:]),
+        torch=torch.get_rng_state())
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def _set_rng_state(state):
+    random.setstate(state['random'])
+    np_state = state['numpy']
+    np.random.set_state(
+        (np_state[0], np.array(np_state[1], dtype=np.uint32), *np_state[2:]))
+    torch.set_rng_state(state['torch'].cpu())
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all([s.cpu() for s in state['cuda']])
+
+
+def _profiling():
+    return torch.autograd._profiler_enabled()
+
+
+def _record_function(name):
+    # Entering a range is not free, so only do it when a profiler is running
+    if _profiling():
+        return record_function(name)
+    return nullcontext()
+
+
+def _record_iter(iterable, name):
+    iterator = iter(iterable)
+    while True:
+        with _record_function(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
 def get_checkpoint(file_or_url, map_location=None, **kwargs):
     """
-    Get checkpoint from a file or an URL.
+    Get checkpoint from a file or an URL. Files with ``.safetensors``
+    extension will be memory-mapped, so that the tensors are only read from
+    disk when they are accessed (e.g. copied into the model).
 
     Args:
         file_or_url (str): The filename or URL of the checkpoint.
         map_location (str | None, optional): Same as the :obj:`torch.load`
-            interface. Default: ``None``.
+            interface. This argument is ignored for memory-mapped files,
+            whose tensors are always on CPU. Default: ``None``.
 
     Returns:
         :obj:`OrderedDict` | dict: The loaded checkpoint.
@@ -161,6 +333,8 @@ def get_checkpoint(file_or_url, map_location=None, **kwargs):
         checkpoint = _load_url_dist(model_urls[file_or_url[14:]], **kwargs)
     elif file_or_url.startswith(('http://', 'https://')):
         checkpoint = _load_url_dist(file_or_url, **kwargs)
+    elif file_or_url.endswith(_FLAT_EXT):
+        checkpoint = _load_flat(file_or_url)
     else:
         checkpoint = torch.load(file_or_url, map_location=map_location)
 
@@ -175,7 +349,9 @@ def load_checkpoint(model,
                     logger=None,
                     **kwargs):
     """
-    Load checkpoint from a file or an URL.
+    Load checkpoint from a file or an URL. The prefixes of parameter keys
+    added by data parallel or :obj:`torch.compile` wrappers will be removed,
+    and the state dict is always loaded into the original module.
 
     Args:
         model (:obj:`nn.Module`): The module to load checkpoint.
@@ -204,8 +380,7 @@ def load_checkpoint(model,
     else:
         raise RuntimeError('no state dict found in the checkpoint file')
 
-    if list(state_dict.keys())[0].startswith('module.'):
-        state_dict = {k[7:]: v for k, v in state_dict.items()}
+    state_dict = _strip_prefix(state_dict)
 
     if keys is not None:
         state_dict = {
@@ -214,17 +389,53 @@ def load_checkpoint(model,
         }
 
     _load_state_dict(
-        getattr(model, 'module', model),
-        state_dict,
-        strict=strict,
-        logger=logger)
+        _unwrap_model(model), state_dict, strict=strict, logger=logger)
+
+    return checkpoint
+
+
+def _build_checkpoint(model, optimizer=None, meta=None):
+    if meta is None:
+        meta = dict()
+
+    meta.update(
+        nncore_version=nncore.__version__, create_time=nncore.get_time_str())
+
+    state_dict = _unwrap_model(model).state_dict()
+    checkpoint = dict(meta=meta, state_dict=state_dict)
+
+    if optimizer is not None:
+        checkpoint['optimizer'] = optimizer.state_dict()
 
     return checkpoint
 
 
+def _save_atomic(checkpoint, filename):
+    nncore.mkdir(nncore.dir_name(filename))
+
+    tmp_file = '{}.tmp'.format(filename)
+    try:
+        if filename.endswith(_FLAT_EXT):
+            _dump_flat(checkpoint, tmp_file)
+        else:
+            torch.save(checkpoint, tmp_file)
+        os.replace(tmp_file, filename)
+    finally:
+        if os.path.lexists(tmp_file):
+            os.remove(tmp_file)
+
+
 def save_checkpoint(model, filename, optimizer=None, meta=None):
     """
-    Save checkpoint to a file.
+    Save checkpoint to a file. The checkpoint will be written to a temporary
+    file first and then renamed, so that an interrupted saving process would
+    not corrupt the existing file.
+
+    If ``filename`` ends with ``.safetensors``, the checkpoint will be saved
+    in a flat format compatible with ``safetensors``, i.e. a JSON header
+    followed by the raw data of all the tensors. Other objects are stored in
+    the metadata of the header. Such checkpoints can be memory-mapped by
+    :obj:`get_checkpoint` and :obj:`load_checkpoint`.
 
     The checkpoint object will have 3 fields: ``meta``, ``state_dict`` and
     ``optimizer``, where ``meta`` contains the version of nncore and the time
@@ -241,21 +452,9 @@ def save_checkpoint(model, filename, optimizer=None, meta=None):
     Returns:
         dict: The saved checkpoint.
     """
-    if meta is None:
-        meta = dict()
-
-    meta.update(
-        nncore_version=nncore.__version__, create_time=nncore.get_time_str())
-
-    state_dict = getattr(model, 'module', model).state_dict()
-    checkpoint = dict(meta=meta, state_dict=state_dict)
-
-    if optimizer is not None:
-        checkpoint['optimizer'] = optimizer.state_dict()
-
+    checkpoint = _build_checkpoint(model, optimizer=optimizer, meta=meta)
     checkpoint = move_to_device(checkpoint, 'cpu')
 
-    nncore.mkdir(nncore.dir_name(filename))
-    torch.save(checkpoint, filename)
+    _save_atomic(checkpoint, filename)
 
     return checkpoint
@@ -1,5 +1,6 @@
 # Copyright (c) Ye Liu. Licensed under the MIT License.
 
+import torch
 import torch.nn as nn
 
 from nncore import Registry, build_object
@@ -15,11 +16,21 @@ LOSSES = Registry('loss', parent=MODELS)
 MODULES = Registry('module', parent=MODELS)
 
 
-def build_model(cfg, *args, bundler='sequential', dist=None, **kwargs):
+def build_model(cfg,
+                *args,
+                bundler='sequential',
+                dist=None,
+                compile=None,
+                **kwargs):
     """
     Build a general model from a dict or str. This method searches for modules
     in :obj:`MODELS` first, and then fall back to :obj:`torch.nn`.
 
+    If ``compile`` is specified, the model will be compiled by
+    :obj:`torch.compile` before being wrapped for data parallel, so that the
+    uncompiled model can be accessed via ``model._orig_mod`` (or
+    ``model.module._orig_mod`` if wrapped).
+
     Args:
         cfg (dict | str): The config or name of the model.
         bundler (str | None, optional): The type of bundler for multiple
@@ -27,6 +38,10 @@ def build_model(cfg, *args, bundler='sequential', dist=None, **kwargs):
             ``'modulelist'``. Default: ``'sequential'``.
         dist (bool | None, optional): Whether the model is distributed. If not
             specified, the model will not be wrapped. Default: ``None``.
+        compile (bool | dict | None, optional): Whether to compile the model.
+            It can also be a dict containing the arguments of
+            :obj:`torch.compile`, e.g. ``mode='max-autotune'`` and
+            ``backend='inductor'``. Default: ``None``.
 
     Returns:
         :obj:`nn.Module`: The constructed model.
@@ -45,6 +60,10 @@ def build_model(cfg, *args, bundler='sequential', dist=None, **kwargs):
     if bundler == 'modulelist':
         model = ModuleList(model)
 
+    if compile:
+        model = torch.compile(
+            model, **compile if isinstance(compile, dict) else dict())
+
     if dist:
         model = NNDistributedDataParallel(model)
     elif dist is not None:
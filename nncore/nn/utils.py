@@ -6,10 +6,19 @@ from itertools import islice
 
 import torch
 import torch.nn as nn
+from torch.utils.data import IterableDataset
 
 import nncore
 
 
+def _has_length(data_loader):
+    # Data loaders of iterable datasets have a length only if the datasets do
+    dataset = getattr(data_loader, 'dataset', None)
+    if isinstance(dataset, IterableDataset):
+        return hasattr(dataset, '__len__')
+    return hasattr(data_loader, '__len__')
+
+
 def move_to_device(data, device='cpu'):
     """
     Recursively move a tensor or a collection of tensors to the specific
@@ -125,7 +134,10 @@ def update_bn_stats_(model, data_loader, num_iters=200, **kwargs):
         num_iters (int, optional): Number of iterations to compute the stats.
             Default: ``200``.
     """
-    assert len(data_loader) >= num_iters
+    if _has_length(data_loader) and len(data_loader) < num_iters:
+        raise ValueError(
+            'data_loader has {} batches, which is less than num_iters ({})'.
+            format(len(data_loader), num_iters))
 
     bn_layers = [
         m for m in model.modules()
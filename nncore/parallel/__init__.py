@@ -3,7 +3,11 @@
 from .collate import collate
 from .container import DataContainer
 from .parallel import NNDataParallel, NNDistributedDataParallel
+from .prefetcher import DataPrefetcher
+from .serialize import align_size, deserialize_from_tensor, serialize_to_tensor
 
 __all__ = [
-    'collate', 'DataContainer', 'NNDataParallel', 'NNDistributedDataParallel'
+    'collate', 'DataContainer', 'NNDataParallel', 'NNDistributedDataParallel',
+    'DataPrefetcher', 'align_size', 'deserialize_from_tensor',
+    'serialize_to_tensor'
 ]
@@ -1,21 +1,74 @@
 # Copyright (c) Ye Liu. Licensed under the MIT License.
 
 import torch
-import torch.nn.functional as F
 from torch.utils.data.dataloader import default_collate
 
 import nncore
 from .container import DataContainer
 
 
-def collate(batch, samples_per_gpu=-1):
+def _pad_stack(samples,
+               pad_dims,
+               pad_value,
+               pin_memory=False,
+               size_divisor=None):
+    elem = samples[0].data
+    sizes = [sample.size() for sample in samples]
+
+    ndim = len(sizes[0])
+    fixed = sizes[0][:ndim - pad_dims]
+    for size in sizes:
+        assert len(size) == ndim and size[:ndim - pad_dims] == fixed
+
+    max_shape = [max(size[dim] for size in sizes) for dim in range(ndim)]
+    if size_divisor is not None:
+        max_shape = [-(-n // size_divisor) * size_divisor for n in max_shape]
+    shape = [len(samples)] + list(fixed) + max_shape[ndim - pad_dims:]
+
+    if torch.utils.data.get_worker_info() is not None:
+        # Allocate the batch in shared memory to avoid another copy when
+        # sending it back to the main process
+        numel = torch.Size(shape).numel()
+        storage = elem._typed_storage()._new_shared(numel, device=elem.device)
+        out = elem.new(storage).resize_(shape).fill_(pad_value)
+    else:
+        out = torch.full(
+            shape,
+            pad_value,
+            dtype=elem.dtype,
+            device=elem.device,
+            pin_memory=pin_memory and elem.device.type == 'cpu')
+
+    for i, sample in enumerate(samples):
+        if sample.pad_value != pad_value:
+            out[i].fill_(sample.pad_value)
+        out[i][tuple(slice(0, n) for n in sample.size())].copy_(sample.data)
+
+    return out
+
+
+def collate(batch, samples_per_gpu=-1, pin_memory=False, size_divisor=None):
     """
     A collate function for :obj:`DataLoader` with :obj:`DataContainer` support.
 
+    Variable-shaped data containers are padded by allocating the batch tensor
+    with ``pad_value`` once and copying each sample into its slice. When
+    called in worker processes, the batch is allocated in shared memory.
+
+    The padded sizes can be rounded up to multiples of ``size_divisor`` to
+    bucket the shapes of batches. This limits the number of distinct shapes
+    seen by the model, which avoids frequent recompilation of models
+    compiled by :obj:`torch.compile`.
+
     Args:
         batch (any): The batch of data to be collated.
         samples_per_gpu (int, optional): Number of samples per GPU. ``-1``
             means moving all the data to a single GPU. Default: ``-1``.
+        pin_memory (bool, optional): Whether to allocate the padded batches
+            in pinned memory. This is only valid in the main process.
+            Default: ``False``.
+        size_divisor (int | None, optional): The divisor of padded sizes.
+            Default: ``None``.
     """
     if isinstance(batch[0], DataContainer):
         stacked = []
@@ -31,25 +84,13 @@ def collate(batch, samples_per_gpu=-1):
                             for sample in batch[i:i + samples_per_gpu]
                         ]))
                 else:
-                    ndim = batch[i].dim()
-                    max_shape = [0] * batch[i].pad_dims
-                    for dim in range(1, batch[i].pad_dims + 1):
-                        max_shape[dim - 1] = batch[i].size(-dim)
-                    for sample in batch[i:i + samples_per_gpu]:
-                        for dim in range(0, ndim - batch[i].pad_dims):
-                            assert batch[i].size(dim) == sample.size(dim)
-                        for dim in range(1, batch[i].pad_dims + 1):
-                            max_shape[dim - 1] = max(max_shape[dim - 1],
-                                                     sample.size(-dim))
-                    padded = []
-                    for sample in batch[i:i + samples_per_gpu]:
-                        pad = [0] * batch[i].pad_dims * 2
-                        for dim in range(1, batch[i].pad_dims + 1):
-                            pad[2 * dim -
-                                1] = max_shape[dim - 1] - sample.size(-dim)
-                        padded.append(
-                            F.pad(sample.data, pad, value=sample.pad_value))
-                    stacked.append(default_collate(padded))
+                    stacked.append(
+                        _pad_stack(
+                            batch[i:i + samples_per_gpu],
+                            batch[i].pad_dims,
+                            batch[i].pad_value,
+                            pin_memory=pin_memory,
+                            size_divisor=size_divisor))
         else:
             for i in range(0, len(batch), samples_per_gpu):
                 stacked.append(
@@ -61,14 +102,19 @@ def collate(batch, samples_per_gpu=-1):
             pad_dims=batch[0].pad_dims,
             cpu_only=batch[0].cpu_only)
     elif isinstance(batch[0], list):
-        return collate(nncore.concat(batch), samples_per_gpu)
+        return collate(
+            nncore.concat(batch), samples_per_gpu, pin_memory, size_divisor)
     elif isinstance(batch[0], tuple):
         transposed = zip(*batch)
-        return [collate(samples, samples_per_gpu) for samples in transposed]
+        return [
+            collate(samples, samples_per_gpu, pin_memory, size_divisor)
+            for samples in transposed
+        ]
     elif isinstance(batch[0], dict):
+        transposed = {k: [d[k] for d in batch] for k in batch[0]}
         return {
-            k: collate([d[k] for d in batch], samples_per_gpu)
-            for k in batch[0]
+            k: collate(samples, samples_per_gpu, pin_memory, size_divisor)
+            for k, samples in transposed.items()
         }
     else:
         return default_collate(batch)
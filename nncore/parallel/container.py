@@ -3,6 +3,7 @@
 import torch
 
 import nncore
+from .serialize import _map_items
 
 
 @nncore.bind_getter('stack', 'pad_value', 'pad_dims', 'cpu_only')
@@ -52,6 +53,29 @@ class DataContainer(object):
     def data(self):
         return self._data
 
+    def pin_memory(self):
+        """
+        Copy the wrapped tensors into pinned memory. This method will be
+        called by :obj:`DataLoader` when ``pin_memory=True``.
+
+        Returns:
+            :obj:`DataContainer`: The data container with pinned tensors.
+        """
+        if self._cpu_only:
+            return self
+
+        def _pin(data):
+            if torch.is_tensor(data):
+                return data.pin_memory()
+            return _map_items(data, _pin)
+
+        return self.__class__(
+            _pin(self._data),
+            stack=self._stack,
+            pad_value=self._pad_value,
+            pad_dims=self._pad_dims,
+            cpu_only=self._cpu_only)
+
     @property
     def dtype(self):
         if torch.is_tensor(self._data):
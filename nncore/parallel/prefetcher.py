@@ -0,0 +1,184 @@
+# Copyright (c) Ye Liu. Licensed under the MIT License.
+
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from time import perf_counter
+
+import torch
+
+from .container import DataContainer
+from .parallel import _scatter_stream
+from .serialize import _map_items
+
+_END = 'end'
+
+
+def _pin_memory(data):
+    if torch.is_tensor(data):
+        return data.pin_memory()
+    elif isinstance(data, DataContainer):
+        return data.pin_memory()
+    return _map_items(data, _pin_memory)
+
+
+def _to_device(data, device, stream):
+    if torch.is_tensor(data):
+        return _scatter_stream(data, [device], [stream])
+    elif isinstance(data, DataContainer):
+        if data.cpu_only:
+            return data
+        return DataContainer(
+            _scatter_stream(data.data, [device], [stream]),
+            stack=data.stack,
+            pad_value=data.pad_value,
+            pad_dims=data.pad_dims)
+    return _map_items(data, lambda d: _to_device(d, device, stream))
+
+
+def _record_stream(data, stream):
+    if torch.is_tensor(data):
+        if data.is_cuda:
+            data.record_stream(stream)
+    elif isinstance(data, DataContainer):
+        _record_stream(data.data, stream)
+    elif isinstance(data, dict):
+        for value in data.values():
+            _record_stream(value, stream)
+    elif isinstance(data, (list, tuple)):
+        for value in data:
+            _record_stream(value, stream)
+
+
+class DataPrefetcher(object):
+    """
+    A wrapper for data loaders that prefetches batches in a background thread.
+    When CUDA is available, the batches will also be pinned and copied to the
+    device one batch ahead on a side stream, so that host-to-device transfers
+    overlap with computation. Tensors wrapped by :obj:`DataContainer` are
+    moved with the same scatter path used by :obj:`NNDataParallel`, while
+    ``cpu_only`` containers are kept on CPU.
+
+    Other attributes (e.g. ``dataset`` and ``sampler``) are forwarded to the
+    wrapped data loader.
+
+    Args:
+        data_loader (:obj:`DataLoader`): The data loader to be wrapped.
+        num_batches (int, optional): Maximum number of batches to be fetched
+            in advance by the background thread. Default: ``2``.
+        device (int | None, optional): Index of the CUDA device to copy the
+            batches to. If not specified, the current device will be used
+            when CUDA is available. Default: ``None``.
+        pin_memory (bool | None, optional): Whether to pin the batches. If not
+            specified, the batches will be pinned when CUDA is available and
+            the data loader does not pin memory itself. Default: ``None``.
+    """
+
+    def __init__(self,
+                 data_loader,
+                 num_batches=2,
+                 device=None,
+                 pin_memory=None):
+        use_cuda = torch.cuda.is_available()
+
+        if device is None and use_cuda:
+            device = torch.cuda.current_device()
+
+        if pin_memory is None:
+            pin_memory = use_cuda and not getattr(data_loader, 'pin_memory',
+                                                  False)
+
+        self._data_loader = data_loader
+        self._num_batches = num_batches
+        self._device = device
+        self._pin_memory = pin_memory
+        self._fetch_time = 0
+
+    def __len__(self):
+        return len(self._data_loader)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._data_loader, name)
+
+    def __iter__(self):
+        queue, stop = Queue(maxsize=self._num_batches), Event()
+        thread = Thread(target=self._produce, args=(queue, stop), daemon=True)
+        thread.start()
+
+        stream = None
+        if self._device is not None:
+            stream = torch.cuda.Stream(device=self._device)
+
+        try:
+            next_data = self._fetch(queue, stream)
+            while next_data is not _END:
+                data = next_data
+                if stream is not None:
+                    cur_stream = torch.cuda.current_stream(self._device)
+                    cur_stream.wait_stream(stream)
+                    _record_stream(data, cur_stream)
+                next_data = self._fetch(queue, stream)
+                yield data
+        finally:
+            stop.set()
+            while thread.is_alive():
+                try:
+                    queue.get_nowait()
+                except Empty:
+                    thread.join(timeout=0.1)
+
+    @property
+    def data_loader(self):
+        return self._data_loader
+
+    @property
+    def fetch_time(self):
+        """
+        The time (in seconds) spent by the background thread on loading the
+        latest batch, including the time overlapped with computation.
+        """
+        return self._fetch_time
+
+    def _put(self, queue, item, stop):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _produce(self, queue, stop):
+        try:
+            iterator = iter(self._data_loader)
+            while not stop.is_set():
+                start = perf_counter()
+                try:
+                    data = next(iterator)
+                except StopIteration:
+                    break
+                if self._pin_memory:
+                    data = _pin_memory(data)
+                if not self._put(queue, (data, perf_counter() - start), stop):
+                    return
+        except Exception as e:
+            self._put(queue, e, stop)
+            return
+        self._put(queue, _END, stop)
+
+    def _fetch(self, queue, stream):
+        item = queue.get()
+
+        if isinstance(item, Exception):
+            raise item
+        elif item is _END:
+            return item
+
+        data, self._fetch_time = item
+
+        if stream is not None:
+            with torch.cuda.stream(stream):
+                data = _to_device(data, self._device, stream)
+
+        return data
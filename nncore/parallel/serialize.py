@@ -0,0 +1,158 @@
+# Copyright (c) Ye Liu. Licensed under the MIT License.
+
+from copy import copy
+
+import numpy as np
+import torch
+
+import nncore
+
+_HEADER_SIZE = 8
+_ALIGNMENT = 16
+
+
+class _TensorRef(object):
+
+    def __init__(self, index, numpy=False):
+        self.index = index
+        self.numpy = numpy
+
+
+def _map_items(data, func, with_keys=False):
+    # Rebuild the container with converted items. Namedtuples and dict
+    # subclasses (e.g. defaultdict) are supported, while other subclasses of
+    # list or tuple are kept as they are and pickled as a whole. If with_keys
+    # is True, func is called with the key or index of each item as well.
+    if isinstance(data, dict):
+        out = copy(data)
+        for key, value in data.items():
+            out[key] = func(key, value) if with_keys else func(value)
+        return out
+    elif type(data) in (list, tuple):
+        make = type(data)
+    elif isinstance(data, tuple) and hasattr(data, '_fields'):
+        make = type(data)._make
+    else:
+        return data
+
+    if with_keys:
+        return make(func(i, d) for i, d in enumerate(data))
+    return make(func(d) for d in data)
+
+
+def _split_tensors(data, tensors):
+    if isinstance(data, (dict, list, tuple)):
+        return _map_items(data, lambda d: _split_tensors(d, tensors))
+    elif torch.is_tensor(data) and data.layout == torch.strided:
+        tensors.append(data.detach())
+        return _TensorRef(len(tensors) - 1)
+    elif isinstance(data, np.ndarray) and data.dtype.kind in 'biuf':
+        try:
+            tensor = torch.from_numpy(np.ascontiguousarray(data))
+        except TypeError:
+            return data
+        tensors.append(tensor)
+        return _TensorRef(len(tensors) - 1, numpy=True)
+    return data
+
+
+def _merge_tensors(data, tensors):
+    if isinstance(data, (dict, list, tuple)):
+        return _map_items(data, lambda d: _merge_tensors(d, tensors))
+    elif isinstance(data, _TensorRef):
+        tensor = tensors[data.index]
+        return tensor.cpu().numpy() if data.numpy else tensor
+    return data
+
+
+def align_size(size):
+    """
+    Round a size in bytes up to the alignment (16 bytes) of serialized data.
+
+    Args:
+        size (int): The size in bytes.
+
+    Returns:
+        int: The aligned size.
+    """
+    return (size + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def serialize_to_tensor(data, device='cpu'):
+    """
+    Serialize an object into a ``uint8`` tensor. The layout is a small
+    pickled header describing the structure of the object, followed by the
+    raw data of all the tensors (and numeric arrays) in it, each aligned to
+    16 bytes. Lists, tuples, namedtuples and dicts are traversed, while other
+    objects are pickled as a whole.
+
+    Args:
+        data (any): The object to be serialized.
+        device (:obj:`torch.device` | str, optional): The device of the
+            output tensor. Default: ``'cpu'``.
+
+    Returns:
+        tuple[:obj:`torch.Tensor`]: The serialized tensor and a tensor \
+            containing its size.
+    """
+    tensors = []
+    data = _split_tensors(data, tensors)
+
+    layout, offset = [], 0
+    for tensor in tensors:
+        nbytes = tensor.numel() * tensor.element_size()
+        layout.append(
+            (offset, nbytes, tensor.dtype, tensor.size(), tensor.device.type))
+        offset = align_size(offset + nbytes)
+
+    header = nncore.dumps((data, layout))
+    header_size = align_size(_HEADER_SIZE + len(header))
+
+    data_tensor = torch.empty(
+        header_size + offset, dtype=torch.uint8, device=device)
+    data_tensor[:_HEADER_SIZE].copy_(
+        torch.LongTensor([len(header)]).view(torch.uint8))
+    data_tensor[_HEADER_SIZE:_HEADER_SIZE + len(header)].copy_(
+        torch.frombuffer(bytearray(header), dtype=torch.uint8))
+
+    for tensor, (offset, nbytes, *_) in zip(tensors, layout):
+        if nbytes > 0:
+            start = header_size + offset
+            data_tensor[start:start + nbytes].copy_(
+                tensor.contiguous().view(-1).view(torch.uint8))
+
+    size_tensor = torch.LongTensor([data_tensor.numel()]).to(device)
+    return data_tensor, size_tensor
+
+
+def deserialize_from_tensor(data_tensor, size):
+    """
+    Restore an object serialized by :obj:`serialize_to_tensor`. The restored
+    tensors are views of ``data_tensor`` on the same device, unless they
+    were on other devices when being serialized.
+
+    Args:
+        data_tensor (:obj:`torch.Tensor`): The serialized tensor, which may be
+            padded at the end.
+        size (int): The size of the serialized data.
+
+    Returns:
+        any: The restored object.
+    """
+    data_tensor = data_tensor[:size]
+
+    header_size = data_tensor[:_HEADER_SIZE].cpu().view(torch.long).item()
+    header = data_tensor[_HEADER_SIZE:_HEADER_SIZE + header_size].cpu()
+    data, layout = nncore.loads(header.numpy().tobytes())
+
+    payload = data_tensor[align_size(_HEADER_SIZE + header_size):]
+    payloads = {payload.device.type: payload}
+
+    tensors = []
+    for offset, nbytes, dtype, shape, device_type in layout:
+        if device_type not in payloads:
+            payloads[device_type] = payload.to(device_type)
+        tensor = payloads[device_type][offset:offset + nbytes]
+        tensors.append(tensor.view(dtype).view(shape))
+
+    return _merge_tensors(data, tensors)
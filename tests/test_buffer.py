@@ -0,0 +1,124 @@
+# Copyright (c) Ye Liu. Licensed under the MIT License.
+
+import tempfile
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, TensorDataset
+
+from nncore.engine import Buffer, Engine
+from nncore.engine.buffer import _MAX_PENDING
+
+
+def test_buffer():
+    buffer = Buffer(max_size=4)
+
+    for i in range(10):
+        buffer.update('loss', torch.tensor(float(i)), warning=False)
+        buffer.update('acc', dict(top1=i, top5=i * 2), warning=False)
+        buffer.update('_avg_factor', i + 1)
+
+    assert buffer.count('loss') == 4
+    assert buffer.count('_avg_factor') == 10
+    assert buffer.get('loss') == [6.0, 7.0, 8.0, 9.0]
+    assert buffer.latest('loss') == 9.0
+    assert buffer.latest('acc') == dict(top1=9, top5=18)
+
+    assert buffer.mean('loss') == 7.5
+    assert buffer.mean('loss', window_size=2) == 8.5
+    assert buffer.sum('loss', window_size=3) == 24.0
+    assert buffer.median('loss') == 7.0
+    assert buffer.mean('acc') == dict(top1=7.5, top5=15.0)
+
+    avg = (7 * 6 + 8 * 7 + 9 * 8 + 10 * 9) / (7 + 8 + 9 + 10)
+    assert abs(buffer.avg('loss') - avg) < 1e-9
+    assert abs(buffer.avg('acc')['top5'] - avg * 2) < 1e-9
+
+    restored = Buffer(max_size=4)
+    restored.load_state_dict(buffer.state_dict())
+    assert restored.get('loss') == buffer.get('loss')
+    assert restored.mean('acc') == buffer.mean('acc')
+
+    buffer.update('_out', dict(pred=torch.ones(3)))
+    assert len(buffer.pop('_out')) == 1
+    assert buffer.pop('_out', None) is None
+
+    buffer.update('_out', dict(pred=torch.tensor([3])))
+    assert torch.is_tensor(buffer.pop('_out')[0]['pred'])
+
+    buffer.clear()
+    assert len(buffer.keys()) == 0
+
+
+def test_buffer_integral():
+    buffer = Buffer()
+
+    buffer.update('loss', 0)
+    buffer.update('loss', 1.5)
+    buffer.update('loss', torch.tensor(2.5))
+    assert buffer.get('loss') == [0.0, 1.5, 2.5]
+    assert isinstance(buffer.latest('loss'), float)
+
+    buffer.update('num', 1)
+    buffer.update('num', torch.tensor(2))
+    assert buffer.get('num') == [1, 2]
+    assert isinstance(buffer.latest('num'), int)
+
+    buffer.update('acc', dict(top1=0, top5=1))
+    buffer.update('acc', dict(top1=0.5, top5=2))
+    assert buffer.latest('acc') == dict(top1=0.5, top5=2)
+    assert isinstance(buffer.latest('acc')['top1'], float)
+    assert isinstance(buffer.latest('acc')['top5'], int)
+
+
+def test_buffer_on_device(monkeypatch):
+    # Treat CPU tensors as device tensors so that the values are deferred
+    monkeypatch.setattr('nncore.engine.buffer._is_on_device',
+                        lambda v: torch.is_tensor(v) or isinstance(v, dict))
+    buffer = Buffer(on_device=True)
+
+    for i in range(5):
+        buffer.update('loss', torch.tensor(i + 0.5))
+        buffer.update('acc', dict(top1=torch.tensor(i), top5=torch.tensor(i)))
+    buffer.update('_avg_factor', 1)
+
+    assert len(buffer._pending) == 2
+    assert buffer.get('loss') == [0.5, 1.5, 2.5, 3.5, 4.5]
+    assert len(buffer._pending) == 0
+
+    buffer.update('loss', torch.tensor(5.5))
+    assert buffer.latest('loss') == 5.5
+    assert buffer.mean('acc', window_size=2) == dict(top1=3.5, top5=3.5)
+    assert buffer.latest('acc') == dict(top1=4, top5=4)
+
+    for _ in range(_MAX_PENDING):
+        buffer.update('total_loss', torch.tensor(1.0))
+    assert len(buffer._pending) == 0
+    assert buffer.count('total_loss') == _MAX_PENDING
+
+
+def test_buffer_eval_outputs():
+
+    class _Model(nn.Module):
+
+        def __init__(self):
+            super(_Model, self).__init__()
+            self.fc = nn.Linear(4, 2)
+
+        def forward(self, data, **kwargs):
+            pred = self.fc(data[0]).argmax(dim=1)
+            return dict(_out=dict(pred=pred, gt=data[1]))
+
+    class _Dataset(TensorDataset):
+
+        def evaluate(self, blob, **kwargs):
+            pred = torch.cat([b['pred'] for b in blob])
+            gt = torch.cat([b['gt'] for b in blob])
+            return dict(acc=(pred == gt).float().mean().item())
+
+    # Outputs of single samples should be kept as tensors
+    dataset = _Dataset(torch.randn(4, 4), torch.randint(0, 2, (4, )))
+    with tempfile.TemporaryDirectory() as work_dir:
+        engine = Engine(
+            _Model(), DataLoader(dataset, batch_size=1), work_dir=work_dir)
+        assert 0 <= engine.launch(eval=True)['acc'] <= 1
@@ -0,0 +1,114 @@
+# Copyright (c) Ye Liu. Licensed under the MIT License.
+
+import logging
+import os
+import tempfile
+from collections import defaultdict, namedtuple
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from nncore.engine import Buffer, Engine
+from nncore.parallel import deserialize_from_tensor, serialize_to_tensor
+
+_Pair = namedtuple('_Pair', ['x', 'y'])
+
+
+def test_serialize_to_tensor():
+    data = dict(
+        a=torch.randn(3, 5).to(torch.bfloat16),
+        b=[torch.tensor(1), torch.zeros(0, 4), 'text'],
+        c=(torch.rand(7) > 0.5, 1.5),
+        d=np.arange(6, dtype=np.int16).reshape(2, 3).T)
+
+    data_tensor, size_tensor = serialize_to_tensor(data, 'cpu')
+    out = deserialize_from_tensor(data_tensor, size_tensor.item())
+
+    assert torch.equal(out['a'], data['a'])
+    assert out['b'][0].dim() == 0 and out['b'][0].item() == 1
+    assert out['b'][1].size() == (0, 4) and out['b'][2] == 'text'
+    assert torch.equal(out['c'][0], data['c'][0]) and out['c'][1] == 1.5
+    assert isinstance(out['d'], np.ndarray)
+    assert np.array_equal(out['d'], data['d'])
+
+
+def test_serialize_containers():
+    groups = defaultdict(list)
+    groups['a'].append(torch.ones(2))
+    data = dict(pair=_Pair(torch.arange(3), 'y'), groups=groups)
+
+    data_tensor, size_tensor = serialize_to_tensor(data, 'cpu')
+    out = deserialize_from_tensor(data_tensor, size_tensor.item())
+
+    assert isinstance(out['pair'], _Pair)
+    assert torch.equal(out['pair'].x, data['pair'].x)
+    assert out['pair'].y == 'y'
+
+    assert isinstance(out['groups'], defaultdict)
+    assert torch.equal(out['groups']['a'][0], groups['a'][0])
+    assert out['groups']['b'] == []
+
+
+class _Dataset(object):
+
+    def evaluate(self, blob, **kwargs):
+        return dict(idx=[b['idx'] for b in blob])
+
+
+class _IncrementalDataset(object):
+
+    def __init__(self):
+        self.chunks = []
+
+    def evaluate_incremental(self, blob):
+        self.chunks.append([b['idx'] for b in blob])
+
+    def finalize(self, **kwargs):
+        return dict(idx=[i for chunk in self.chunks for i in chunk])
+
+
+def _evaluate(rank, dataset):
+    engine = Engine.__new__(Engine)
+    engine.stages = [dict(validation=dict(chunk_size=2))]
+    engine._stage = 0
+    engine.data_loader = SimpleNamespace(dataset=dataset)
+    engine.logger = logging.getLogger()
+    engine.buffer = Buffer()
+    engine._store = None
+
+    # Rank 0 has 5 outputs and rank 1 has 3 outputs
+    for i in range(5 if rank == 0 else 3):
+        engine.buffer.update('_out', dict(idx=rank * 5 + i))
+
+    return engine.evaluate()
+
+
+def _run_gather(rank, world_size, init_file):
+    dist.init_process_group(
+        'gloo',
+        init_method='file://' + init_file,
+        rank=rank,
+        world_size=world_size)
+
+    output = _evaluate(rank, _Dataset())
+    if rank == 0:
+        assert output['idx'] == list(range(8))
+    else:
+        assert output == dict()
+
+    dataset = _IncrementalDataset()
+    output = _evaluate(rank, dataset)
+    if rank == 0:
+        assert dataset.chunks == [[0, 1], [5, 6], [2, 3], [7], [4]]
+        assert output['idx'] == [0, 1, 5, 6, 2, 3, 7, 4]
+
+    dist.destroy_process_group()
+
+
+def test_chunked_gather():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        init_file = os.path.join(tmp_dir, 'init')
+        mp.spawn(_run_gather, args=(2, init_file), nprocs=2)
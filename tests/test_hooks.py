@@ -0,0 +1,204 @@
+# Copyright (c) Ye Liu. Licensed under the MIT License.
+
+import subprocess
+import sys
+import tempfile
+from contextlib import nullcontext
+
+import pytest
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, TensorDataset
+
+import nncore
+from nncore.engine import (ClosureHook, Engine, Hook, MemoryMonitorHook,
+                           WandbWriter)
+from nncore.engine.hooks.base import HOOK_NAMES
+
+
+class _Model(nn.Module):
+
+    def __init__(self):
+        super(_Model, self).__init__()
+        self.fc = nn.Linear(4, 2)
+
+    def forward(self, data, **kwargs):
+        out = self.fc(data[0])
+        return dict(
+            _avg_factor=out.size(0),
+            loss=out.pow(2).mean(),
+            _out=dict(pred=out.argmax(dim=1), gt=data[1]))
+
+
+class _Dataset(TensorDataset):
+
+    def evaluate(self, blob, **kwargs):
+        pred = torch.cat([b['pred'] for b in blob])
+        gt = torch.cat([b['gt'] for b in blob])
+        return dict(acc=(pred == gt).float().mean().item())
+
+
+class _Hook(Hook):
+
+    def __init__(self, name, calls):
+        super(_Hook, self).__init__(name=name)
+        self._calls = calls
+
+    def before_epoch(self, engine):
+        self._calls.append(self.name)
+
+
+def test_hook_table():
+    calls = []
+
+    engine = Engine.__new__(Engine)
+    engine.register_hook([
+        _Hook('a', calls),
+        Hook('b'),
+        ClosureHook('after_val_iter', lambda engine: calls.append('c'))
+    ])
+
+    engine._call_hook('before_train_epoch')
+    engine._call_hook('before_val_epoch')
+    engine._call_hook('after_train_epoch')
+    engine._call_hook('after_val_iter')
+    assert calls == ['a', 'a', 'c']
+
+    assert all(
+        len(engine._hook_table[n]) == 0
+        for n in ('before_launch', 'before_train_iter', 'after_train_iter'))
+
+    engine.unregister_hook('a')
+    assert len(engine._hook_table['before_train_epoch']) == 0
+
+
+def test_hook_overhead(monkeypatch):
+    calls, ranges = [], []
+    monkeypatch.setattr('nncore.engine.engine._record_function',
+                        lambda name: ranges.append(name) or nullcontext())
+
+    engine = Engine.__new__(Engine)
+    engine.register_hook([Hook(str(i)) for i in range(20)])
+    engine.register_hook(
+        ClosureHook('after_train_iter', lambda engine: calls.append(None)))
+
+    # Count the calls of the no-op methods that are skipped by the table
+    for hook in list(engine.hooks.values())[:20]:
+        for name in HOOK_NAMES:
+            setattr(hook, name, lambda engine: calls.append(None))
+
+    num_iters = 100
+    for _ in range(num_iters):
+        for name in ('before_iter', 'before_train_iter', 'after_train_iter',
+                     'after_iter'):
+            engine._call_hook(name)
+
+    assert len(calls) == num_iters and len(ranges) == 0
+
+    with torch.profiler.profile():
+        engine._call_hook('after_train_iter')
+    assert len(calls) == num_iters + 1
+    assert ranges == ['hooks/after_train_iter']
+
+
+def test_warmup_workers():
+    dataset = _Dataset(torch.randn(16, 4), torch.randint(0, 2, (16, )))
+    loaders = {
+        k: DataLoader(dataset, num_workers=1, persistent_workers=True)
+        for k in ('train', 'val', 'test')
+    }
+    stages = dict(epochs=1, optimizer=dict(type='SGD', lr=0.1))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        engine = Engine(_Model(), loaders, stages=stages, work_dir=work_dir)
+        engine._warmup_workers()
+        assert [d._iterator is not None
+                for d in loaders.values()] == [True, False, False]
+        assert engine._scheduled_modes() == ['train']
+
+        engine.stages[0]['validation'] = dict(interval=1)
+        assert engine._scheduled_modes() == ['train', 'val']
+
+        engine.register_hook(dict(type='EvalHook', run_test=True))
+        assert engine._scheduled_modes() == ['train', 'val', 'test']
+
+
+def test_memory_leak():
+
+    class _Logger(list):
+
+        def warning(self, msg):
+            self.append(msg)
+
+    engine = Engine.__new__(Engine)
+    engine.logger = _Logger()
+
+    hook = MemoryMonitorHook(leak_epochs=3, leak_thr=64)
+    for rss in (100, 200, 300):
+        hook._check_leak(engine, dict(rss=rss, tensors=10))
+    assert len(engine.logger) == 0
+
+    hook._check_leak(engine, dict(rss=400, tensors=20))
+    assert len(engine.logger) == 1
+
+    hook._check_leak(engine, dict(rss=390, tensors=20))
+    hook._check_leak(engine, dict(rss=420, tensors=20))
+    assert len(engine.logger) == 1
+
+
+def _eval_with_writers(writers):
+    dataset = _Dataset(torch.randn(16, 4), torch.randint(0, 2, (16, )))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        engine = Engine(
+            _Model(),
+            DataLoader(dataset, batch_size=4),
+            hooks=[dict(type='EventWriterHook', writers=writers)],
+            work_dir=work_dir)
+        output = engine.launch(eval=True)
+
+        metrics = nncore.load(nncore.join(work_dir, 'metrics.json'))
+        assert metrics['mode'] == 'test' and metrics['acc'] == output['acc']
+        assert 'acc' not in engine.buffer.keys()
+
+
+def test_eval_writers():
+    _eval_with_writers(['CommandLineWriter', 'JSONWriter'])
+
+
+def test_profiler():
+    dataset = _Dataset(torch.randn(16, 4), torch.randint(0, 2, (16, )))
+    stages = dict(epochs=1, optimizer=dict(type='SGD', lr=0.1))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        engine = Engine(
+            _Model(),
+            DataLoader(dataset, batch_size=4),
+            stages=stages,
+            hooks=[dict(type='ProfilerHook', wait=0, warmup=1, active=2)],
+            work_dir=work_dir)
+        engine.launch()
+
+        out = nncore.join(work_dir, 'profiler')
+        assert sorted(nncore.ls(out)) == [
+            'ops_rank0_iter3.txt', 'trace_rank0_iter3.json'
+        ]
+
+        trace = nncore.load(nncore.join(out, 'trace_rank0_iter3.json'))
+        names = set(e.get('name') for e in trace['traceEvents'])
+        assert {'data', 'forward', 'backward', 'step'} <= names
+
+
+def test_wandb_writer():
+    pytest.importorskip('wandb')
+    _eval_with_writers(
+        ['JSONWriter', dict(type='WandbWriter', mode='disabled')])
+
+
+def test_wandb_missing(monkeypatch):
+    code = "import sys; sys.modules['wandb'] = None; import nncore.engine"
+    assert subprocess.run([sys.executable, '-c', code]).returncode == 0
+
+    monkeypatch.setitem(sys.modules, 'wandb', None)
+    with pytest.raises(ImportError):
+        WandbWriter().open(None)
@@ -0,0 +1,181 @@
+# Copyright (c) Ye Liu. Licensed under the MIT License.
+
+import os
+import tempfile
+from copy import deepcopy
+from types import SimpleNamespace
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.nn as nn
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader, TensorDataset
+
+from nncore.engine import Engine, OptimizerHook
+
+
+class _Model(nn.Module):
+
+    def __init__(self, overflow=False):
+        super(_Model, self).__init__()
+        self.fc = nn.Linear(4, 2)
+        self.overflow = overflow
+        self.dtypes = []
+
+    def forward(self, data, **kwargs):
+        out = self.fc(data[0])
+        self.dtypes.append(out.dtype)
+
+        loss = out.float().pow(2).mean()
+        if self.overflow:
+            loss = loss * float('inf')
+
+        return dict(_avg_factor=out.size(0), loss=loss)
+
+
+def _launch(model, **kwargs):
+    torch.manual_seed(0)
+    dataset = TensorDataset(torch.randn(8, 4), torch.zeros(8))
+    stages = dict(epochs=1, optimizer=dict(type='SGD', lr=0.1), **kwargs)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        engine = Engine(
+            model,
+            DataLoader(dataset, batch_size=4),
+            stages=stages,
+            work_dir=work_dir)
+        engine.launch()
+
+    return engine
+
+
+def _spawn(func, world_size=2):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        init_file = os.path.join(tmp_dir, 'init')
+        mp.spawn(func, args=(world_size, init_file), nprocs=world_size)
+
+
+def _init_dist(rank, world_size, init_file):
+    dist.init_process_group(
+        'gloo',
+        init_method='file://' + init_file,
+        rank=rank,
+        world_size=world_size)
+
+    # Two weights of 512KB in fp32 so that 1MB buckets split the parameters
+    torch.manual_seed(0)
+    model = nn.Sequential(nn.Linear(256, 512), nn.ReLU(), nn.Linear(512, 256))
+
+    torch.manual_seed(rank + 1)
+    batches = [torch.randn(4, 256) for _ in range(2)]
+
+    return model, batches
+
+
+def _train(model, hook, batches):
+    engine = SimpleNamespace(
+        model=model,
+        cur_stage=dict(),
+        optimizer=torch.optim.SGD(model.parameters(), lr=1),
+        iter_in_epoch=0,
+        max_iters_in_epoch=len(batches))
+
+    hook.before_stage(engine)
+    hook.before_train_epoch(engine)
+
+    for i, data in enumerate(batches):
+        engine.iter_in_epoch = i
+        hook.before_train_iter(engine)
+        engine.losses = dict(loss=model(data).pow(2).mean())
+        hook.after_train_iter(engine)
+
+    hook.after_stage(engine)
+
+
+def _train_ddp(model, batches):
+    # Gradients are synchronized on every backward pass
+    model = DistributedDataParallel(model)
+    optimizer = torch.optim.SGD(model.parameters(), lr=1)
+
+    for data in batches:
+        (model(data).pow(2).mean() / len(batches)).backward()
+
+    optimizer.step()
+
+
+def _assert_equal(model, expected):
+    for param, ref in zip(model.parameters(), expected.parameters()):
+        assert torch.allclose(param, ref, atol=1e-6)
+
+
+def _run_overlap(rank, world_size, init_file):
+    model, batches = _init_dist(rank, world_size, init_file)
+
+    for num_batches in (1, 2):
+        expected = deepcopy(model)
+        _train_ddp(expected, batches[:num_batches])
+
+        hook = OptimizerHook(
+            interval=num_batches, bucket_size_mb=1, overlap=True)
+        overlapped = deepcopy(model)
+        _train(overlapped, hook, batches[:num_batches])
+
+        assert len(hook._buckets) == 2 and len(hook._hook_handles) == 0
+        _assert_equal(overlapped, expected)
+
+    dist.destroy_process_group()
+
+
+class _DDP(DistributedDataParallel):
+
+    def no_sync(self):
+        self.num_no_sync = getattr(self, 'num_no_sync', 0) + 1
+        return super(_DDP, self).no_sync()
+
+
+def _run_no_sync(rank, world_size, init_file):
+    model, batches = _init_dist(rank, world_size, init_file)
+
+    expected = deepcopy(model)
+    _train_ddp(expected, batches)
+
+    accumulated = _DDP(deepcopy(model))
+    _train(accumulated, OptimizerHook(interval=2), batches)
+
+    assert accumulated.num_no_sync == 1
+    _assert_equal(accumulated.module, expected)
+
+    dist.destroy_process_group()
+
+
+def test_amp():
+    dtypes = dict(bf16=torch.bfloat16, fp16=torch.float16)
+    for dtype, amp_dtype in dtypes.items():
+        model = _Model()
+        weight = model.fc.weight.detach().clone()
+        engine = _launch(model, amp=dict(dtype=dtype))
+
+        assert model.dtypes == [amp_dtype] * 2
+        assert model.fc.weight.dtype == torch.float32
+        assert not torch.equal(model.fc.weight, weight)
+
+        scaler = engine.hooks['OptimizerHook']._scaler
+        assert (scaler is not None) == (dtype == 'fp16')
+
+
+def test_amp_overflow():
+    model = _Model(overflow=True)
+    weight = model.fc.weight.detach().clone()
+    engine = _launch(model, amp=dict(dtype='fp16', init_scale=4.0))
+
+    assert torch.equal(model.fc.weight, weight)
+    assert engine.hooks['OptimizerHook']._scaler.get_scale() == 1.0
+
+
+def test_overlap():
+    _spawn(_run_overlap)
+
+
+def test_no_sync():
+    _spawn(_run_no_sync)
@@ -0,0 +1,241 @@
+# Copyright (c) Ye Liu. Licensed under the MIT License.
+
+import os
+import tempfile
+
+import numpy as np
+import pytest
+import torch
+from torch.utils.data import DataLoader, IterableDataset
+
+import nncore
+from nncore.dataset import (DATASETS, BucketBatchSampler, CacheDataset,
+                            Dataset, ShardDataset, ShardWriter,
+                            StreamingShardDataset)
+from nncore.engine import build_dataloader, skip_batches
+from nncore.parallel import DataContainer, DataPrefetcher, collate
+
+
+@DATASETS.register()
+class _LengthDataset(Dataset):
+
+    def __len__(self):
+        return 50
+
+    def __init__(self):
+        self.calls = 0
+
+    def __getitem__(self, idx):
+        self.calls += 1
+        return dict(idx=idx, data=np.ones(idx % 7 + 1) * idx)
+
+    def get_length(self, idx):
+        return idx % 7 + 1
+
+
+def test_collate():
+    batch = [
+        DataContainer(torch.ones(2, i + 1) * i, pad_value=-1, pad_dims=1)
+        for i in range(3)
+    ]
+    out = collate(batch).data[0]
+
+    assert out.size() == (3, 2, 3)
+    assert out[1].tolist() == [[1, 1, -1], [1, 1, -1]]
+    assert len(collate(batch, samples_per_gpu=2).data) == 2
+
+    out = collate(batch, size_divisor=4).data[0]
+    assert out.size() == (3, 2, 4)
+    assert out[2].tolist() == [[2, 2, 2, -1], [2, 2, 2, -1]]
+
+    with pytest.raises(AssertionError):
+        collate(
+            [DataContainer(torch.ones(2, 2)),
+             DataContainer(torch.ones(3))])
+
+
+def test_data_prefetcher():
+    data = [dict(x=DataContainer(torch.ones(2) * i)) for i in range(10)]
+    loader = DataLoader(data, batch_size=4, collate_fn=collate)
+    prefetcher = DataPrefetcher(loader, num_batches=1)
+
+    assert len(prefetcher) == 3
+    assert prefetcher.dataset is data
+
+    batches = list(prefetcher)
+    assert len(batches) == 3
+    assert batches[-1]['x'].data[0].size() == (2, 2)
+    assert prefetcher.fetch_time >= 0
+
+    for i, _ in enumerate(prefetcher):
+        if i == 1:
+            break
+
+    class _Dataset(object):
+
+        def __len__(self):
+            return 2
+
+        def __getitem__(self, idx):
+            raise ValueError
+
+    with pytest.raises(ValueError):
+        list(DataPrefetcher(DataLoader(_Dataset())))
+
+
+def test_skip_batches():
+    loader = DataLoader(list(range(10)), batch_size=3)
+    skipped = skip_batches(loader, 2)
+
+    assert len(skipped) == 2
+    assert [b.tolist() for b in skipped] == [[6, 7, 8], [9]]
+    assert len(list(skip_batches(DataPrefetcher(loader), 3))) == 1
+
+    class _Stream(IterableDataset):
+
+        def __iter__(self):
+            return iter(range(10))
+
+    skipped = skip_batches(DataLoader(_Stream(), batch_size=3), 2)
+    assert skipped.batch_size == 3
+    assert [b.tolist() for b in skipped] == [[6, 7, 8], [9]]
+
+
+def test_bucket_batch_sampler():
+    dataset = _LengthDataset()
+    sampler = BucketBatchSampler(dataset, max_tokens=12, seed=1)
+    batches = list(sampler)
+
+    assert len(batches) == len(sampler)
+    assert sorted(nncore.concat(batches)) == list(range(50))
+    assert all(
+        len(b) * max(dataset.get_length(i) for i in b) <= 12 for b in batches)
+
+    sampler.set_epoch(1)
+    assert list(sampler) != batches
+
+    shards = [
+        list(
+            BucketBatchSampler(
+                dataset, batch_size=4, num_replicas=3, rank=r, seed=1))
+        for r in range(3)
+    ]
+    assert len(set(len(b) for b in shards)) == 1
+    assert len(set(nncore.concat(nncore.concat(shards)))) == 50
+
+    loader = build_dataloader(
+        dict(
+            type='_LengthDataset',
+            loader=dict(batch_size=4, bucket=dict(pool_size=8))))
+    assert isinstance(loader.batch_sampler, BucketBatchSampler)
+    assert len(skip_batches(loader, 2)) == len(loader) - 2
+
+
+def test_build_dataloader():
+    loader = build_dataloader(
+        dict(
+            type='_LengthDataset',
+            loader=dict(num_workers=1, profile=dict(max_workers=4))))
+
+    assert loader.persistent_workers and loader.prefetch_factor == 4
+    assert loader.pin_memory == torch.cuda.is_available()
+
+    loader = build_dataloader(
+        dict(
+            type='_LengthDataset',
+            loader=dict(num_workers=1, persistent_workers=False,
+                        profile=True)))
+    assert not loader.persistent_workers
+
+
+def test_cache_dataset():
+    dataset = _LengthDataset()
+    cached = CacheDataset(dataset, max_bytes=4096)
+
+    assert len(cached) == 50 and cached.get_length(3) == 4
+
+    loader = DataLoader(cached, batch_size=10, num_workers=1, collate_fn=list)
+    assert [s['idx'] for s in next(iter(loader))] == list(range(10))
+    assert dataset.calls == 0
+
+    sample = cached[5]
+    sample['data'] += 1
+    assert dataset.calls == 0 and cached[5]['data'].tolist() == [5] * 6
+
+    cached[49]
+    assert dataset.calls == 1 and cached._used[0] <= 4096
+
+    path = cached._path
+    del loader, cached
+    assert not os.path.exists(path)
+
+    # A slot reserved by another worker is a miss and is not cached again
+    cached = CacheDataset(dataset, max_bytes=4096)
+    cached._open()
+    cached._table[0] = (0, -1)
+    assert cached[0]['idx'] == 0 and dataset.calls == 2
+    assert cached._used[0] == 0 and cached._table[0, 1] == -1
+
+
+def test_shard_dataset():
+    dataset = _LengthDataset()
+
+    with tempfile.TemporaryDirectory() as path:
+        with ShardWriter(path, max_bytes=1024) as writer:
+            for i in range(30):
+                writer.write(dataset[i])
+
+        with ShardWriter(path, max_bytes=1024) as writer:
+            for i in range(30, 50):
+                writer.write(dataset[i])
+
+        shards = ShardDataset(path)
+        assert shards.num_shards == writer.num_shards > 2
+        assert len(shards) == 50 and shards[-1]['idx'] == 49
+        assert np.array_equal(shards[20]['data'], dataset[20]['data'])
+
+        with pytest.raises(IndexError):
+            shards[50]
+
+        streams = [
+            StreamingShardDataset(path, shuffle=True, num_replicas=2, rank=r)
+            for r in range(2)
+        ]
+        idx = [[s['idx'] for s in stream] for stream in streams]
+        assert len(idx[0]) == len(idx[1]) == 25
+        assert sorted(idx[0] + idx[1]) == list(range(50))
+
+        streams[0].set_epoch(1)
+        assert [s['idx'] for s in streams[0]] != idx[0]
+
+        with pytest.raises(TypeError):
+            len(streams[0])
+
+        loader = DataLoader(
+            StreamingShardDataset(path), num_workers=1, collate_fn=list)
+        assert [s[0]['idx'] for s in loader] == list(range(50))
+
+        batches = []
+        for r in range(3):
+            stream = StreamingShardDataset(
+                path, shuffle=True, num_replicas=3, rank=r)
+            loader = DataLoader(
+                stream, batch_size=4, num_workers=2, collate_fn=list)
+            batches.append([[s['idx'] for s in b] for b in loader])
+
+        assert len(set(len(b) for b in batches)) == 1
+        idx = [i for b in batches for batch in b for i in batch]
+        assert len(idx) == 51 and set(idx) == set(range(50))
+
+        stream = StreamingShardDataset(path, shuffle=True)
+        loader = DataLoader(
+            stream, num_workers=1, persistent_workers=True, collate_fn=list)
+        epochs = []
+        for epoch in range(2):
+            stream.set_epoch(epoch)
+            epochs.append([s[0]['idx'] for s in loader])
+
+        expected = StreamingShardDataset(path, shuffle=True)
+        expected.set_epoch(1)
+        assert epochs[1] != epochs[0]
+        assert epochs[1] == [s['idx'] for s in expected]
@@ -0,0 +1,51 @@
+# Copyright (c) Ye Liu. Licensed under the MIT License.
+
+from collections import namedtuple
+
+import pytest
+import torch
+
+from nncore.engine import LogPipeline
+from nncore.engine.pipeline import _detach, to_host
+
+_Pair = namedtuple('_Pair', ['x', 'y'])
+
+
+def test_to_host():
+    b = [torch.ones(2, 2), torch.tensor([3])]
+    data = dict(a=torch.tensor(1.5), b=b, c='text')
+    out = to_host(data)
+    assert out['a'] == 1.5 and isinstance(out['a'], float)
+    assert torch.equal(out['b'][0], torch.ones(2, 2))
+    assert out['b'][1] == 3 and out['c'] == 'text'
+
+    out = to_host(dict(p=_Pair(torch.ones(3), torch.tensor(2))))
+    assert isinstance(out['p'], _Pair) and out['p'].y == 2
+    assert torch.equal(out['p'].x, torch.ones(3))
+
+    x = torch.ones(2, requires_grad=True) * 2
+    out = _detach([_Pair(x, 'text')])
+    assert isinstance(out[0], _Pair) and not out[0].x.requires_grad
+
+
+def test_log_pipeline():
+    records = []
+    pipeline = LogPipeline(max_size=4, interval=3, timeout=60)
+
+    loss = torch.tensor(2.0, requires_grad=True) * 2
+    for i in range(5):
+        pipeline.submit(records.append, dict(step=i, loss=loss))
+
+    pipeline.flush()
+    assert [r['step'] for r in records] == list(range(5))
+    assert all(r['loss'] == 4.0 for r in records)
+
+    pipeline.close()
+    assert not pipeline.is_alive()
+
+    def _fail(data):
+        raise ValueError
+
+    pipeline.submit(_fail, dict())
+    with pytest.raises(RuntimeError):
+        pipeline.close()
@@ -0,0 +1,105 @@
+# Copyright (c) Ye Liu. Licensed under the MIT License.
+
+import os
+import tempfile
+from collections import namedtuple
+
+import torch
+
+from nncore.engine import (CheckpointSaver, PredictionStore, load_checkpoint,
+                           save_checkpoint)
+from nncore.engine.saver import _snapshot
+from nncore.engine.utils import _flatten_tensors, _unflatten_tensors
+
+_State = namedtuple('_State', ['step', 'name'])
+
+
+def test_checkpoint_saver():
+    model = torch.nn.Linear(4, 2)
+    optimizer = torch.optim.Adam(model.parameters())
+    model(torch.ones(1, 4)).sum().backward()
+    optimizer.step()
+
+    saver, written = CheckpointSaver(max_inflight=2), []
+    with tempfile.TemporaryDirectory() as work_dir:
+        symlink = os.path.join(work_dir, 'latest.pth')
+        for i in range(3):
+            filename = os.path.join(work_dir, 'epoch_{}.pth'.format(i + 1))
+            saver.save(
+                model,
+                filename,
+                optimizer=optimizer,
+                meta=dict(epoch=i + 1),
+                symlink=symlink,
+                callback=written.append)
+            weight = model.weight.detach().clone()
+            model.weight.data.add_(1)
+
+        saver.close()
+        assert not saver.is_alive()
+        assert written == [
+            os.path.join(work_dir, 'epoch_{}.pth'.format(i + 1))
+            for i in range(3)
+        ]
+        assert os.readlink(symlink) == 'epoch_3.pth'
+        assert not any(f.endswith('.tmp') for f in os.listdir(work_dir))
+
+        checkpoint = load_checkpoint(model, symlink)
+        assert checkpoint['meta']['epoch'] == 3
+        assert 'state' in checkpoint['optimizer']
+        assert torch.equal(model.weight, weight)
+
+    state = _State(torch.ones(2), 'a')
+    out = _snapshot(dict(state=state), dict())
+    state.step.add_(1)
+    assert isinstance(out['state'], _State) and out['state'].name == 'a'
+    assert out['state'].step.tolist() == [1, 1]
+
+
+def test_flat_checkpoint():
+    model = torch.nn.Linear(4, 2).to(torch.bfloat16)
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1, momentum=0.9)
+    model(torch.ones(1, 4, dtype=torch.bfloat16)).sum().backward()
+    optimizer.step()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        filename = os.path.join(work_dir, 'epoch_1.safetensors')
+        save_checkpoint(
+            model, filename, optimizer=optimizer, meta=dict(epoch=1))
+
+        restored = torch.nn.Linear(4, 2).to(torch.bfloat16)
+        checkpoint = load_checkpoint(restored, filename, keys=['weight'])
+        assert torch.equal(restored.weight, model.weight)
+        assert not torch.equal(restored.bias, model.bias)
+        assert checkpoint['meta']['epoch'] == 1
+        assert checkpoint['optimizer']['param_groups'][0]['lr'] == 0.1
+        del checkpoint
+
+    tensors = dict()
+    data = [_State(torch.ones(2), 'a')]
+    flat = _flatten_tensors(data, tensors)
+    assert isinstance(flat[0], _State) and list(tensors) == ['0.0']
+
+    out = _unflatten_tensors(flat, tensors)
+    assert isinstance(out[0], _State) and out[0].name == 'a'
+    assert torch.equal(out[0].step, data[0].step)
+
+
+def test_prediction_store():
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, 'outputs', 'rank_0.bin')
+        store = PredictionStore(path)
+
+        assert PredictionStore.load(path) == []
+
+        for i in range(3):
+            store.append(dict(idx=i, pred=torch.arange(i + 1.0)))
+        store.close()
+
+        assert len(store) == 3
+        records = PredictionStore.load(path)
+        assert [r['idx'] for r in records] == [0, 1, 2]
+        assert torch.equal(records[2]['pred'], torch.arange(3.0))
+
+        store.clear()
+        assert len(store) == 0 and not os.path.exists(path)